@@ -0,0 +1,171 @@
+import logging
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, ValidationError
+from pydantic.fields import ModelField, SHAPE_SINGLETON
+
+from csr.entity_records import EntityRecord, create_records
+from csr.exceptions import DataException
+from csr.schema import get_id_field_name, get_categorical_fields
+
+logger = logging.getLogger(__name__)
+
+
+def factorize(column: List[Any]) -> Tuple[np.ndarray, List[Any]]:
+    """Encode the values of a column as codes of the distinct values. Only None is missing, with code -1.
+    Values are distinct if their types differ, e.g., 1, 1.0 and True, as they may validate differently.
+    NaN values and unhashable values are distinct from all other values.
+    :return: the codes of the values and the distinct values
+    """
+    if all(type(value) is str or value is None for value in column):
+        # Fast path for values read from files
+        codes, uniques = pd.factorize(np.asarray(column, dtype=object))
+        return codes, list(uniques)
+    codes = np.empty(len(column), dtype=np.intp)
+    uniques: List[Any] = []
+    keys: Dict[Tuple[type, Any], int] = {}
+    for row, value in enumerate(column):
+        if value is None:
+            codes[row] = -1
+            continue
+        try:
+            code = keys.setdefault((type(value), value), len(uniques))
+        except TypeError:
+            code = len(uniques)
+        if code == len(uniques):
+            uniques.append(value)
+        codes[row] = code
+    return codes, uniques
+
+
+class ColumnarValidator:
+    """
+    Validates entity data column by column, based on the pydantic field definitions of the entity type.
+
+    Columns with scalar values are factorized, such that every distinct value is validated
+    and converted only once, and equal values in a column share the same object.
+    Values of categorical fields are interned as well, to share them between entity types.
+    Fields that have custom validators (which depend on the other values in the row)
+    and list fields are validated per row.
+    All invalid rows are collected and reported together.
+    The entities are materialized without validating them again, as compact records
+    (see csr.entity_records) or as pydantic entities.
+    """
+
+    def __init__(self, entity_type: Type[BaseModel], compact: bool = True):
+        self.entity_type = entity_type
+        self.compact = compact
+        self.entity_name = entity_type.schema()['title']
+        self.id_field = get_id_field_name(entity_type)
+        self.categorical_fields = get_categorical_fields(entity_type)
+        self.row_errors: Dict[int, List[str]] = defaultdict(list)
+
+    def validate_value(self, field: ModelField, value: Any, values: Dict[str, Any]) -> Tuple[Any, Optional[List[str]]]:
+        try:
+            value, errors = field.validate(value, values, loc=field.name, cls=self.entity_type)
+        except Exception as e:
+            # Custom validators may raise exceptions that pydantic does not catch
+            return None, [f'{field.name}: {e}']
+        if errors:
+            return None, [f'{".".join(str(loc) for loc in error["loc"])}: {error["msg"]}'
+                          for error in ValidationError([errors], self.entity_type).errors()]
+        return value, None
+
+    def validate_column(self,
+                        field: ModelField,
+                        column: List[Any],
+                        missing: np.ndarray) -> Tuple[List[Any], np.ndarray]:
+        """Validate the distinct values of a column and map the results back to the rows
+        :return: the converted column values and a mask of the valid rows
+        """
+        codes, uniques = factorize(column)
+        # Missing values have code -1 and are validated as the last unique value
+        results = [self.validate_value(field, value, {}) for value in uniques]
+        results.append(self.validate_value(field, None, {}))
+        converted = np.empty(len(results), dtype=object)
+        if field.name in self.categorical_fields:
+            converted[:] = [sys.intern(value) if isinstance(value, str) else value for value, _ in results]
+        else:
+            converted[:] = [value for value, _ in results]
+        invalid = np.array([errors is not None for _, errors in results])[codes] & ~missing
+        for row in np.flatnonzero(invalid):
+            self.row_errors[row].extend(results[codes[row]][1])
+        return converted[codes].tolist(), ~invalid
+
+    def validate_rows(self,
+                      field: ModelField,
+                      column: List[Any],
+                      missing: np.ndarray,
+                      columns: Dict[str, List[Any]],
+                      valid: Dict[str, np.ndarray]) -> Tuple[List[Any], np.ndarray]:
+        """Validate a column value by value, passing the previously validated values of the row
+        to the custom validators
+        :return: the converted column values and a mask of the valid rows
+        """
+        converted = list(column)
+        field_valid = np.ones(len(column), dtype=bool)
+        for row, value in enumerate(column):
+            if missing[row]:
+                continue
+            values = {name: columns[name][row] for name in columns if valid[name][row]}
+            converted[row], errors = self.validate_value(field, value, values)
+            if errors is not None:
+                self.row_errors[row].extend(errors)
+                field_valid[row] = False
+        return converted, field_valid
+
+    def validate(self, rows: Sequence[Dict[str, Any]]) -> List[Union[EntityRecord, BaseModel]]:
+        """Validate entity data and create the entities
+        :param rows: entity data, one dictionary from field name to value per entity
+        :return: list of entities
+        :raises DataException: if any of the rows is invalid, listing all invalid rows
+        """
+        columns: Dict[str, List[Any]] = {}
+        valid: Dict[str, np.ndarray] = {}
+        for name, field in self.entity_type.__fields__.items():
+            missing = np.fromiter((name not in row for row in rows), dtype=bool, count=len(rows))
+            column = [row.get(name) for row in rows]
+            if field.shape == SHAPE_SINGLETON and not field.class_validators:
+                column, field_valid = self.validate_column(field, column, missing)
+            else:
+                column, field_valid = self.validate_rows(field, column, missing, columns, valid)
+            if missing.any():
+                default = field.get_default()
+                for row in np.flatnonzero(missing):
+                    if field.required:
+                        self.row_errors[row].append(f'{name}: field required')
+                    column[row] = default
+                field_valid &= ~missing
+            columns[name] = column
+            valid[name] = field_valid
+
+        if self.row_errors:
+            messages = [f'Invalid data for {self.entity_name} with id {rows[row].get(self.id_field)}: {error}'
+                        for row in sorted(self.row_errors)
+                        for error in self.row_errors[row]]
+            for message in messages:
+                logger.error(message)
+            raise DataException('\n'.join(messages))
+
+        if self.compact:
+            return create_records(self.entity_type, zip(*columns.values()))
+        field_names = self.entity_type.__fields__.keys()
+        return [self.entity_type.construct(_fields_set=field_names & row.keys(),
+                                           **{name: column[index] for name, column in columns.items()})
+                for index, row in enumerate(rows)]
+
+
+def validate_entities(rows: Sequence[Dict[str, Any]],
+                      entity_type: Type[BaseModel],
+                      compact: bool = True) -> List[Union[EntityRecord, BaseModel]]:
+    """Validate entity data column by column and create the entities
+    :param rows: entity data, one dictionary from field name to value per entity
+    :param entity_type: type of the entities
+    :param compact: create compact records instead of pydantic entities
+    :return: list of entities
+    """
+    return ColumnarValidator(entity_type, compact).validate(rows)
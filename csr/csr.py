@@ -1,19 +1,22 @@
 from datetime import date
-from typing import Sequence, Optional, Union, Dict, List, Any
+from typing import Sequence, Optional, Union, Dict, List, Any, TYPE_CHECKING
 
-from pydantic import BaseModel, validator, Field
+from pydantic import BaseModel, validator, Field, PrivateAttr
 
-from csr.entity_validation import validate_entity_data
 from csr.exceptions import DataException
 
+if TYPE_CHECKING:
+    # Imported when the index is used, as the index depends on NumPy
+    from csr.entity_index import EntityIndex
+
 
 class Individual(BaseModel):
     """
     Individual entity
     """
     individual_id: str = Field(..., min_length=1, identity=True)
-    taxonomy: Optional[str]
-    gender: Optional[str]
+    taxonomy: Optional[str] = Field(None, categorical=True)
+    gender: Optional[str] = Field(None, categorical=True)
     birth_date: Optional[date]
     death_date: Optional[date]
     ic_type: Optional[str]
@@ -32,8 +35,8 @@ class Diagnosis(BaseModel):
     """
     diagnosis_id: str = Field(..., min_length=1, identity=True)
     individual_id: str = Field(..., min_length=1, references='Individual')
-    tumor_type: Optional[str]
-    topography: Optional[str]
+    tumor_type: Optional[str] = Field(None, categorical=True)
+    topography: Optional[str] = Field(None, categorical=True)
     treatment_protocol: Optional[str]
     tumor_stage: Optional[str]
     diagnosis_date: Optional[date]
@@ -49,7 +52,7 @@ class Biosource(BaseModel):
     individual_id: str = Field(..., min_length=1, references='Individual')
     diagnosis_id: Optional[str] = Field(None, min_length=1, references='Diagnosis')
     src_biosource_id: Optional[str] = Field(None, min_length=1, references='Biosource')
-    tissue: Optional[str]
+    tissue: Optional[str] = Field(None, categorical=True)
     biosource_date: Optional[date]
     disease_status: Optional[str]
     tumor_percentage: Optional[int]
@@ -70,7 +73,7 @@ class Biomaterial(BaseModel):
     src_biosource_id: str = Field(..., min_length=1, references='Biosource')
     src_biomaterial_id: Optional[str] = Field(None, min_length=1, references='Biomaterial')
     biomaterial_date: Optional[date]
-    type: Optional[str]
+    type: Optional[str] = Field(None, categorical=True)
     library_strategy: Optional[List[str]]
     analysis_type: Optional[List[str]]
 
@@ -120,11 +123,11 @@ class Radiology(BaseModel):
     """
     radiology_id: str = Field(..., min_length=1, identity=True)
     examination_date: date
-    image_type: str
+    image_type: str = Field(..., categorical=True)
     field_strength: Optional[str]
     individual_id: str = Field(..., min_length=1, references='Individual')
     diagnosis_id: Optional[str] = Field(..., min_length=1, references='Diagnosis')
-    body_part: str
+    body_part: str = Field(..., categorical=True)
 
 
 SubjectEntity = Union[Individual, Diagnosis, Biosource, Biomaterial, Radiology]
@@ -135,11 +138,22 @@ class CentralSubjectRegistry(BaseModel):
     Central subject registry
     """
     entity_data: Dict[str, Sequence[Any]]
+    _entity_index: Optional['EntityIndex'] = PrivateAttr(None)
+
+    @property
+    def entity_index(self) -> 'EntityIndex':
+        """Index of the entities with integer keys, built when the registry is created or on first use"""
+        if self._entity_index is None:
+            from csr.entity_index import EntityIndex
+            self._entity_index = EntityIndex(self.entity_data)
+        return self._entity_index
 
     @staticmethod
     def create(entity_data: Dict[str, Sequence[Any]]):
-        validate_entity_data(entity_data, list(SubjectEntity.__args__))
-        return CentralSubjectRegistry(entity_data=entity_data)
+        from csr.entity_validation import validate_entity_data
+        registry = CentralSubjectRegistry(entity_data=entity_data)
+        registry._entity_index = validate_entity_data(registry.entity_data, list(SubjectEntity.__args__))
+        return registry
 
 
 StudyEntity = Union[Study, IndividualStudy]
@@ -150,8 +164,21 @@ class StudyRegistry(BaseModel):
     Study registry
     """
     entity_data: Dict[str, Sequence[Any]]
+    _entity_index: Optional['EntityIndex'] = PrivateAttr(None)
+
+    @property
+    def entity_index(self) -> 'EntityIndex':
+        """Index of the entities with integer keys, built when the registry is created or on first use"""
+        if self._entity_index is None:
+            from csr.entity_index import EntityIndex
+            self._entity_index = EntityIndex(self.entity_data)
+        return self._entity_index
 
     @staticmethod
-    def create(entity_data: Dict[str, Sequence[Any]]):
-        validate_entity_data(entity_data, list(StudyEntity.__args__))
-        return StudyRegistry(entity_data=entity_data)
+    def create(entity_data: Dict[str, Sequence[Any]], subject_registry: Optional[CentralSubjectRegistry] = None):
+        from csr.entity_validation import validate_entity_data
+        registry = StudyRegistry(entity_data=entity_data)
+        registry._entity_index = validate_entity_data(
+            registry.entity_data, list(StudyEntity.__args__),
+            subject_registry.entity_data if subject_registry is not None else None)
+        return registry
@@ -0,0 +1,60 @@
+import logging
+from datetime import date, datetime
+from typing import Any, List, Sequence, Type
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+from pydantic.fields import ModelField, SHAPE_SINGLETON
+
+from csr.schema import get_categorical_fields
+
+logger = logging.getLogger(__name__)
+
+
+def to_column(field: ModelField, values: List[Any], categorical: bool) -> Any:
+    """Create a typed column for the values of a field
+    :param field: the field definition
+    :param values: the values of the field, None for missing values
+    :param categorical: if the field is marked as categorical
+    :return: column values with a dtype based on the type of the field
+    """
+    field_type = field.type_
+    if field.shape != SHAPE_SINGLETON or not isinstance(field_type, type):
+        return pd.Series(values, dtype=object)
+    if categorical:
+        return pd.Categorical(values)
+    if issubclass(field_type, bool):
+        return pd.array(values, dtype='boolean')
+    if issubclass(field_type, int):
+        return pd.array(values, dtype='Int64')
+    if issubclass(field_type, float):
+        return pd.Series(values, dtype='float64')
+    if issubclass(field_type, date):
+        try:
+            if issubclass(field_type, datetime):
+                return pd.Series(pd.to_datetime(values))
+            return pd.Series(np.array(values, dtype='datetime64[D]')).astype('datetime64[ns]')
+        except (ValueError, OverflowError, pd.errors.OutOfBoundsDatetime):
+            logger.debug(f'Dates of {field.name} are out of range, keeping them as objects')
+            return pd.Series(values, dtype=object)
+    if issubclass(field_type, str):
+        return pd.array(values, dtype='string')
+    return pd.Series(values, dtype=object)
+
+
+def entities_to_data_frame(entities: Sequence[Any], entity_type: Type[BaseModel]) -> pd.DataFrame:
+    """Create a data frame for entities of a type, with a column per field of the entity type.
+    The column types are based on the CSR data model: categorical columns for fields marked as categorical,
+    datetime64 for dates, nullable integer, boolean and string types for integer, boolean and string fields,
+    float64 for floats, and objects for list fields.
+
+    :param entities: entities or entity records of the same type
+    :param entity_type: the type of the entities
+    :return: data frame with one row per entity
+    """
+    categorical_fields = get_categorical_fields(entity_type)
+    return pd.DataFrame({
+        name: to_column(field, [getattr(entity, name) for entity in entities], name in categorical_fields)
+        for name, field in entity_type.__fields__.items()
+    })
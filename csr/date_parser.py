@@ -0,0 +1,53 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Pattern, Tuple
+
+# Maximum number of distinct date strings remembered per date format
+DATE_CACHE_SIZE = 65536
+
+# Patterns for frequently used date formats, with the positions of the year, month and day groups.
+# Values that do not match the pattern are passed on to strptime.
+fast_date_formats: Dict[str, Tuple[Pattern, Tuple[int, int, int]]] = {
+    '%Y-%m-%d': (re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})'), (1, 2, 3)),
+    '%d-%m-%Y': (re.compile(r'(\d{1,2})-(\d{1,2})-(\d{4})'), (3, 2, 1)),
+    '%d/%m/%Y': (re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})'), (3, 2, 1)),
+}
+
+
+def compile_date_parser(date_format: str) -> Callable[[str], datetime]:
+    """Create a parser for date strings in the specified format.
+    Common formats are parsed with a precompiled pattern, other formats
+    with datetime.strptime. Parsed values are memoized in a bounded LRU cache.
+
+    :param date_format: date format in strptime notation, e.g., '%Y-%m-%d'
+    :return: function that parses a date string, raises ValueError for invalid values
+    """
+    if date_format not in fast_date_formats:
+        def parse(value: str) -> datetime:
+            return datetime.strptime(value, date_format)
+    else:
+        pattern, (year_group, month_group, day_group) = fast_date_formats[date_format]
+
+        def parse(value: str) -> datetime:
+            match = pattern.fullmatch(value)
+            if match is not None:
+                try:
+                    return datetime(int(match.group(year_group)),
+                                    int(match.group(month_group)),
+                                    int(match.group(day_group)))
+                except ValueError:
+                    # Let strptime report the invalid date
+                    pass
+            return datetime.strptime(value, date_format)
+
+    return lru_cache(maxsize=DATE_CACHE_SIZE)(parse)
+
+
+@lru_cache(maxsize=None)
+def get_date_parser(date_format: str) -> Callable[[str], datetime]:
+    """Get the shared parser for a date format
+    :param date_format: date format in strptime notation
+    :return: memoizing date parser
+    """
+    return compile_date_parser(date_format)
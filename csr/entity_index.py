@@ -0,0 +1,77 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from csr.entity_records import get_entity_type
+from csr.schema import get_id_field_name, get_reference_fields
+
+# Key of a reference field without value
+NO_REFERENCE = -1
+# Key of a reference to a non-existing entity
+MISSING_REFERENCE = -2
+
+
+class EntityIndex:
+    """
+    Index of the entities of a registry with dense integer keys.
+
+    The key of an entity is its position in the list of entities of its type.
+    For every reference field, the index holds an integer array with the key of the referenced
+    entity per entity, NO_REFERENCE if the field is empty or MISSING_REFERENCE if the referenced
+    entity does not exist. String identifiers are only needed to look up entities by id.
+    The index has to be rebuilt when entities are added or removed, or when identifiers change.
+    """
+
+    def __init__(self,
+                 entity_data: Dict[str, Sequence[Any]],
+                 referenced_entity_data: Optional[Dict[str, Sequence[Any]]] = None):
+        """
+        :param entity_data: dictionary from entity type name to entities
+        :param referenced_entity_data: entities from another registry that may be referenced
+        """
+        self.entity_data: Dict[str, Sequence[Any]] = dict(referenced_entity_data or {})
+        self.entity_data.update(entity_data)
+        self.keys: Dict[str, Dict[str, int]] = {}
+        self.references: Dict[Tuple[str, str], np.ndarray] = {}
+        self.reference_fields: Dict[str, List[Tuple[str, str]]] = {}
+        for entity_type_name, entities in self.entity_data.items():
+            keys: Dict[str, int] = {}
+            if entities:
+                id_field = get_id_field_name(get_entity_type(entities[0]))
+                for key, entity in enumerate(entities):
+                    keys.setdefault(getattr(entity, id_field), key)
+            self.keys[entity_type_name] = keys
+        for entity_type_name, entities in entity_data.items():
+            self.reference_fields[entity_type_name] = []
+            if not entities:
+                continue
+            for field_name, ref_entity_name in get_reference_fields(get_entity_type(entities[0])).items():
+                if ref_entity_name not in self.keys:
+                    continue
+                ref_keys = self.keys[ref_entity_name]
+                self.references[(entity_type_name, field_name)] = np.fromiter(
+                    (NO_REFERENCE if ref_id is None else ref_keys.get(ref_id, MISSING_REFERENCE)
+                     for ref_id in (getattr(entity, field_name) for entity in entities)),
+                    dtype=np.int64, count=len(entities))
+                self.reference_fields[entity_type_name].append((field_name, ref_entity_name))
+
+    def get_key(self, entity_type_name: str, entity_id: str) -> Optional[int]:
+        """Get the key of an entity by its identifier"""
+        return self.keys.get(entity_type_name, {}).get(entity_id)
+
+    def get_entity(self, entity_type_name: str, key: int) -> Any:
+        """Get an entity by its key"""
+        return self.entity_data[entity_type_name][key]
+
+    def get_references(self, entity_type_name: str, field_name: str) -> np.ndarray:
+        """Get the keys of the entities referenced by a reference field, for all entities of a type.
+        All keys are NO_REFERENCE if the referenced entity type is not available.
+        """
+        references = self.references.get((entity_type_name, field_name))
+        if references is None:
+            return np.full(len(self.entity_data.get(entity_type_name, [])), NO_REFERENCE, dtype=np.int64)
+        return references
+
+    def get_reference_fields(self, entity_type_name: str) -> List[Tuple[str, str]]:
+        """Get the indexed reference fields of an entity type, with the names of the referenced entity types"""
+        return self.reference_fields.get(entity_type_name, [])
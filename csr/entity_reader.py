@@ -1,8 +1,10 @@
 import json
 import logging
-from datetime import datetime
 from typing import List, Dict, Any, Type
 from pydantic import BaseModel
+from csr.date_parser import get_date_parser
+from csr.exceptions import DataException
+from csr.schema import get_id_field_name
 from csr.tabular_file_reader import TabularFileReader
 
 logger = logging.getLogger(__name__)
@@ -34,15 +36,24 @@ class EntityReader:
         except FileNotFoundError:
             return []
 
-        date_fields = self.get_date_fields(entity_type.schema())
-        array_fields = self.get_array_fields(entity_type.schema())
+        schema = entity_type.schema()
+        date_fields = self.get_date_fields(schema)
+        array_fields = self.get_array_fields(schema)
+        id_field = get_id_field_name(entity_type)
+        parse_date = get_date_parser('%Y-%m-%d')
 
         for row in data:
             for field, value in row.items():
                 if value == '' or value == 'NA':
                     row[field] = None
                 elif field in date_fields:
-                    row[field] = datetime.strptime(value, '%Y-%m-%d')
+                    try:
+                        row[field] = parse_date(value)
+                    except ValueError as e:
+                        logger.error(e)
+                        raise DataException(f'Error parsing {field} from {file_path} with id {row.get(id_field)}')
                 elif field in array_fields:
                     row[field] = json.loads(value)
-        return [entity_type(**d) for d in list(data)]
+        # Imported here, as validation depends on pandas
+        from csr.columnar_validation import validate_entities
+        return validate_entities(data, entity_type)
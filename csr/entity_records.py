@@ -0,0 +1,89 @@
+from functools import lru_cache
+from typing import Any, ClassVar, Dict, Iterable, List, Sequence, Type, Union
+
+from pydantic import BaseModel
+from pydantic.fields import ModelField
+
+
+class EntityRecord:
+    """
+    Compact representation of a CSR entity.
+
+    Record types are generated from the pydantic entity types in csr/csr.py (see get_record_type).
+    Records store their values in slots instead of a per-instance dictionary and do not
+    validate assignments. They support the attribute access, dict() and schema() of the entity types.
+    """
+    __slots__ = ()
+    entity_type: ClassVar[Type[BaseModel]]
+    __fields__: ClassVar[Dict[str, ModelField]]
+
+    def __init__(self, **values: Any):
+        for name, field in self.__fields__.items():
+            setattr(self, name, values[name] if name in values else field.get_default())
+
+    @classmethod
+    def schema(cls, *args, **kwargs) -> Dict[str, Any]:
+        return cls.entity_type.schema(*args, **kwargs)
+
+    def dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_model(self) -> BaseModel:
+        """Create a pydantic entity with the values of the record, without validation"""
+        return self.entity_type.construct(**self.dict())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (EntityRecord, BaseModel)):
+            return self.dict() == other.dict()
+        return self.dict() == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{self.entity_type.__name__}({values})'
+
+    def __reduce__(self):
+        return create_record, (self.entity_type, tuple(getattr(self, name) for name in self.__slots__))
+
+
+@lru_cache(maxsize=None)
+def get_record_type(entity_type: Type[BaseModel]) -> Type[EntityRecord]:
+    """Get the compact record type for a pydantic entity type
+    :param entity_type: CSR entity type, e.g., Individual
+    :return: record type with a slot for every field of the entity type
+    """
+    return type(f'{entity_type.__name__}Record', (EntityRecord,), {
+        '__slots__': tuple(entity_type.__fields__.keys()),
+        '__module__': __name__,
+        'entity_type': entity_type,
+        '__fields__': entity_type.__fields__,
+    })
+
+
+def create_record(entity_type: Type[BaseModel], values: Sequence[Any]) -> EntityRecord:
+    """Create a record from values in the order of the fields of the entity type"""
+    record_type = get_record_type(entity_type)
+    record = record_type.__new__(record_type)
+    for name, value in zip(record_type.__slots__, values):
+        setattr(record, name, value)
+    return record
+
+
+def create_records(entity_type: Type[BaseModel], rows: Iterable[Sequence[Any]]) -> List[EntityRecord]:
+    """Create records from rows of values in the order of the fields of the entity type"""
+    return [create_record(entity_type, values) for values in rows]
+
+
+def to_record(entity: Union[BaseModel, EntityRecord]) -> EntityRecord:
+    """Get the compact record for an entity"""
+    if isinstance(entity, EntityRecord):
+        return entity
+    return create_record(type(entity), [getattr(entity, name) for name in entity.__fields__])
+
+
+def get_entity_type(entity: Union[BaseModel, EntityRecord]) -> Type[BaseModel]:
+    """Get the pydantic entity type of an entity or record"""
+    if isinstance(entity, EntityRecord):
+        return entity.entity_type
+    return type(entity)
@@ -1,15 +1,79 @@
-from typing import Sequence, Type, Dict, Any, List
+from typing import Sequence, Type, Dict, Any, List, Optional
 
+import numpy as np
 from pydantic import BaseModel
 
+from csr.entity_index import EntityIndex, MISSING_REFERENCE
+from csr.entity_records import get_entity_type
+from csr.exceptions import DataException
+from csr.schema import get_id_field_name
 
-def validate_entity_data(entity_data: Dict[str, Sequence[Any]], allowed_entity_types: List[Type[BaseModel]]):
+
+def validate_entity_data(entity_data: Dict[str, Sequence[Any]],
+                         allowed_entity_types: List[Type[BaseModel]],
+                         referenced_entity_data: Optional[Dict[str, Sequence[Any]]] = None) -> EntityIndex:
     for entity_type_name, entities in entity_data.items():
         entity_types = [entity_type for entity_type in allowed_entity_types
                         if entity_type.schema()['title'] == entity_type_name]
         if not entity_types:
-            raise Exception(f'Invalid entity type in subject registry: {entity_type_name}.')
+            raise DataException(f'Invalid entity type in subject registry: {entity_type_name}.')
         entity_type = entity_types[0]
         for entity in entities:
-            if type(entity) is not entity_type:
-                raise Exception(f'Found entity of type {type(entity)}, but expected {entity_type_name}: {entity}')
+            if get_entity_type(entity) is not entity_type:
+                raise DataException(f'Found entity of type {type(entity)}, but expected {entity_type_name}: {entity}')
+    return validate_references(entity_data, referenced_entity_data)
+
+
+def find_derivation_cycles(parents: Sequence[int]) -> List[List[int]]:
+    """Find cycles in derivation chains, e.g., biosources derived from biosources
+    :param parents: the key of the entity each entity is derived from, negative if there is none
+    :return: list of cycles, each a list of entity keys
+    """
+    parents = list(parents)
+    # 0: not visited, 1: on the current chain, 2: done
+    state = [0] * len(parents)
+    cycles: List[List[int]] = []
+    for start in range(len(parents)):
+        chain: List[int] = []
+        current = start
+        while current >= 0 and state[current] == 0:
+            state[current] = 1
+            chain.append(current)
+            current = parents[current]
+        if current >= 0 and state[current] == 1:
+            cycles.append(chain[chain.index(current):])
+        for key in chain:
+            state[key] = 2
+    return cycles
+
+
+def validate_references(entity_data: Dict[str, Sequence[Any]],
+                        referenced_entity_data: Optional[Dict[str, Sequence[Any]]] = None) -> EntityIndex:
+    """Check that all references between entities point to existing entities
+    and that there are no cycles in derivation chains.
+    References to entity types that are not available are not checked.
+
+    :param entity_data: dictionary from entity type name to entities
+    :param referenced_entity_data: entities from another registry that may be referenced
+    :return: the index of the entities
+    :raises DataException: listing all invalid references and cycles
+    """
+    index = EntityIndex(entity_data, referenced_entity_data)
+    violations: List[str] = []
+    for entity_type_name, entities in entity_data.items():
+        if not entities:
+            continue
+        id_field = get_id_field_name(get_entity_type(entities[0]))
+        for field_name, ref_entity_name in index.get_reference_fields(entity_type_name):
+            references = index.get_references(entity_type_name, field_name)
+            for key in np.flatnonzero(references == MISSING_REFERENCE):
+                entity = entities[key]
+                violations.append(f'{entity_type_name} with id {getattr(entity, id_field)} has reference to '
+                                  f'non-existing {ref_entity_name} with id {getattr(entity, field_name)}.')
+            if ref_entity_name == entity_type_name:
+                for cycle in find_derivation_cycles(references):
+                    cycle_ids = [getattr(entities[key], id_field) for key in cycle + cycle[:1]]
+                    violations.append(f'{entity_type_name} derivation cycle: {" -> ".join(cycle_ids)}.')
+    if violations:
+        raise DataException('Invalid references in registry:\n' + '\n'.join(violations))
+    return index
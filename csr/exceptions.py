@@ -1,14 +1,19 @@
-class DataException(Exception):
+class CsrException(Exception):
+    """Base class of the exceptions raised when reading, validating or transforming CSR data"""
     pass
 
 
-class MappingException(Exception):
+class DataException(CsrException):
     pass
 
 
-class FileSystemException(Exception):
+class MappingException(CsrException):
     pass
 
 
-class ReaderException(Exception):
+class FileSystemException(CsrException):
+    pass
+
+
+class ReaderException(CsrException):
     pass
@@ -0,0 +1,249 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class StageRecord(BaseModel):
+    """Measurements of a stage of a run. Times are in seconds, peak_rss is in KiB"""
+    name: str
+    pid: int
+    start_time: datetime
+    wall_time: float
+    cpu_time: float
+    rows_in: Optional[int]
+    rows_out: Optional[int]
+    rows_per_second: Optional[float]
+    peak_rss: Optional[int]
+    completed: bool
+
+
+class RunReport(BaseModel):
+    """Measurements of a run of a command, with the stages in the order in which they finished"""
+    command: str
+    status: str
+    start_time: datetime
+    wall_time: float
+    cpu_time: float
+    children_cpu_time: float
+    peak_rss: Optional[int]
+    stages: List[StageRecord]
+
+
+def get_peak_rss() -> Optional[int]:
+    """Get the peak resident set size of the process in KiB, None if not available
+    """
+    try:
+        with open('/proc/self/status') as status:
+            match = re.search(r'^VmHWM:\s+(\d+) kB', status.read(), re.MULTILINE)
+        if match is not None:
+            return int(match.group(1))
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KiB elsewhere
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak resident set size of the process, only supported on Linux
+    :return: True if the peak was reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def count_entities(registry) -> int:
+    """Count the entities of all types in a subject or study registry"""
+    return sum(len(entities) for entities in registry.entity_data.values())
+
+
+class Stage:
+    """A running stage. The numbers of rows read and written by the stage can be set while it runs."""
+
+    def __init__(self, name: str, rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+
+
+class Recorder:
+    """Collects the records of the stages of a run, from all threads of the process"""
+
+    def __init__(self):
+        self.records: List[StageRecord] = []
+        self.lock = threading.Lock()
+
+    def add(self, records: List[StageRecord]):
+        with self.lock:
+            self.records.extend(records)
+
+
+# Recorder of the current run, None if the run is not instrumented
+recorder: Optional[Recorder] = None
+# Function that is called with the name of a stage and 'start' or 'end' at the boundaries of stages,
+# e.g., to take memory snapshots (see csr.profiling)
+stage_hook: Optional[Callable[[str, str], None]] = None
+
+
+def is_recording() -> bool:
+    return recorder is not None
+
+
+@contextmanager
+def stage(name: str, rows_in: Optional[int] = None) -> Iterator[Stage]:
+    """Measure a stage of the run, if the run is instrumented, and call the stage hook at its boundaries
+    :param name: name of the stage in the report
+    :param rows_in: number of rows read by the stage, if known in advance
+    :return: the stage, of which rows_in and rows_out can be set
+    """
+    current = Stage(name, rows_in)
+    if recorder is None and stage_hook is None:
+        yield current
+        return
+    if stage_hook is not None:
+        stage_hook(name, 'start')
+    start_time = datetime.now()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    completed = False
+    try:
+        yield current
+        completed = True
+    finally:
+        wall_time = time.perf_counter() - start_wall
+        rows = current.rows_out if current.rows_out is not None else current.rows_in
+        record = StageRecord(
+            name=name,
+            pid=os.getpid(),
+            start_time=start_time,
+            wall_time=round(wall_time, 6),
+            cpu_time=round(time.process_time() - start_cpu, 6),
+            rows_in=current.rows_in,
+            rows_out=current.rows_out,
+            rows_per_second=round(rows / wall_time, 1) if rows is not None and wall_time > 0 else None,
+            peak_rss=get_peak_rss(),
+            completed=completed)
+        logger.debug(f'Stage {name}: {record.wall_time:.3f} s')
+        if recorder is not None:
+            recorder.add([record])
+        if stage_hook is not None:
+            stage_hook(name, 'end')
+
+
+def instrumented(name: Optional[str] = None,
+                 rows_in: Optional[Callable[..., int]] = None,
+                 rows_out: Optional[Callable[[Any], int]] = None):
+    """Decorator that measures every call of a function as a stage (see stage)
+    :param name: name of the stage, the qualified name of the function by default
+    :param rows_in: function that counts the rows read, called with the arguments of the function
+    :param rows_out: function that counts the rows written, called with the result of the function
+    """
+    def decorate(function: Callable) -> Callable:
+        stage_name = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if recorder is None and stage_hook is None:
+                return function(*args, **kwargs)
+            with stage(stage_name, rows_in(*args, **kwargs) if rows_in is not None else None) as current:
+                result = function(*args, **kwargs)
+                if rows_out is not None:
+                    current.rows_out = rows_out(result)
+                return result
+        return wrapper
+    return decorate
+
+
+class WorkerResult(NamedTuple):
+    value: Any
+    records: List[StageRecord]
+
+
+class WorkerCall:
+    """Calls a function in a worker process and returns its result with the stages recorded in the worker"""
+
+    def __init__(self, function: Callable):
+        self.function = function
+
+    def __call__(self, *args) -> WorkerResult:
+        global recorder
+        previous = recorder
+        recorder = Recorder()
+        try:
+            value = self.function(*args)
+            return WorkerResult(value, recorder.records)
+        finally:
+            recorder = previous
+
+
+def in_worker(function: Callable) -> Callable:
+    """Prepare a function for submission to a worker process. If the run is instrumented,
+    the stages in the worker are recorded and returned with the result, see collect.
+    """
+    return WorkerCall(function) if recorder is not None else function
+
+
+def collect(result: Any) -> Any:
+    """Add the stages recorded in a worker process (see in_worker) and return the result of the function"""
+    if isinstance(result, WorkerResult):
+        if recorder is not None:
+            recorder.add(result.records)
+        return result.value
+    return result
+
+
+@contextmanager
+def run_report(report_path: Optional[str], command: str):
+    """Record the stages of a run and write the run report as JSON to report_path.
+    The report is also written if the run fails. Nothing is recorded if report_path is None.
+    :param report_path: path of the report file
+    :param command: name of the command in the report
+    """
+    global recorder
+    if report_path is None:
+        yield
+        return
+    recorder = Recorder()
+    start_time = datetime.now()
+    start_wall = time.perf_counter()
+    start_times = os.times()
+    status = 'failed'
+    try:
+        yield
+        status = 'completed'
+    finally:
+        records = recorder.records
+        recorder = None
+        times = os.times()
+        report = RunReport(
+            command=command,
+            status=status,
+            start_time=start_time,
+            wall_time=round(time.perf_counter() - start_wall, 6),
+            cpu_time=round(times.user + times.system - start_times.user - start_times.system, 6),
+            children_cpu_time=round(times.children_user + times.children_system
+                                    - start_times.children_user - start_times.children_system, 6),
+            peak_rss=get_peak_rss(),
+            stages=records)
+        with open(report_path, 'w') as report_file:
+            report_file.write(report.json(indent=2))
+        logger.info(f'Run report written to {report_path}')
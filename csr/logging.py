@@ -1,8 +1,6 @@
 import logging.config
 import os
 
-import yaml
-
 
 def setup_logging(debug: bool):
     """
@@ -13,6 +11,7 @@ def setup_logging(debug: bool):
     default_level = logging.DEBUG if debug else logging.INFO
     path = os.environ.get('LOG_CFG', 'csr/logging.yaml')
     if os.path.exists(path):
+        import yaml
         with open(path, 'rt') as f:
             config = yaml.safe_load(f.read())
         config['root']['level'] = default_level
@@ -0,0 +1,130 @@
+import logging
+import os
+import re
+from contextlib import contextmanager
+from os import path
+from typing import Any, Optional
+
+from csr import instrumentation
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = 'cprofile'
+TRACEMALLOC = 'tracemalloc'
+PROFILERS = [CPROFILE, TRACEMALLOC]
+
+# Number of functions or allocation sites in the summaries
+PROFILE_TOP = 30
+# Number of frames of the allocation tracebacks
+TRACEMALLOC_FRAMES = 10
+
+
+class SnapshotWriter:
+    """Writes tracemalloc snapshots to a directory, numbered in the order in which they are taken"""
+
+    def __init__(self, profile_dir: str, command: str):
+        self.profile_dir = profile_dir
+        self.command = command
+        self.count = 0
+
+    def __call__(self, stage_name: str, boundary: str):
+        import tracemalloc
+        self.count += 1
+        label = re.sub(r'[^\w.-]', '_', stage_name)
+        file_name = f'{self.command}_{self.count:03d}_{label}_{boundary}.tracemalloc'
+        tracemalloc.take_snapshot().dump(path.join(self.profile_dir, file_name))
+
+
+# cProfile profile or tracemalloc snapshot writer of the current run, None if the run is not profiled
+active_profiler: Optional[Any] = None
+
+
+def stop_in_child():
+    """Stop profiling in a forked process, e.g., a worker process, so that only the main process is profiled"""
+    global active_profiler
+    if active_profiler is None:
+        return
+    if isinstance(active_profiler, SnapshotWriter):
+        import tracemalloc
+        instrumentation.stage_hook = None
+        tracemalloc.stop()
+    else:
+        active_profiler.disable()
+    active_profiler = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=stop_in_child)
+
+
+def write_cprofile_summary(profiler, summary_path: str):
+    import pstats
+    with open(summary_path, 'w') as summary_file:
+        stats = pstats.Stats(profiler, stream=summary_file)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(PROFILE_TOP)
+
+
+def write_tracemalloc_summary(snapshot, peak: int, summary_path: str):
+    with open(summary_path, 'w') as summary_file:
+        summary_file.write(f'Peak traced memory: {peak / 1024:.1f} KiB\n')
+        summary_file.write(f'Top {PROFILE_TOP} allocation sites at the end of the run:\n')
+        for statistic in snapshot.statistics('lineno')[:PROFILE_TOP]:
+            summary_file.write(f'{statistic}\n')
+
+
+@contextmanager
+def profile_run(profiler: Optional[str], profile_dir: Optional[str], command: str):
+    """Profile the run of a command in the main process, nothing is done if profiler is None.
+    Profiling is stopped in forked worker processes.
+
+    With cprofile, the statistics are written to <command>.pstats in profile_dir, for use with pstats
+    or a viewer such as snakeviz, and the top functions by cumulative and own time to <command>_top.txt.
+    With tracemalloc, a snapshot is written at the start and end of every stage (see csr.instrumentation),
+    and of the run, and the top allocation sites at the end of the run to <command>_tracemalloc_top.txt.
+    The files are also written if the run fails.
+
+    :param profiler: cprofile or tracemalloc
+    :param profile_dir: directory to write the profile files to, the current directory if None
+    :param command: name of the command, used in the file names
+    """
+    global active_profiler
+    if profiler is None:
+        yield
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f'Unknown profiler: {profiler}')
+    profile_dir = profile_dir or os.curdir
+    os.makedirs(profile_dir, exist_ok=True)
+    if profiler == CPROFILE:
+        import cProfile
+        profile = cProfile.Profile()
+        active_profiler = profile
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            active_profiler = None
+            profile.dump_stats(path.join(profile_dir, f'{command}.pstats'))
+            write_cprofile_summary(profile, path.join(profile_dir, f'{command}_top.txt'))
+            logger.info(f'Profile written to {profile_dir}')
+    else:
+        import tracemalloc
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        snapshot_writer = SnapshotWriter(profile_dir, command)
+        previous_hook = instrumentation.stage_hook
+        instrumentation.stage_hook = snapshot_writer
+        active_profiler = snapshot_writer
+        try:
+            snapshot_writer('run', 'start')
+            yield
+        finally:
+            instrumentation.stage_hook = previous_hook
+            active_profiler = None
+            snapshot_writer('run', 'end')
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            write_tracemalloc_summary(snapshot, peak, path.join(profile_dir, f'{command}_tracemalloc_top.txt'))
+            logger.info(f'Memory snapshots written to {profile_dir}')
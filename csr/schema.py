@@ -0,0 +1,31 @@
+from typing import Dict, List, Type
+
+from pydantic import BaseModel
+
+
+def get_id_field_name(entity_type: Type[BaseModel]) -> str:
+    """Get the name of the identifying field of an entity type, marked with the 'identity' keyword
+    :param entity_type: type of the entity
+    :return: name of the identifying field
+    """
+    return [name for name, field in entity_type.__fields__.items()
+            if field.field_info.extra.get('identity') is True][0]
+
+
+def get_reference_fields(entity_type: Type[BaseModel]) -> Dict[str, str]:
+    """Get the reference fields of an entity type, based on the 'references' schema keyword
+    :param entity_type: type of the entity
+    :return: dictionary from field name to the name of the referenced entity type
+    """
+    return {name: field.field_info.extra['references']
+            for name, field in entity_type.__fields__.items()
+            if 'references' in field.field_info.extra}
+
+
+def get_categorical_fields(entity_type: Type[BaseModel]) -> List[str]:
+    """Get the names of the fields with a small set of distinct values, marked with the 'categorical' keyword
+    :param entity_type: type of the entity
+    :return: list of field names
+    """
+    return [name for name, field in entity_type.__fields__.items()
+            if field.field_info.extra.get('categorical') is True]
@@ -0,0 +1,86 @@
+import logging
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from csr.csr import CentralSubjectRegistry, StudyRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def select_referencing(references: np.ndarray, selected: np.ndarray) -> np.ndarray:
+    """Select the entities that reference a selected entity
+    :param references: keys of the referenced entities, negative if there is no reference
+    :param selected: boolean mask of the selected referenced entities
+    :return: boolean mask of the referencing entities
+    """
+    result = np.zeros(len(references), dtype=bool)
+    valid = references >= 0
+    result[valid] = selected[references[valid]]
+    return result
+
+
+def select_entities(entities: Sequence[Any], selected: np.ndarray) -> List[Any]:
+    return [entities[key] for key in np.flatnonzero(selected)]
+
+
+def select_by_study(subject_registry: CentralSubjectRegistry,
+                    study_registry: StudyRegistry) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Selects the entities of the subject registry that belong to each study of the study registry.
+    A study has the individuals linked to the study by IndividualStudy entities,
+    the entities that reference these individuals, e.g., diagnoses and biosources,
+    and the biomaterials of these biosources.
+    Individuals that are linked to multiple studies belong to all these studies.
+
+    :param subject_registry: the subject registry
+    :param study_registry: the study registry with the studies and the links of individuals to studies
+    :return: dictionary from study id to a boolean mask of the selected entities per entity type name,
+        in the order of the studies
+    """
+    index = subject_registry.entity_index
+    entity_data = subject_registry.entity_data
+    individual_count = len(entity_data.get('Individual', []))
+    study_individuals: Dict[str, np.ndarray] = {
+        study.study_id: np.zeros(individual_count, dtype=bool)
+        for study in study_registry.entity_data.get('Study', [])}
+    for individual_study in study_registry.entity_data.get('IndividualStudy', []):
+        key = index.get_key('Individual', individual_study.individual_id)
+        if key is None or individual_study.study_id not in study_individuals:
+            logger.debug(f'Skipping link of individual {individual_study.individual_id} '
+                         f'to study {individual_study.study_id}')
+            continue
+        study_individuals[individual_study.study_id][key] = True
+
+    selections: Dict[str, Dict[str, np.ndarray]] = {}
+    for study_id, individuals in study_individuals.items():
+        selection = {entity_type_name: np.zeros(len(entities), dtype=bool)
+                     for entity_type_name, entities in entity_data.items()}
+        selection['Individual'] = individuals
+        for entity_type_name in entity_data:
+            for field_name, ref_entity_name in index.get_reference_fields(entity_type_name):
+                if ref_entity_name == 'Individual':
+                    selection[entity_type_name] |= select_referencing(
+                        index.get_references(entity_type_name, field_name), individuals)
+        # Biomaterials are linked to individuals through their source biosource
+        if 'Biomaterial' in selection and 'Biosource' in selection:
+            selection['Biomaterial'] = select_referencing(
+                index.get_references('Biomaterial', 'src_biosource_id'), selection['Biosource'])
+        selections[study_id] = selection
+    return selections
+
+
+def partition_by_study(subject_registry: CentralSubjectRegistry,
+                       study_registry: StudyRegistry) -> Dict[str, CentralSubjectRegistry]:
+    """
+    Partitions the subject registry by the studies of the study registry (see select_by_study).
+
+    :param subject_registry: the subject registry
+    :param study_registry: the study registry with the studies and the links of individuals to studies
+    :return: dictionary from study id to the subject registry of the study, in the order of the studies
+    """
+    return {
+        study_id: CentralSubjectRegistry(entity_data={
+            entity_type_name: select_entities(entities, selection[entity_type_name])
+            for entity_type_name, entities in subject_registry.entity_data.items()})
+        for study_id, selection in select_by_study(subject_registry, study_registry).items()}
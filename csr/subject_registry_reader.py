@@ -4,6 +4,8 @@ from typing import Type
 
 from csr.csr import CentralSubjectRegistry, SubjectEntity
 from csr.entity_reader import EntityReader
+from csr.exceptions import ReaderException
+from csr.instrumentation import count_entities, instrumented
 from csr.snake_case import camel_case_to_snake_case
 
 logger = logging.getLogger(__name__)
@@ -21,6 +23,7 @@ class SubjectRegistryReader(EntityReader):
     def __init__(self, input_dir: str):
         EntityReader.__init__(self, input_dir)
 
+    @instrumented('read_subject_registry', rows_out=count_entities)
     def read_subject_registry(self) -> CentralSubjectRegistry:
         try:
             entity_data = {entity_type.schema()['title']:
@@ -28,4 +31,4 @@ class SubjectRegistryReader(EntityReader):
                            for entity_type in list(SubjectEntity.__args__)}
             return CentralSubjectRegistry(entity_data=entity_data)
         except FileNotFoundError as fnfe:
-            raise FileNotFoundError('File not found. {}'.format(fnfe))
+            raise ReaderException('File not found. {}'.format(fnfe)) from fnfe
@@ -8,21 +8,32 @@ import errno
 import gzip
 import logging
 import os
+import re
 import shutil
 import sys
+import tempfile
 import time
-from typing import List, Set, Optional
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import repeat
+from typing import Dict, Iterable, List, Mapping, Set, Optional, Sequence
 
 import click
-import pandas as pd
+from pydantic import ValidationError
 from csr.logging import setup_logging
+from csr.profiling import PROFILERS, profile_run
 
-from csr.csr import CentralSubjectRegistry
-from csr.exceptions import DataException
+from csr.csr import CentralSubjectRegistry, Study, StudyRegistry
+from csr.exceptions import DataException, ReaderException
+from csr.instrumentation import collect, count_entities, in_worker, instrumented, run_report, stage
+from csr.study_registry_reader import StudyRegistryReader
 from csr.subject_registry_reader import SubjectRegistryReader
 from .create_caselist import create_caselist
 from .create_metafile import create_meta_content
-from .transform_clinical import write_clinical, transform_patient_clinical_data, transform_sample_clinical_data
+from .incremental import IncrementalBuild, get_parameters
+from .maf_filter import MafFilter
+from .scheduler import StageScheduler
+from .transform_cna import transform_cna_file, transform_segment_file, split_cna_file, split_segment_file
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +44,27 @@ NAME_SHORT = "Central Subject Registry"
 DESCRIPTION = 'Transformed to cBioPortal format on: %s' % time.strftime("%d-%m-%Y %H:%M")
 TYPE_OF_CANCER = 'mixed'
 
+# TODO to be removed after upgrade to cBioPortal version that supports hg38 for segment data
+# For now skipping upload of .seg files, see: https://github.com/thehyve/python_csr2transmart/issues/62
+CBIOPORTAL_SEG_HG38_SUPPORT = False
+
+# CNA data types
+SEGMENTS = 'segments'
+CONTINUOUS = 'continuous'
+DISCRETE = 'discrete'
+
+# Output files per stage, relative to the output directory
+CLINICAL_OUTPUTS = ['data_clinical_patient.txt', 'meta_clinical_patient.txt',
+                    'data_clinical_sample.txt', 'meta_clinical_sample.txt']
+MUTATION_OUTPUTS = ['data_mutations.maf', 'meta_mutations.txt', os.path.join('case_lists', 'cases_sequenced.txt')]
+CNA_OUTPUTS = {
+    SEGMENTS: ['data_cna_segments.seg', 'meta_cna_segments.txt'],
+    CONTINUOUS: ['data_cna_continuous.txt', 'meta_cna_continuous.txt', os.path.join('case_lists', 'cases_cna.txt')],
+    DISCRETE: ['data_cna_discrete.txt', 'meta_cna_discrete.txt'],
+}
+# Data types of the values in the CNA data files
+CNA_VALUE_DTYPES = {CONTINUOUS: 'float32', DISCRETE: 'Int8'}
+
 
 def prepare_output_directory(output_dir: str):
     # Remove old output directory and recreate to ensure all NGS data is
@@ -48,6 +80,28 @@ def prepare_output_directory(output_dir: str):
         raise oe
 
 
+def write_clinical_files(subject_registry: CentralSubjectRegistry, output_dir: str,
+                         study_id: str = STUDY_ID) -> List[str]:
+    """
+    Transforms the subject registry to clinical data files for cBioPortal and writes them to output_dir.
+    Returns the list of sample identifiers in the clinical data.
+    """
+    # Imported here, as the transformation depends on pandas, which is slow to import
+    from .transform_clinical import write_clinical, transform_patient_clinical_data, transform_sample_clinical_data
+
+    with stage('write_clinical_files', count_entities(subject_registry)) as current:
+        # Transform patient file
+        patient_clinical_data, patient_clinical_header = transform_patient_clinical_data(subject_registry)
+        write_clinical(patient_clinical_data, patient_clinical_header, 'patient', output_dir, study_id)
+
+        # Transform sample file
+        sample_clinical_data, sample_clinical_header = transform_sample_clinical_data(subject_registry)
+        write_clinical(sample_clinical_data, sample_clinical_header, 'sample', output_dir, study_id)
+        current.rows_out = len(patient_clinical_data) + len(sample_clinical_data)
+
+    return sample_clinical_data['SAMPLE_ID'].unique().tolist()
+
+
 def process_clinical_data(input_dir: str, output_dir: str) -> List[str]:
     """
     Reads subject registry data from input_dir and transforms the data
@@ -58,206 +112,287 @@ def process_clinical_data(input_dir: str, output_dir: str) -> List[str]:
     # Clinical data
     subject_registry_reader = SubjectRegistryReader(input_dir)
     subject_registry: CentralSubjectRegistry = subject_registry_reader.read_subject_registry()
+    return write_clinical_files(subject_registry, output_dir)
 
-    # Transform patient file
-    patient_clinical_data, patient_clinical_header = transform_patient_clinical_data(subject_registry)
-    write_clinical(patient_clinical_data, patient_clinical_header, 'patient', output_dir, STUDY_ID)
 
-    # Transform sample file
-    sample_clinical_data, sample_clinical_header = transform_sample_clinical_data(subject_registry)
-    write_clinical(sample_clinical_data, sample_clinical_header, 'sample', output_dir, STUDY_ID)
-
-    return sample_clinical_data['SAMPLE_ID'].unique().tolist()
-
-
-def process_mutation_data(ngs_dir: str, output_dir: str, clinical_sample_ids: List[str]) -> Set[str]:
+def check_samples_in_clinical_data(samples: Iterable[str], clinical_sample_ids: List[str], data_type: str):
+    """
+    Raises an exception when any of the samples is not in the clinical_sample_ids list.
+    """
+    unknown_samples = set(samples).difference(set(clinical_sample_ids))
+    if unknown_samples:
+        logger.error("Found samples in {} files that are not in clinical data: {}".format(
+            data_type, ", ".join(unknown_samples)))
+        raise DataException('Found samples in {} files that are not in clinical data'.format(data_type))
+
+
+def write_mutation_metadata(output_dir: str, mutation_samples: Iterable[str], study_id: str = STUDY_ID):
+    """Writes the meta and caselist files for the mutation data"""
+    # Create meta file
+    meta_filename = os.path.join(output_dir, 'meta_mutations.txt')
+    create_meta_content(meta_filename, cancer_study_identifier=study_id,
+                        genetic_alteration_type='MUTATION_EXTENDED', datatype='MAF',
+                        stable_id='mutations', show_profile_in_analysis_tab='true',
+                        profile_name='Mutations', profile_description='Mutation data',
+                        data_filename='data_mutations.maf', variant_classification_filter='',
+                        swissprot_identifier='accession')
+
+    # Create case list
+    create_caselist(output_dir=output_dir, file_name='cases_sequenced.txt',
+                    cancer_study_identifier=study_id,
+                    stable_id='%s_sequenced' % study_id, case_list_name='Sequenced samples',
+                    case_list_description='All sequenced samples',
+                    case_list_category='all_cases_with_mutation_data',
+                    case_list_ids="\t".join(mutation_samples))
+
+
+@instrumented()
+def process_mutation_data(ngs_dir: str, output_dir: str, clinical_sample_ids: Optional[List[str]],
+                          maf_filter: Optional[MafFilter] = None, workers: Optional[int] = None,
+                          executor: Optional[Executor] = None) -> Set[str]:
     """
     Reads data from all MAF files in ngs_dir and creates a combined mutation data file
     and the meta and caselist files for the mutation data.
+    The MAF files are read by jobs on the executor, if passed, or in a new pool of worker processes.
 
     Returns the list of sample identifiers found in the mutation data.
-    An exception is raised when any of the sample identifiers is not in the clinical_sample_ids list.
+    An exception is raised when any of the sample identifiers is not in the clinical_sample_ids list,
+    unless the list is None.
     """
-    mutation_samples = combine_maf(ngs_dir, os.path.join(output_dir, 'data_mutations.maf'))
+    mutation_samples = combine_maf(ngs_dir, os.path.join(output_dir, 'data_mutations.maf'),
+                                   workers=workers, maf_filter=maf_filter, executor=executor)
 
     if mutation_samples:
-        # Create meta file
-        meta_filename = os.path.join(output_dir, 'meta_mutations.txt')
-        create_meta_content(meta_filename, cancer_study_identifier=STUDY_ID,
-                            genetic_alteration_type='MUTATION_EXTENDED', datatype='MAF',
-                            stable_id='mutations', show_profile_in_analysis_tab='true',
-                            profile_name='Mutations', profile_description='Mutation data',
-                            data_filename='data_mutations.maf', variant_classification_filter='',
-                            swissprot_identifier='accession')
-
-        # Create case list
-        create_caselist(output_dir=output_dir, file_name='cases_sequenced.txt',
-                        cancer_study_identifier=STUDY_ID,
-                        stable_id='%s_sequenced' % STUDY_ID, case_list_name='Sequenced samples',
-                        case_list_description='All sequenced samples',
-                        case_list_category='all_cases_with_mutation_data',
-                        case_list_ids="\t".join(mutation_samples))
+        write_mutation_metadata(output_dir, mutation_samples)
 
         # Test for samples in MAF files that are not in clinical data
-        if not set(clinical_sample_ids).issuperset(mutation_samples):
-            logger.error("Found samples in MAF files that are not in clinical data: {}".format(
-                ", ".join(mutation_samples.difference(set(clinical_sample_ids)))))
-            raise DataException('Found samples in MAF files that are not in clinical data')
+        if clinical_sample_ids is not None:
+            check_samples_in_clinical_data(mutation_samples, clinical_sample_ids, 'MAF')
     return mutation_samples
 
 
-def process_cna_files(ngs_dir: str, output_dir: str, clinical_sample_ids: List[str]) -> List[str]:
+def get_cna_files(ngs_dir: str) -> Dict[str, List[str]]:
     """
-    Reads CNA data files (segmented, continuous and discrete) from ngs_dir, copies the files,
-    drops and renames certain columns, and writes meta and case list files.
-
-    Returns list of CNA sample identifiers.
-    An exception is raised when any of the sample identifiers is not in the clinical_sample_ids list.
+    Finds the CNA data files in ngs_dir.
+    Returns a dictionary from CNA data type (segments, continuous, discrete) to the paths of the files.
     """
-    # Select all non-hidden files
-    study_files = []
+    cna_files: Dict[str, List[str]] = {SEGMENTS: [], CONTINUOUS: [], DISCRETE: []}
     for study_file in os.listdir(ngs_dir):
-        if not study_file.startswith('.'):
-            study_files.append(study_file)
-
-    # Create sample list, required for cnaseq case list
-    cna_samples = []
-
-    # Transform CNA data files
-    for study_file in study_files:
-        if study_file.endswith('sha1'):
+        # Skip hidden files and checksum files
+        if study_file.startswith('.') or study_file.endswith('sha1'):
             continue
-
-        # TODO to be removed after upgrade to cBioPortal version that supports hg38 for segment data
-        # For now skipping upload of .seg files, see: https://github.com/thehyve/python_csr2transmart/issues/62
-        cbioportal_seg_hg38_support = False
-
+        path = os.path.join(ngs_dir, study_file)
         # CNA Segment data
-        if study_file.split('.')[-1] == 'seg' and cbioportal_seg_hg38_support:
-            logger.debug('Transforming segment data: %s' % study_file)
-
-            output_file = 'data_cna_segments.seg'
-
-            # Read file and replace header
-            with open(os.path.join(ngs_dir, study_file)) as segment_file:
-                segment_lines = segment_file.readlines()
-                segment_lines[0] = 'ID	chrom	loc.start	loc.end	num.mark	seg.mean\n'
-
-            # Write a copy with replaced header
-            with open(os.path.join(output_dir, output_file), 'w') as segment_file:
-                segment_file.writelines(segment_lines)
-
-            # Create meta file
-            meta_filename = os.path.join(output_dir, 'meta_cna_segments.txt')
-            create_meta_content(meta_filename, cancer_study_identifier=STUDY_ID,
-                                genetic_alteration_type='COPY_NUMBER_ALTERATION', datatype='SEG',
-                                reference_genome_id='hg38', description='Segment data', data_filename=output_file)
-
+        if study_file.endswith(('.seg', '.seg.gz')) and CBIOPORTAL_SEG_HG38_SUPPORT:
+            cna_files[SEGMENTS].append(path)
         # CNA Continuous
         elif 'data_by_genes' in study_file:
-            logger.debug('Transforming continuous CNA data: %s' % study_file)
-
-            output_file = 'data_cna_continuous.txt'
-
-            # Read file
-            cna_data = pd.read_csv(os.path.join(ngs_dir, study_file), sep='\t', na_values=[''], dtype={'Gene ID': str})
-            # Remove column and rename column names
-            cna_data.drop('Cytoband', axis=1, inplace=True)
-            cna_data.rename(columns={'Gene Symbol': 'Hugo_Symbol', 'Gene ID': 'Entrez_Gene_Id'}, inplace=True)
-
-            # Remove negative Entrez IDs. This can lead to incorrect mapping in cBioPortal
-            for index, row in cna_data.iterrows():
-                if int(row['Entrez_Gene_Id']) < -1:
-                    cna_data.loc[index, 'Entrez_Gene_Id'] = ''
-            cna_data.to_csv(os.path.join(output_dir, output_file), sep='\t', index=False, header=True)
-
-            # Create meta file
-            meta_filename = os.path.join(output_dir, 'meta_cna_continuous.txt')
-            create_meta_content(meta_filename, cancer_study_identifier=STUDY_ID,
-                                genetic_alteration_type='COPY_NUMBER_ALTERATION', datatype='LOG2-VALUE',
-                                stable_id='log2CNA', show_profile_in_analysis_tab='false',
-                                profile_name='Copy-number alteration values',
-                                profile_description='Continuous copy-number alteration values for each gene.',
-                                data_filename=output_file)
-
-            # Create case list
-            cna_samples = cna_data.columns[2:].tolist()
-            create_caselist(output_dir=output_dir, file_name='cases_cna.txt', cancer_study_identifier=STUDY_ID,
-                            stable_id='%s_cna' % STUDY_ID, case_list_name='CNA samples',
-                            case_list_description='All CNA samples', case_list_category='all_cases_with_cna_data',
-                            case_list_ids="\t".join(cna_samples))
-
-            # Test for samples in CNA files that are not in clinical data
-            if not set(clinical_sample_ids).issuperset(set(cna_samples)):
-                logger.error("Found samples in CNA files that are not in clinical data: {}".format(
-                    ", ".join(set(cna_samples).difference(set(clinical_sample_ids))))
-                )
-                raise DataException('Found samples in CNA files that are not in clinical data')
-
+            cna_files[CONTINUOUS].append(path)
         # CNA Discrete
         elif 'thresholded.by_genes' in study_file:
-            logger.debug('Transforming discrete CNA data: %s' % study_file)
-
-            output_file = 'data_cna_discrete.txt'
-
-            # Read input file
-            cna_data = pd.read_csv(os.path.join(ngs_dir, study_file), sep='\t', na_values=[''], dtype={'Gene ID': str})
-            # Remove column and rename column names
-            cna_data.drop('Cytoband', axis=1, inplace=True)
-            cna_data.rename(columns={'Gene Symbol': 'Hugo_Symbol', 'Locus ID': 'Entrez_Gene_Id'}, inplace=True)
-
-            # Remove negative Entrez IDs. This can lead to incorrect mapping in cBioPortal
-            for index, row in cna_data.iterrows():
-                if int(row['Entrez_Gene_Id']) < -1:
-                    cna_data.loc[index, 'Entrez_Gene_Id'] = ''
-            cna_data.to_csv(os.path.join(output_dir, output_file), sep='\t', index=False, header=True)
-
-            # Create meta file
-            meta_filename = os.path.join(output_dir, 'meta_cna_discrete.txt')
-            profile_description = 'Putative copy-number alteration values for each gene from GISTIC 2.0.' \
-                                  'Values: -2 = homozygous deletion; -1 = hemizygous deletion;' \
-                                  '0 = neutral / no change; 1 = gain; 2 = high level amplification.'
-
-            create_meta_content(meta_filename, cancer_study_identifier=STUDY_ID,
-                                genetic_alteration_type='COPY_NUMBER_ALTERATION', datatype='DISCRETE',
-                                stable_id='gistic', show_profile_in_analysis_tab='true',
-                                profile_name='Putative copy-number alterations from GISTIC',
-                                profile_description=profile_description,
-                                data_filename=output_file)
+            cna_files[DISCRETE].append(path)
         elif study_file.split('.')[-2:] == ['maf', 'gz']:
             # Mutations file are transformed in an other loop
             pass
-
         else:
             logger.warning("Unknown file type: %s" % study_file)
+    return cna_files
+
+
+def write_segment_metadata(output_dir: str, study_id: str = STUDY_ID):
+    """Writes the meta file for the segment data"""
+    meta_filename = os.path.join(output_dir, 'meta_cna_segments.txt')
+    create_meta_content(meta_filename, cancer_study_identifier=study_id,
+                        genetic_alteration_type='COPY_NUMBER_ALTERATION', datatype='SEG',
+                        reference_genome_id='hg38', description='Segment data',
+                        data_filename=CNA_OUTPUTS[SEGMENTS][0])
+
+
+def write_continuous_cna_metadata(output_dir: str, cna_samples: Iterable[str], study_id: str = STUDY_ID):
+    """Writes the meta and case list files for the continuous CNA data"""
+    # Create meta file
+    meta_filename = os.path.join(output_dir, 'meta_cna_continuous.txt')
+    create_meta_content(meta_filename, cancer_study_identifier=study_id,
+                        genetic_alteration_type='COPY_NUMBER_ALTERATION', datatype='LOG2-VALUE',
+                        stable_id='log2CNA', show_profile_in_analysis_tab='false',
+                        profile_name='Copy-number alteration values',
+                        profile_description='Continuous copy-number alteration values for each gene.',
+                        data_filename=CNA_OUTPUTS[CONTINUOUS][0])
+
+    # Create case list
+    create_caselist(output_dir=output_dir, file_name='cases_cna.txt', cancer_study_identifier=study_id,
+                    stable_id='%s_cna' % study_id, case_list_name='CNA samples',
+                    case_list_description='All CNA samples', case_list_category='all_cases_with_cna_data',
+                    case_list_ids="\t".join(cna_samples))
+
+
+def write_discrete_cna_metadata(output_dir: str, study_id: str = STUDY_ID):
+    """Writes the meta file for the discrete CNA data"""
+    meta_filename = os.path.join(output_dir, 'meta_cna_discrete.txt')
+    profile_description = 'Putative copy-number alteration values for each gene from GISTIC 2.0.' \
+                          'Values: -2 = homozygous deletion; -1 = hemizygous deletion;' \
+                          '0 = neutral / no change; 1 = gain; 2 = high level amplification.'
+
+    create_meta_content(meta_filename, cancer_study_identifier=study_id,
+                        genetic_alteration_type='COPY_NUMBER_ALTERATION', datatype='DISCRETE',
+                        stable_id='gistic', show_profile_in_analysis_tab='true',
+                        profile_name='Putative copy-number alterations from GISTIC',
+                        profile_description=profile_description,
+                        data_filename=CNA_OUTPUTS[DISCRETE][0])
+
+
+def write_cna_metadata(cna_type: str, output_dir: str, cna_samples: Iterable[str], study_id: str = STUDY_ID):
+    """Writes the meta and case list files for a CNA data type"""
+    if cna_type == SEGMENTS:
+        write_segment_metadata(output_dir, study_id)
+    elif cna_type == CONTINUOUS:
+        write_continuous_cna_metadata(output_dir, cna_samples, study_id)
+    else:
+        write_discrete_cna_metadata(output_dir, study_id)
+
+
+@instrumented()
+def process_segment_files(study_files: List[str], output_dir: str) -> List[str]:
+    """
+    Copies segment data files (optionally gzip compressed) with a cBioPortal header and writes the meta file.
+    """
+    for study_file in study_files:
+        logger.debug('Transforming segment data: %s' % study_file)
+
+        # Write a copy with replaced header
+        transform_segment_file(study_file, os.path.join(output_dir, CNA_OUTPUTS[SEGMENTS][0]))
+        write_segment_metadata(output_dir)
+    return []
+
+
+@instrumented()
+def process_continuous_cna_files(study_files: List[str], output_dir: str) -> List[str]:
+    """
+    Transforms continuous CNA data files and writes the meta and case list files.
+    Returns the list of CNA sample identifiers.
+    """
+    cna_samples: List[str] = []
+    for study_file in study_files:
+        logger.debug('Transforming continuous CNA data: %s' % study_file)
+
+        cna_samples = transform_cna_file(study_file, os.path.join(output_dir, CNA_OUTPUTS[CONTINUOUS][0]),
+                                         value_dtype=CNA_VALUE_DTYPES[CONTINUOUS])
+        write_continuous_cna_metadata(output_dir, cna_samples)
     return cna_samples
 
 
-def create_cbioportal_study(input_dir: str, ngs_dir: Optional[str], output_dir: str):
-    prepare_output_directory(output_dir)
+@instrumented()
+def process_discrete_cna_files(study_files: List[str], output_dir: str) -> List[str]:
+    """
+    Transforms discrete CNA data files and writes the meta file.
+    Returns the list of CNA sample identifiers.
+    """
+    cna_samples: List[str] = []
+    for study_file in study_files:
+        logger.debug('Transforming discrete CNA data: %s' % study_file)
+
+        cna_samples = transform_cna_file(study_file, os.path.join(output_dir, CNA_OUTPUTS[DISCRETE][0]),
+                                         value_dtype=CNA_VALUE_DTYPES[DISCRETE])
+        write_discrete_cna_metadata(output_dir)
+    return cna_samples
 
-    logger.info('Reading clinical data: %s' % input_dir)
-    clinical_sample_ids = process_clinical_data(input_dir, output_dir)
 
-    if ngs_dir:
-        logger.info('Reading NGS data: %s' % ngs_dir)
-        mutation_samples = process_mutation_data(ngs_dir, output_dir, clinical_sample_ids)
-        cna_samples = process_cna_files(ngs_dir, output_dir, clinical_sample_ids)
+def write_cnaseq_caselist(output_dir: str, cnaseq_samples: Iterable[str], study_id: str = STUDY_ID):
+    """Writes the case list of the samples with mutation or CNA data, or removes it if there are none"""
+    cnaseq_samples = list(cnaseq_samples)
+    if len(cnaseq_samples) > 0:
+        create_caselist(output_dir=output_dir, file_name='cases_cnaseq.txt', cancer_study_identifier=study_id,
+                        stable_id='%s_cnaseq' % study_id, case_list_name='Sequenced and CNA samples',
+                        case_list_description='All sequenced and CNA samples',
+                        case_list_category='all_cases_with_mutation_and_cna_data',
+                        case_list_ids="\t".join(cnaseq_samples))
+    elif os.path.exists(os.path.join(output_dir, 'case_lists', 'cases_cnaseq.txt')):
+        os.remove(os.path.join(output_dir, 'case_lists', 'cases_cnaseq.txt'))
 
-        # Create cnaseq case list
-        cnaseq_samples = list(mutation_samples.union(cna_samples))
-        if len(cnaseq_samples) > 0:
-            create_caselist(output_dir=output_dir, file_name='cases_cnaseq.txt', cancer_study_identifier=STUDY_ID,
-                            stable_id='%s_cnaseq' % STUDY_ID, case_list_name='Sequenced and CNA samples',
-                            case_list_description='All sequenced and CNA samples',
-                            case_list_category='all_cases_with_mutation_and_cna_data',
-                            case_list_ids="\t".join(cnaseq_samples))
 
-    # Create meta study file
+def write_study_metadata(output_dir: str, study_id: str = STUDY_ID, name: str = NAME, short_name: str = NAME_SHORT):
+    """Writes the meta study file"""
     meta_filename = os.path.join(output_dir, 'meta_study.txt')
-    create_meta_content(meta_filename, STUDY_ID, type_of_cancer=TYPE_OF_CANCER, name=NAME, short_name=NAME_SHORT,
+    create_meta_content(meta_filename, study_id, type_of_cancer=TYPE_OF_CANCER, name=name, short_name=short_name,
                         description=DESCRIPTION, add_global_case_list='true')
 
+
+def create_cbioportal_study(input_dir: Optional[str], ngs_dir: Optional[str], output_dir: str,
+                            maf_filter: Optional[MafFilter] = None, incremental: bool = False,
+                            workers: Optional[int] = None,
+                            subject_registry: Optional[CentralSubjectRegistry] = None):
+    """
+    Transforms the CSR data in input_dir and the NGS data in ngs_dir to a cBioPortal study in output_dir.
+    The clinical data, mutation data and CNA data types are transformed concurrently in worker processes.
+    In incremental mode, the output directory is not cleared and only the outputs
+    of which the input files have changed since the previous incremental run are regenerated.
+    If a subject registry is passed, it is used instead of reading the CSR data from input_dir.
+    """
+    if subject_registry is not None and incremental:
+        raise ValueError('Incremental mode requires reading the CSR data from the input directory')
+    if incremental:
+        os.makedirs(output_dir, exist_ok=True)
+    else:
+        prepare_output_directory(output_dir)
+    build = IncrementalBuild(output_dir, incremental, workers)
+
+    with StageScheduler(build, workers) as scheduler:
+        if subject_registry is not None:
+            scheduler.submit('clinical', [], CLINICAL_OUTPUTS, write_clinical_files, subject_registry, output_dir)
+        else:
+            logger.info('Reading clinical data: %s' % input_dir)
+            if not os.path.isdir(input_dir):
+                raise ReaderException('Input directory not found: {}'.format(input_dir))
+            clinical_files = [os.path.join(input_dir, input_file) for input_file in sorted(os.listdir(input_dir))
+                              if not input_file.startswith('.')
+                              and os.path.isfile(os.path.join(input_dir, input_file))]
+            scheduler.submit('clinical', clinical_files, CLINICAL_OUTPUTS, process_clinical_data,
+                             input_dir, output_dir)
+
+        cna_files: Dict[str, List[str]] = {}
+        if ngs_dir:
+            logger.info('Reading NGS data: %s' % ngs_dir)
+            maf_files = get_paths_to_non_hidden_maf_gz_files(ngs_dir)
+            cna_files = get_cna_files(ngs_dir)
+            build.verify_inputs(maf_files + [path for paths in cna_files.values() for path in paths])
+            for cna_type, process_files in [(SEGMENTS, process_segment_files),
+                                            (CONTINUOUS, process_continuous_cna_files),
+                                            (DISCRETE, process_discrete_cna_files)]:
+                if cna_files[cna_type]:
+                    scheduler.submit('cna_' + cna_type, cna_files[cna_type], CNA_OUTPUTS[cna_type],
+                                     process_files, cna_files[cna_type], output_dir)
+            if maf_files:
+                # The MAF files are read by jobs on the workers of the scheduler, after the other stages
+                scheduler.submit('mutations', maf_files, MUTATION_OUTPUTS, process_mutation_data,
+                                 ngs_dir, output_dir, None, maf_filter, 1, scheduler.executor,
+                                 parameters=get_parameters(maf_filter), in_main_process=True)
+
+        clinical_sample_ids = scheduler.result('clinical')
+
+        if ngs_dir:
+            mutation_samples: Set[str] = set()
+            if scheduler.is_submitted('mutations'):
+                mutation_samples = set(scheduler.result('mutations'))
+                # Test for samples in MAF files that are not in clinical data
+                check_samples_in_clinical_data(mutation_samples, clinical_sample_ids, 'MAF')
+
+            # Create sample list, required for cnaseq case list
+            cna_samples: List[str] = []
+            if scheduler.is_submitted('cna_' + CONTINUOUS):
+                cna_samples = scheduler.result('cna_' + CONTINUOUS)
+                # Test for samples in CNA files that are not in clinical data
+                check_samples_in_clinical_data(cna_samples, clinical_sample_ids, 'CNA')
+            for cna_type in [SEGMENTS, DISCRETE]:
+                if scheduler.is_submitted('cna_' + cna_type):
+                    scheduler.result('cna_' + cna_type)
+
+            # Create cnaseq case list
+            write_cnaseq_caselist(output_dir, mutation_samples.union(cna_samples))
+
+        build.remove_stale_stages(scheduler.stages)
+
+    write_study_metadata(output_dir)
+
     logger.info('Done transforming files for %s' % STUDY_ID)
 
     # Transformation completed
@@ -265,14 +400,196 @@ def create_cbioportal_study(input_dir: str, ngs_dir: Optional[str], output_dir:
     return
 
 
-def combine_maf(ngs_dir, output_file_location):
+def get_cbioportal_study_id(study_id: str) -> str:
+    """Derive a cBioPortal study identifier from a study id, with lower case letters, digits and underscores"""
+    return re.sub(r'[^a-z0-9_]', '_', study_id.lower())
+
+
+def check_unassigned_samples(samples: Iterable[str], clinical_sample_ids: List[str], data_type: str):
+    """
+    Raises an exception when any of the samples is not in the clinical_sample_ids list.
+    The remaining samples belong to individuals that are not linked to a study and are reported.
+    """
+    samples = set(samples)
+    check_samples_in_clinical_data(samples, clinical_sample_ids, data_type)
+    if samples:
+        logger.warning('Skipping samples in {} files of individuals without study: {}'.format(
+            data_type, ', '.join(sorted(samples))))
+
+
+def process_partitioned_mutation_data(ngs_dir: str, study_dirs: Dict[str, str], study_ids: Dict[str, str],
+                                      sample_partitions: Mapping[str, Sequence[str]],
+                                      maf_filter: Optional[MafFilter] = None,
+                                      workers: Optional[int] = None,
+                                      executor: Optional[Executor] = None) -> Dict[Optional[str], Set[str]]:
+    """
+    Reads data from all MAF files in ngs_dir and splits the rows by sample into a mutation data file per study.
+    Writes the meta and caselist files of the studies with mutation data.
+    :param ngs_dir: directory with NGS files
+    :param study_dirs: output directory of each study
+    :param study_ids: cBioPortal study identifier of each study
+    :param sample_partitions: the studies of each sample
+    :param maf_filter: selection of columns and variants, all are kept by default
+    :param workers: maximum number of worker processes, defaults to the number of processors
+    :param executor: executor to run the jobs that read the MAF files on, instead of a new pool of workers
+    :return: the samples of each study, samples without study under None
+    """
+    mutation_samples = split_maf(ngs_dir,
+                                 {study: os.path.join(study_dir, 'data_mutations.maf')
+                                  for study, study_dir in study_dirs.items()},
+                                 sample_partitions, workers=workers, maf_filter=maf_filter, executor=executor)
+    for study, samples in mutation_samples.items():
+        if study is not None and samples:
+            write_mutation_metadata(study_dirs[study], samples, study_ids[study])
+    return mutation_samples
+
+
+@instrumented()
+def process_partitioned_cna_files(cna_type: str, study_files: List[str], study_dirs: Dict[str, str],
+                                  study_ids: Dict[str, str],
+                                  sample_partitions: Mapping[str, Sequence[str]]) -> Dict[Optional[str], List[str]]:
+    """
+    Splits CNA data files of a type (segments, continuous or discrete) by sample into a data file per study.
+    Writes the meta and case list files of the studies with CNA data.
+    :return: the samples of each study, samples without study under None
+    """
+    cna_samples: Dict[Optional[str], List[str]] = {}
+    for study_file in study_files:
+        logger.debug('Splitting {} CNA data: {}'.format(cna_type, study_file))
+        output_paths = {study: os.path.join(study_dir, CNA_OUTPUTS[cna_type][0])
+                        for study, study_dir in study_dirs.items()}
+        if cna_type == SEGMENTS:
+            cna_samples = split_segment_file(study_file, output_paths, sample_partitions)
+        else:
+            cna_samples = split_cna_file(study_file, output_paths, sample_partitions, CNA_VALUE_DTYPES[cna_type])
+        for study, samples in cna_samples.items():
+            if study is not None and samples:
+                write_cna_metadata(cna_type, study_dirs[study], samples, study_ids[study])
+    return cna_samples
+
+
+def create_cbioportal_studies(input_dir: Optional[str], ngs_dir: Optional[str], output_dir: str,
+                              maf_filter: Optional[MafFilter] = None, workers: Optional[int] = None,
+                              subject_registry: Optional[CentralSubjectRegistry] = None,
+                              study_registry: Optional[StudyRegistry] = None):
+    """
+    Transforms the CSR data in input_dir and the NGS data in ngs_dir to a cBioPortal study per study
+    in the study registry. The studies are written to subdirectories of output_dir,
+    named after their cBioPortal study identifier.
+    The registry is read once and partitioned by the links of individuals to studies.
+    The clinical data of the studies are transformed concurrently in worker processes,
+    then the mutation and CNA data files are split by sample while they are read, also in worker processes.
+    Individuals that are not linked to any study are skipped.
+    If registries are passed, they are used instead of reading the CSR data from input_dir.
+    """
+    from csr.study_partition import partition_by_study
+    from .transform_clinical import get_sample_ids
+
+    prepare_output_directory(output_dir)
+
+    if subject_registry is None:
+        logger.info('Reading clinical data: %s' % input_dir)
+        subject_registry = SubjectRegistryReader(input_dir).read_subject_registry()
+    if study_registry is None:
+        study_registry = StudyRegistryReader(input_dir).read_study_registry()
+    studies: Dict[str, Study] = {study.study_id: study for study in study_registry.entity_data.get('Study', [])}
+    study_registries: Dict[str, CentralSubjectRegistry] = {}
+    for study, registry in partition_by_study(subject_registry, study_registry).items():
+        if registry.entity_data.get('Individual'):
+            study_registries[study] = registry
+        else:
+            logger.warning('Skipping study {} without individuals'.format(study))
+    study_ids = {study: get_cbioportal_study_id(study) for study in study_registries}
+    if len(set(study_ids.values())) < len(study_ids):
+        raise DataException('Multiple studies have the same cBioPortal study identifier: {}'.format(
+            ', '.join(sorted(study_ids))))
+    study_dirs = {study: os.path.join(output_dir, study_id) for study, study_id in study_ids.items()}
+    for study_dir in study_dirs.values():
+        os.makedirs(study_dir)
+
+    mutation_samples: Dict[Optional[str], Set[str]] = {}
+    cna_samples: Dict[Optional[str], List[str]] = {}
+    with StageScheduler(IncrementalBuild(output_dir, False), workers) as scheduler:
+        clinical_futures = {study: scheduler.run(write_clinical_files, registry, study_dirs[study], study_ids[study])
+                            for study, registry in study_registries.items()}
+        sample_partitions: Dict[str, List[str]] = {}
+        for study, future in clinical_futures.items():
+            for sample in future.result():
+                sample_partitions.setdefault(sample, []).append(study)
+
+        if ngs_dir:
+            logger.info('Reading NGS data: %s' % ngs_dir)
+            clinical_sample_ids = get_sample_ids(subject_registry)
+            cna_futures = {cna_type: scheduler.run(process_partitioned_cna_files, cna_type, study_files,
+                                                   study_dirs, study_ids, sample_partitions)
+                           for cna_type, study_files in get_cna_files(ngs_dir).items() if study_files}
+            # The MAF files are read by jobs on the workers of the scheduler, after the CNA jobs
+            mutation_samples = process_partitioned_mutation_data(ngs_dir, study_dirs, study_ids, sample_partitions,
+                                                                 maf_filter, 1, scheduler.executor)
+            # Test for samples in MAF files that are not in clinical data
+            check_unassigned_samples(mutation_samples.get(None, set()), clinical_sample_ids, 'MAF')
+            for cna_type, future in cna_futures.items():
+                if cna_type == CONTINUOUS:
+                    cna_samples = future.result()
+                    # Test for samples in CNA files that are not in clinical data
+                    check_unassigned_samples(cna_samples.get(None, []), clinical_sample_ids, 'CNA')
+                else:
+                    future.result()
+
+    for study, study_id in study_ids.items():
+        if ngs_dir:
+            # Create cnaseq case list
+            write_cnaseq_caselist(study_dirs[study],
+                                  mutation_samples.get(study, set()).union(cna_samples.get(study, [])), study_id)
+        write_study_metadata(study_dirs[study], study_id,
+                             name=studies[study].title or study, short_name=studies[study].acronym or study)
+        logger.info('Done transforming files for %s' % study_id)
+
+    # Transformation completed
+    logger.info('Transformation of studies complete.')
+
+
+def combine_maf(ngs_dir, output_file_location, workers: Optional[int] = None, maf_filter: Optional[MafFilter] = None,
+                executor: Optional[Executor] = None):
     """
-    combines all found NGS files in one. It filters out variants without hugo symbol.
+    combines all found NGS files in one.
+    The columns and variants in the result file can be selected with a filter,
+    e.g., to skip variants without hugo symbol.
+    Only the headers of the files are read to determine the columns of the result file.
+    The rows of the files are then transformed to these columns in parallel
+    and appended to the result file in the order of the files.
     :param ngs_dir: directory with NGS files
     :param output_file_location: the result NGS file
+    :param workers: maximum number of worker processes, defaults to the number of processors
+    :param maf_filter: selection of columns and variants, all are kept by default
+    :param executor: executor to run the jobs that read the files on, instead of a new pool of workers
     :return: unique list of samples in the result file
     """
-    samples = set()
+    return split_maf(ngs_dir, {'': output_file_location}, None, workers, maf_filter, executor).get('', set())
+
+
+@instrumented()
+def split_maf(ngs_dir: str,
+              output_file_locations: Dict[str, str],
+              sample_partitions: Optional[Mapping[str, Sequence[str]]],
+              workers: Optional[int] = None,
+              maf_filter: Optional[MafFilter] = None,
+              executor: Optional[Executor] = None) -> Dict[Optional[str], Set[str]]:
+    """
+    Combines all found NGS files and splits the rows by sample over multiple result files (see combine_maf).
+    The files are read once, every row is written to the result files of the partitions of its sample.
+    Only partitions with samples are written, unless sample_partitions is None.
+    :param ngs_dir: directory with NGS files
+    :param output_file_locations: the result NGS file of each partition
+    :param sample_partitions: the partitions of each sample, if None all rows are written to all result files
+    :param workers: maximum number of worker processes, defaults to the number of processors
+    :param maf_filter: selection of columns and variants, all are kept by default
+    :param executor: executor to run the jobs that read the files on, e.g., shared with other stages,
+        instead of a new pool of workers
+    :return: the samples of each partition, samples without partition under None
+    """
+    samples: Dict[Optional[str], Set[str]] = {partition: set() for partition in output_file_locations}
+    samples[None] = set()
 
     paths_to_process = get_paths_to_non_hidden_maf_gz_files(ngs_dir)
 
@@ -280,21 +597,112 @@ def combine_maf(ngs_dir, output_file_location):
         return samples
 
     header = get_complete_header(paths_to_process)
+    if maf_filter is not None:
+        header = maf_filter.select_columns(header)
 
     if not header:
         return samples
 
-    with open(output_file_location, 'w') as result_maf:
-        writer = csv.DictWriter(result_maf, delimiter='\t', fieldnames=header)
-        writer.writeheader()
-        for study_file in paths_to_process:
-            logger.debug('Processing NGS data file: {}'.format(study_file))
-            with gzip.open(study_file, 'rt') as file:
-                reader = csv.DictReader(not_commented_lines(file), delimiter='\t')
-                for row in reader:
-                    samples.add(row['Tumor_Sample_Barcode'])
-                    writer.writerow(row)
-        return samples
+    part_paths: List[Dict[str, str]] = []
+    try:
+        for _ in paths_to_process:
+            file_part_paths = {}
+            part_paths.append(file_part_paths)
+            for partition, output_file_location in output_file_locations.items():
+                output_dir = os.path.dirname(os.path.abspath(output_file_location))
+                part_file, file_part_paths[partition] = tempfile.mkstemp(prefix='.maf_part_', dir=output_dir)
+                os.close(part_file)
+        if executor is not None:
+            file_samples = list(map(collect, executor.map(in_worker(split_maf_file), paths_to_process,
+                                                          repeat(header), part_paths, repeat(sample_partitions),
+                                                          repeat(maf_filter))))
+        elif len(paths_to_process) == 1 or workers == 1:
+            file_samples = list(map(split_maf_file, paths_to_process, repeat(header), part_paths,
+                                    repeat(sample_partitions), repeat(maf_filter)))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                file_samples = list(map(collect, executor.map(in_worker(split_maf_file), paths_to_process,
+                                                              repeat(header), part_paths, repeat(sample_partitions),
+                                                              repeat(maf_filter))))
+
+        for part_samples in file_samples:
+            for partition, partition_samples in part_samples.items():
+                samples[partition].update(partition_samples)
+        for partition, output_file_location in output_file_locations.items():
+            if sample_partitions is not None and not samples[partition]:
+                continue
+            with open(output_file_location, 'w') as result_maf:
+                csv.writer(result_maf, delimiter='\t').writerow(header)
+            with open(output_file_location, 'ab') as result_maf:
+                for file_part_paths in part_paths:
+                    with open(file_part_paths[partition], 'rb') as part_file:
+                        shutil.copyfileobj(part_file, result_maf)
+    finally:
+        for file_part_paths in part_paths:
+            for part_path in file_part_paths.values():
+                os.remove(part_path)
+    return samples
+
+
+def split_maf_file(study_file: str, header: List[str], output_paths: Dict[str, str],
+                   sample_partitions: Optional[Mapping[str, Sequence[str]]],
+                   maf_filter: Optional[MafFilter] = None) -> Dict[Optional[str], Set[str]]:
+    """
+    Writes the rows of a MAF file with the columns of the combined header to the files
+    of the partitions of the sample of the row (see split_maf).
+    :param study_file: path to the gzipped MAF file
+    :param header: columns of the combined file
+    :param output_paths: paths of the files to write the rows of each partition to, without header
+    :param sample_partitions: the partitions of each sample, if None all rows are written to all files
+    :param maf_filter: variant filter
+    :return: the samples of each partition, samples without partition under None
+    """
+    logger.debug('Processing NGS data file: {}'.format(study_file))
+    samples: Dict[Optional[str], Set[str]] = {partition: set() for partition in output_paths}
+    samples[None] = set()
+    with stage('split_maf_file') as current, gzip.open(study_file, 'rt') as file, ExitStack() as stack:
+        reader = csv.reader(not_commented_lines(file), delimiter='\t')
+        file_header = next(reader, [])
+        # The last column with a name contains the value, as with csv.DictReader
+        positions = {column: position for position, column in enumerate(file_header)}
+        column_positions = [positions.get(column, -1) for column in header]
+        sample_position = positions.get('Tumor_Sample_Barcode')
+        filter_rows = maf_filter is not None and maf_filter.filters_rows()
+        writers = {partition: csv.writer(stack.enter_context(open(output_path, 'w')), delimiter='\t')
+                   for partition, output_path in output_paths.items()}
+        all_partitions = list(output_paths)
+        row_partitions: Dict[Optional[str], List[str]] = {}
+        rows_in = 0
+        rows_out = 0
+        for row in reader:
+            if not row:
+                continue
+            rows_in += 1
+            if len(row) > len(file_header):
+                raise DataException('Row with more values than columns in {}: {}'.format(study_file, row))
+            if sample_position is None:
+                raise DataException('Column Tumor_Sample_Barcode missing in {}'.format(study_file))
+            if filter_rows and not maf_filter.include_row(row, positions):
+                continue
+            sample = row[sample_position] if sample_position < len(row) else None
+            if sample_partitions is None:
+                partitions = all_partitions
+            else:
+                partitions = row_partitions.get(sample)
+                if partitions is None:
+                    partitions = [partition for partition in sample_partitions.get(sample, []) if partition in writers]
+                    row_partitions[sample] = partitions
+                if not partitions:
+                    samples[None].add(sample)
+                    continue
+            values = [row[position] if 0 <= position < len(row) else '' for position in column_positions]
+            for partition in partitions:
+                samples[partition].add(sample)
+                writers[partition].writerow(values)
+            rows_out += 1
+        current.rows_in = rows_in
+        current.rows_out = rows_out
+    return samples
 
 
 def not_commented_lines(iter):
@@ -322,24 +730,75 @@ def get_complete_header(paths_to_process):
     return fieldnames
 
 
-def csr2cbioportal(input_dir: str, ngs_dir: Optional[str], output_dir: str):
+def csr2cbioportal(input_dir: Optional[str], ngs_dir: Optional[str], output_dir: str,
+                   maf_filter: Optional[MafFilter] = None, incremental: bool = False, workers: Optional[int] = None,
+                   per_study: bool = False, subject_registry: Optional[CentralSubjectRegistry] = None,
+                   study_registry: Optional[StudyRegistry] = None):
+    """
+    Writes a cBioPortal study, or a study per study in the study registry, from the CSR files and NGS data.
+    Registries that are passed are used instead of reading them from input_dir.
+
+    :param input_dir: directory with the CSR files, if the registries are not passed
+    :param ngs_dir: directory with NGS files
+    :param output_dir: output directory of the study
+    :param maf_filter: the MAF columns and variants to keep
+    :param incremental: only regenerate outputs of which the inputs have changed
+    :param workers: maximum number of worker processes, defaults to the number of processors
+    :param per_study: write a study per study in the study registry
+    :param subject_registry: the subject registry
+    :param study_registry: the study registry, only used per study
+    :raises CsrException: if the data is missing or invalid
+    """
     logger.info('csr2cbioportal')
-    try:
-        create_cbioportal_study(input_dir, ngs_dir, output_dir)
-    except Exception as e:
-        logger.error(e)
-        sys.exit(1)
+    if per_study:
+        create_cbioportal_studies(input_dir, ngs_dir, output_dir, maf_filter, workers, subject_registry,
+                                  study_registry)
+    else:
+        create_cbioportal_study(input_dir, ngs_dir, output_dir, maf_filter, incremental, workers, subject_registry)
 
 
 @click.command()
 @click.argument('input_dir', type=click.Path(file_okay=False, exists=True, readable=True))
 @click.argument('output_dir', type=click.Path(file_okay=False, writable=True))
 @click.option('--ngs-dir', type=click.Path(file_okay=False, exists=True, readable=True))
+@click.option('--maf-columns', help='Comma separated list of MAF columns to keep (default: all columns)')
+@click.option('--skip-empty-hugo-symbol', is_flag=True, help='Skip variants without Hugo_Symbol')
+@click.option('--exclude-variant-classification', multiple=True,
+              help='Skip variants with this Variant_Classification, can be specified multiple times')
+@click.option('--incremental', is_flag=True,
+              help='Keep the output directory and only regenerate outputs of which the inputs have changed')
+@click.option('--workers', type=click.IntRange(min=1),
+              help='Maximum number of worker processes (default: the number of processors)')
+@click.option('--per-study', is_flag=True,
+              help='Write a cBioPortal study for every study in the study registry, '
+                   'in subdirectories of the output directory')
+@click.option('--report', type=click.Path(dir_okay=False, writable=True),
+              help='Write a JSON report with the time, rows and memory use of the stages of the run to this file')
+@click.option('--profile', type=click.Choice(PROFILERS),
+              help='Profile the run with cProfile or take tracemalloc snapshots at the stage boundaries')
+@click.option('--profile-dir', type=click.Path(file_okay=False, writable=True), default='.', show_default=True,
+              help='Directory to write the profile files to')
 @click.option('--debug', is_flag=True, help='Print more verbose messages')
 @click.version_option()
-def run(input_dir, ngs_dir, output_dir, debug: bool):
+def run(input_dir, ngs_dir, output_dir, maf_columns: Optional[str], skip_empty_hugo_symbol: bool,
+        exclude_variant_classification: Sequence[str], incremental: bool, workers: Optional[int], per_study: bool,
+        report: Optional[str], profile: Optional[str], profile_dir: str, debug: bool):
+    if per_study and incremental:
+        raise click.UsageError('--per-study cannot be combined with --incremental')
     setup_logging(debug)
-    csr2cbioportal(input_dir, ngs_dir, output_dir)
+    try:
+        maf_filter = MafFilter(
+            columns=[column.strip() for column in maf_columns.split(',')] if maf_columns else None,
+            skip_empty_hugo_symbol=skip_empty_hugo_symbol,
+            excluded_variant_classifications=set(exclude_variant_classification))
+    except ValidationError as e:
+        raise click.BadParameter('; '.join(error['msg'] for error in e.errors()), param_hint="'--maf-columns'")
+    with run_report(report, 'csr2cbioportal'), profile_run(profile, profile_dir, 'csr2cbioportal'):
+        try:
+            csr2cbioportal(input_dir, ngs_dir, output_dir, maf_filter, incremental, workers, per_study)
+        except Exception as e:
+            logger.error(e)
+            sys.exit(1)
 
 
 def main():
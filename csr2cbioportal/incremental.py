@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from csr.exceptions import DataException
+
+logger = logging.getLogger(__name__)
+
+# Name of the manifest file in the output directory
+MANIFEST_FILE = '.csr2cbioportal_manifest.json'
+# Suffix of the checksum files that accompany the NGS data files
+CHECKSUM_SUFFIX = '.sha1'
+
+
+class StageRecord(BaseModel):
+    """
+    The input checksums, parameters, output files and samples of a completed stage.
+    Output file paths are relative to the output directory.
+    """
+    inputs: Dict[str, str]
+    parameters: str = ''
+    outputs: List[str]
+    samples: List[str]
+
+
+class Manifest(BaseModel):
+    stages: Dict[str, StageRecord] = {}
+
+
+def compute_checksum(path: str) -> str:
+    """Compute the SHA-1 checksum of a file"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def read_checksum_file(path: str) -> Optional[str]:
+    """Read the checksum from the .sha1 file of a data file, if available.
+    The checksum file has the format of sha1sum: '<checksum>  <file name>'.
+    """
+    checksum_path = path + CHECKSUM_SUFFIX
+    if not os.path.isfile(checksum_path):
+        return None
+    with open(checksum_path) as checksum_file:
+        fields = checksum_file.read().split()
+    return fields[0].lower() if fields else None
+
+
+def verify_checksum(path: str) -> str:
+    """Compute the checksum of a file and compare it with the checksum in its .sha1 file.
+    :raises DataException: if the checksums do not match
+    """
+    checksum = compute_checksum(path)
+    expected_checksum = read_checksum_file(path)
+    if expected_checksum is not None and expected_checksum != checksum:
+        raise DataException('Checksum of {} does not match {}{}'.format(path, os.path.basename(path), CHECKSUM_SUFFIX))
+    return checksum
+
+
+def get_checksums(paths: Sequence[str], workers: Optional[int] = None) -> Dict[str, str]:
+    """Compute and verify the checksums of files in parallel
+    :param paths: paths of the files
+    :param workers: maximum number of threads
+    :return: dictionary from path to checksum
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(verify_checksum, paths)))
+
+
+class IncrementalBuild:
+    """
+    Runs the stages of the transformation, skipping stages of which the inputs have not changed.
+
+    The checksums of the inputs and the outputs of every stage are kept in a manifest file
+    in the output directory. A stage is run again if its input files or parameters have changed,
+    or if any of its outputs is missing. Outputs of stages that have no inputs anymore are removed.
+    If the build is not enabled, all stages are run and no manifest is written.
+    """
+
+    def __init__(self, output_dir: str, enabled: bool, workers: Optional[int] = None):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.workers = workers
+        self.manifest = Manifest()
+        self.checksums: Dict[str, str] = {}
+        # Input checksums and parameters of the stages that are running
+        self.pending: Dict[str, Tuple[Dict[str, str], str]] = {}
+        manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        if enabled and os.path.isfile(manifest_path):
+            self.manifest = Manifest.parse_file(manifest_path)
+
+    def write_manifest(self):
+        if self.enabled:
+            with open(os.path.join(self.output_dir, MANIFEST_FILE), 'w') as manifest_file:
+                manifest_file.write(self.manifest.json(indent=2))
+
+    def verify_inputs(self, paths: Sequence[str]):
+        """Compute and verify the checksums of the input files of all stages in parallel"""
+        if self.enabled:
+            self.checksums.update(get_checksums([path for path in paths if path not in self.checksums],
+                                                self.workers))
+
+    def is_up_to_date(self, stage: str, inputs: Dict[str, str], parameters: str) -> bool:
+        record = self.manifest.stages.get(stage)
+        return record is not None \
+            and record.inputs == inputs \
+            and record.parameters == parameters \
+            and all(os.path.exists(os.path.join(self.output_dir, output)) for output in record.outputs)
+
+    def remove_stage(self, stage: str):
+        """Remove the outputs of a stage and its record in the manifest"""
+        record = self.manifest.stages.pop(stage, None)
+        if record is None:
+            return
+        for output in record.outputs:
+            output_path = os.path.join(self.output_dir, output)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        self.write_manifest()
+
+    def start_stage(self, stage: str, input_paths: Sequence[str], parameters: str = '') -> Optional[List[str]]:
+        """Check if a stage needs to run. If so, the outputs of the previous run of the stage are removed.
+        :param stage: name of the stage
+        :param input_paths: paths of the input files of the stage
+        :param parameters: parameters of the stage that affect the outputs
+        :return: the samples in the outputs of the previous run if the stage is up to date, None otherwise
+        """
+        if not self.enabled:
+            return None
+        self.verify_inputs(input_paths)
+        inputs = {os.path.basename(path): self.checksums[path] for path in input_paths}
+        if self.is_up_to_date(stage, inputs, parameters):
+            logger.info('Inputs of {} have not changed, skipping'.format(stage))
+            return self.manifest.stages[stage].samples
+        self.remove_stage(stage)
+        self.pending[stage] = (inputs, parameters)
+        return None
+
+    def finish_stage(self, stage: str, outputs: Iterable[str], samples: Iterable[str]):
+        """Record the outputs of a completed stage in the manifest
+        :param stage: name of the stage
+        :param outputs: paths of the files the stage may have created, relative to the output directory
+        :param samples: the samples in the outputs of the stage
+        """
+        if not self.enabled:
+            return
+        inputs, parameters = self.pending.pop(stage)
+        self.manifest.stages[stage] = StageRecord(
+            inputs=inputs,
+            parameters=parameters,
+            outputs=[output for output in outputs if os.path.exists(os.path.join(self.output_dir, output))],
+            samples=list(samples))
+        self.write_manifest()
+
+    def run_stage(self,
+                  stage: str,
+                  input_paths: Sequence[str],
+                  outputs: Iterable[str],
+                  run: Callable[[], Iterable[str]],
+                  parameters: str = '') -> List[str]:
+        """Run a stage, unless the outputs of a previous run of the stage with the same inputs are available
+        :param stage: name of the stage
+        :param input_paths: paths of the input files of the stage
+        :param outputs: paths of the files the stage may create, relative to the output directory
+        :param run: function that runs the stage and returns the samples in its outputs
+        :param parameters: parameters of the stage that affect the outputs
+        :return: the samples in the outputs of the stage
+        """
+        samples = self.start_stage(stage, input_paths, parameters)
+        if samples is None:
+            samples = list(run())
+            self.finish_stage(stage, outputs, samples)
+        return samples
+
+    def remove_stale_stages(self, stages: Iterable[str]):
+        """Remove the outputs of stages of a previous run that are not part of the current run"""
+        for stage in set(self.manifest.stages).difference(stages):
+            logger.info('Removing outputs of {}'.format(stage))
+            self.remove_stage(stage)
+
+
+def get_parameters(value: Optional[BaseModel]) -> str:
+    """Serialize stage parameters for comparison with a previous run"""
+    return '' if value is None else json.dumps(value.dict(), sort_keys=True, default=sorted)
@@ -0,0 +1,55 @@
+from typing import Optional, Sequence, Set, List, Dict
+
+from pydantic import BaseModel, validator
+
+from csr.exceptions import DataException
+
+# Columns that cBioPortal needs and that are used to check the samples of the variants
+REQUIRED_MAF_COLUMNS = ['Tumor_Sample_Barcode', 'Hugo_Symbol']
+
+
+class MafFilter(BaseModel):
+    """
+    Selection of the columns and variants written to the combined mutation data file.
+    If no columns are specified, all columns of the MAF files are kept.
+    Rows are skipped if the Hugo_Symbol is empty (if skip_empty_hugo_symbol is set)
+    or if the Variant_Classification is one of the excluded classifications.
+    """
+    columns: Optional[List[str]] = None
+    skip_empty_hugo_symbol: bool = False
+    excluded_variant_classifications: Set[str] = set()
+
+    @validator('columns')
+    def check_required_columns(cls, columns):
+        if columns is not None:
+            missing = [column for column in REQUIRED_MAF_COLUMNS if column not in columns]
+            if missing:
+                raise ValueError(f'Required MAF columns missing: {", ".join(missing)}')
+        return columns
+
+    def select_columns(self, header: Sequence[str]) -> List[str]:
+        """Select the columns to keep from the combined header, in the configured order
+        :raises DataException: if a selected column is not in the header
+        """
+        if self.columns is None:
+            return list(header)
+        unknown = [column for column in self.columns if column not in header]
+        if unknown:
+            raise DataException(f'MAF columns not found in the NGS files: {", ".join(unknown)}')
+        return list(self.columns)
+
+    def filters_rows(self) -> bool:
+        return self.skip_empty_hugo_symbol or bool(self.excluded_variant_classifications)
+
+    def include_row(self, row: Sequence[str], positions: Dict[str, int]) -> bool:
+        """Check if a row of a MAF file passes the variant filters
+        :param row: values of the row
+        :param positions: positions of the columns of the MAF file
+        """
+        def get_value(column: str) -> str:
+            position = positions.get(column)
+            return row[position] if position is not None and position < len(row) else ''
+
+        if self.skip_empty_hugo_symbol and not get_value('Hugo_Symbol').strip():
+            return False
+        return get_value('Variant_Classification') not in self.excluded_variant_classifications
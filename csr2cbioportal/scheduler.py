@@ -0,0 +1,129 @@
+import logging
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from csr.instrumentation import collect, in_worker, is_recording
+from .incremental import IncrementalBuild
+
+logger = logging.getLogger(__name__)
+
+
+def collected(future: Future) -> Future:
+    """Future of the result of a function that runs in a worker, of which the recorded stages are collected
+    when it completes (see csr.instrumentation.in_worker)
+    """
+    result: Future = Future()
+
+    def done(submitted: Future):
+        if submitted.cancelled():
+            result.cancel()
+        elif submitted.exception() is not None:
+            result.set_exception(submitted.exception())
+        else:
+            result.set_result(collect(submitted.result()))
+
+    future.add_done_callback(done)
+    return result
+
+
+class StageScheduler:
+    """
+    Runs independent stages of the transformation concurrently in worker processes.
+
+    Stages are submitted with the function that creates their outputs and return
+    the samples in the outputs. The result of a stage is awaited when it is needed,
+    e.g., for checking the samples against the clinical data.
+    Stages of which the outputs are up to date (see IncrementalBuild) are not run.
+    With a single worker, stages are run in the main process when they are submitted.
+    """
+
+    def __init__(self, build: IncrementalBuild, workers: Optional[int] = None):
+        self.build = build
+        self.workers = workers
+        self.executor: Optional[Executor] = None
+        self.stages: Dict[str, Tuple[Future, Iterable[str], bool]] = {}
+        self.futures: List[Future] = []
+
+    def __enter__(self):
+        if self.workers != 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor is not None:
+            if exc_type is not None:
+                for future in self.futures:
+                    future.cancel()
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def submit(self,
+               stage: str,
+               input_paths: Sequence[str],
+               outputs: Iterable[str],
+               function: Callable[..., Iterable[str]],
+               *args: Any,
+               parameters: str = '',
+               in_main_process: bool = False):
+        """Start a stage, unless its outputs are up to date
+        :param stage: name of the stage
+        :param input_paths: paths of the input files of the stage
+        :param outputs: paths of the files the stage may create, relative to the output directory
+        :param function: top level function that runs the stage and returns the samples in its outputs
+        :param args: arguments of the function
+        :param parameters: parameters of the stage that affect the outputs
+        :param in_main_process: run the stage in the main process when it is submitted,
+            e.g., because it submits its own jobs to the executor
+        """
+        samples = self.build.start_stage(stage, input_paths, parameters)
+        if samples is not None:
+            future: Future = Future()
+            future.set_result(samples)
+            self.stages[stage] = (future, outputs, False)
+            return
+        logger.debug('Starting stage {}'.format(stage))
+        future = self.run_in_main_process(function, *args) if in_main_process else self.run(function, *args)
+        self.stages[stage] = (future, outputs, True)
+
+    def run(self, function: Callable[..., Any], *args: Any) -> Future:
+        """Run a function in a worker process, or in the main process with a single worker.
+        Unlike stages, the outputs of the function are not recorded.
+        :return: future of the result of the function
+        """
+        if self.executor is not None:
+            future = self.executor.submit(in_worker(function), *args)
+            if is_recording():
+                # Cancelling the future cancels the job, the stages recorded by the worker are collected
+                self.futures.append(future)
+                return collected(future)
+        else:
+            future = self.run_in_main_process(function, *args)
+        self.futures.append(future)
+        return future
+
+    @staticmethod
+    def run_in_main_process(function: Callable[..., Any], *args: Any) -> Future:
+        """Run a function in the main process
+        :return: future of the result of the function
+        """
+        future: Future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def is_submitted(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def result(self, stage: str) -> List[str]:
+        """Wait for a stage to complete and record its outputs
+        :return: the samples in the outputs of the stage
+        :raises Exception: the exception raised by the stage
+        """
+        future, outputs, running = self.stages[stage]
+        samples = list(future.result())
+        if running:
+            self.build.finish_stage(stage, outputs, samples)
+            self.stages[stage] = (future, outputs, False)
+        return samples
@@ -3,15 +3,21 @@
 # Code to transform clinical data
 # Author: Sander Tan, The Hyve
 
+import csv
 import logging
 import os
 import re
-import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, List, Optional
 
 import numpy as np
 import pandas as pd
 
-from csr.csr import CentralSubjectRegistry
+from csr.csr import CentralSubjectRegistry, Individual, Diagnosis, Biosource, Biomaterial
+from csr.data_frames import entities_to_data_frame
+from csr.entity_index import NO_REFERENCE
+from csr.exceptions import DataException
 from .create_metafile import create_meta_content
 
 logger = logging.getLogger(__name__)
@@ -22,73 +28,85 @@ RENAME_CLINICAL_DATA_HEADER = {'INDIVIDUAL_ID': 'PATIENT_ID'}
 # Force some datatypes to be remappad to STRING
 FORCE_STRING_LIST = ['CENTER_TREATMENT', 'CID', 'DIAGNOSIS_ID', 'GENDER', 'IC_DATA', 'IC_LINKING_EXT', 'IC_MATERIAL',
                      'IC_TYPE', 'INDIVIDUAL_STUDY_ID', 'TOPOGRAPHY', 'TUMOR_TYPE']
+# Number of rows formatted at a time when writing clinical data
+CLINICAL_CHUNK_SIZE = 50000
+WRITE_BUFFER_SIZE = 1 << 20
 
 
-def create_clinical_header(df):
-    """ Function to create header in cBioPortal format for clinical data
+def create_clinical_header(df) -> List[List[str]]:
+    """ Function to create header in cBioPortal format for clinical data.
+        Returns the four header lines: attribute names, attribute descriptions,
+        attribute data types and attribute priorities, the first value of every line starting with #.
     """
-
-    # Create attribute name and attribute description
-    header_data = pd.DataFrame(data=df.columns)
-    header_data[1] = header_data
+    names = [str(column) for column in df.columns]
 
     # Data type header line
+    # TODO: Major - Check FORCE_STRING_LIST assumption --> make configurable?
     type_values = []
-    for i in df.dtypes:
-        if np.issubdtype(i, np.number):
+    for name, dtype in zip(names, df.dtypes):
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) \
+                and name not in FORCE_STRING_LIST:
             type_values.append('NUMBER')
         else:
             type_values.append('STRING')
 
-    # Create attribute type and attribute priority
-    header_data[2] = type_values
-    header_data[3] = 1
-
-    # Transpose to put in correct format
-    header_data = header_data.transpose()
-
-    # Transform to dataframe
-    header_data = pd.DataFrame(header_data)
-    header_data.columns = df.columns
-
-    # TODO: Major - Check FORCE_STRING_LIST assumption --> make configurable?
-    # Set datatype of specific columns before after header
-    for string_column_name in FORCE_STRING_LIST:
-        if string_column_name in header_data.columns:
-            header_data.loc[2, string_column_name] = 'STRING'
+    header = [list(names), list(names), type_values, ['1'] * len(names)]
 
     # Adding hash # to the first column
-    header_data.iloc[:, 0] = '#' + header_data.iloc[:, 0].astype(str)
+    if names:
+        for line in header:
+            line[0] = '#' + line[0]
 
-    return header_data
+    return header
 
 
 def to_sample_data(biosource_data, biomaterial_data, diagnosis_data) -> pd.DataFrame:
-    """ Merge diagnoses, biosources and biomaterials into samples data frame
+    """ Join biomaterials with their biosources and the diagnoses of the biosources into a samples data frame.
+        The biosource and diagnosis data frames are indexed by the integer keys of the entity index,
+        SRC_BIOSOURCE_KEY and DIAGNOSIS_KEY are the referenced keys in the biomaterial and biosource data.
+        Columns of the biomaterials, biosources and diagnoses are selected explicitly,
+        the patient identifier is taken from the biosource, or else from the diagnosis.
     """
-    diagnosis_biosource_data = pd.merge(biosource_data, diagnosis_data, how='left', on=['DIAGNOSIS_ID'])
-    sample_data = pd.merge(biomaterial_data, diagnosis_biosource_data, how='left',
-                           left_on=['SRC_BIOSOURCE_ID'], right_on=['BIOSOURCE_ID'])
-    # remove suffixes for biomaterials and biosources
-    if 'SRC_BIOSOURCE_ID_x' in sample_data.columns:
-        x_ = sample_data['SRC_BIOSOURCE_ID_x']
-        y_ = sample_data['SRC_BIOSOURCE_ID_y']
-        sample_data['SRC_BIOSOURCE_ID'] = x_.combine_first(y_)
-        sample_data = sample_data.drop(columns=['SRC_BIOSOURCE_ID_x', 'SRC_BIOSOURCE_ID_y'])
-    # remove suffixes for patients
-    if 'PATIENT_ID_x' in sample_data.columns:
-        x_ = sample_data['PATIENT_ID_x']
-        y_ = sample_data['PATIENT_ID_y']
-        sample_data['PATIENT_ID'] = x_.combine_first(y_)
-        sample_data = sample_data.drop(columns=['PATIENT_ID_x', 'PATIENT_ID_y'])
+    biosource_keys = biomaterial_data['SRC_BIOSOURCE_KEY'].to_numpy()
+    biosources = biosource_data.reindex(biosource_keys)
+    diagnosis_keys = biosources['DIAGNOSIS_KEY'].fillna(NO_REFERENCE).to_numpy(dtype=np.int64)
+    diagnoses = diagnosis_data.reindex(diagnosis_keys)
+
+    biomaterial_columns = [column for column in biomaterial_data.columns
+                           if column not in ['SRC_BIOSOURCE_ID', 'SRC_BIOSOURCE_KEY']]
+    biosource_columns = [column for column in biosource_data.columns
+                         if column not in ['SRC_BIOSOURCE_ID', 'PATIENT_ID', 'DIAGNOSIS_KEY']]
+    diagnosis_columns = [column for column in diagnosis_data.columns if column not in ['DIAGNOSIS_ID', 'PATIENT_ID']]
+    columns = {column: biomaterial_data[column].array for column in biomaterial_columns}
+    columns.update({column: biosources[column].array for column in biosource_columns})
+    columns.update({column: diagnoses[column].array for column in diagnosis_columns})
+    columns['SRC_BIOSOURCE_ID'] = biomaterial_data['SRC_BIOSOURCE_ID'].array
+    columns['PATIENT_ID'] = pd.Series(biosources['PATIENT_ID'].array).combine_first(
+        pd.Series(diagnoses['PATIENT_ID'].array)).array
+    sample_data = pd.DataFrame(columns, index=biomaterial_data.index)
     sample_data['SAMPLE_ID'] = sample_data['BIOSOURCE_ID'] + "_" + sample_data['BIOMATERIAL_ID']
     return sample_data
 
 
+def get_sample_ids(subject_registry: CentralSubjectRegistry) -> List[str]:
+    """ Get the identifiers of the samples in the sample data without transforming the data:
+        the identifier of the source biosource and the identifier of the biomaterial.
+    """
+    return [f'{biomaterial.src_biosource_id}_{biomaterial.biomaterial_id}'
+            for biomaterial in subject_registry.entity_data.get('Biomaterial', [])]
+
+
+def entities_to_df(subject_registry: CentralSubjectRegistry, entity_type) -> pd.DataFrame:
+    """ Create a data frame for the entities of a type, with column types based on the CSR data model
+    """
+    entities = subject_registry.entity_data.get(entity_type.schema()['title'], [])
+    return entities_to_data_frame(entities, entity_type)
+
+
 def subject_registry_to_sample_data_df(subject_registry: CentralSubjectRegistry) -> pd.DataFrame:
-    diagnosis_data = pd.DataFrame.from_records([s.__dict__ for s in subject_registry.entity_data['Diagnosis']])
-    biosource_data = pd.DataFrame.from_records([s.__dict__ for s in subject_registry.entity_data['Biosource']])
-    biomaterial_data = pd.DataFrame.from_records([s.__dict__ for s in subject_registry.entity_data['Biomaterial']])
+    diagnosis_data = entities_to_df(subject_registry, Diagnosis)
+    biosource_data = entities_to_df(subject_registry, Biosource)
+    biomaterial_data = entities_to_df(subject_registry, Biomaterial)
 
     diagnosis_data.columns = [x.upper() for x in diagnosis_data.columns]
     biosource_data.columns = [x.upper() for x in biosource_data.columns]
@@ -97,11 +115,16 @@ def subject_registry_to_sample_data_df(subject_registry: CentralSubjectRegistry)
     diagnosis_data.rename(columns=RENAME_CLINICAL_DATA_HEADER, inplace=True)
     biosource_data.rename(columns=RENAME_CLINICAL_DATA_HEADER, inplace=True)
 
+    # Add integer keys of the referenced entities for joining the entities
+    index = subject_registry.entity_index
+    biosource_data['DIAGNOSIS_KEY'] = index.get_references('Biosource', 'diagnosis_id')
+    biomaterial_data['SRC_BIOSOURCE_KEY'] = index.get_references('Biomaterial', 'src_biosource_id')
+
     return to_sample_data(biosource_data, biomaterial_data, diagnosis_data)
 
 
 def subject_registry_to_patient_data_df(subject_registry: CentralSubjectRegistry) -> pd.DataFrame:
-    patient_data = pd.DataFrame.from_records([s.__dict__ for s in subject_registry.entity_data['Individual']])
+    patient_data = entities_to_df(subject_registry, Individual)
 
     patient_data.columns = [x.upper() for x in patient_data.columns]
     patient_data.rename(columns=RENAME_CLINICAL_DATA_HEADER, inplace=True)
@@ -109,42 +132,63 @@ def subject_registry_to_patient_data_df(subject_registry: CentralSubjectRegistry
     return patient_data
 
 
-def check_integer_na_columns(numerical_column):
-    """ Integer columns containing NA values are converted to Float in pandas
-        This function checks for a column if it only contains integers (.0)
-        In this case we attempt to convert all columns, not just the columns
-        that contain an NA value, because we sliced the dataframes from a bigger
-        dataframe that could contain NA values.
+def fix_integer_na_columns(df):
+    """ Integer columns containing NA values are written with NA for the missing values.
+        Float columns that only contain integers, e.g., because integer columns have been
+        converted to float in a merge, are converted to integer columns first.
     """
-    for i in numerical_column:
-        if str(i) != 'nan':
-            decimal_value = str(i).split('.')[1]
-            # If float is other than 0, we know for sure it's not an integer column
-            if float(decimal_value) != 0:
-                return False
-    # If loop ends by only encountering .0, return true
-    return True
+    for column in df.select_dtypes(include=[np.floating]).columns:
+        values = df[column]
+        present = values.dropna()
+        if (present % 1 == 0).all() and (present.abs() < 2 ** 63).all():
+            df[column] = values.astype('Int64')
+
+    # Convert integer columns with NA to columns with integers and the string NA
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_integer_dtype(values.dtype) and values.hasnans:
+            df[column] = values.astype(object).where(values.notna(), 'NA')
+    return df
 
 
-def fix_integer_na_columns(df):
-    """ Integer columns containing NA values are converted to Float in pandas
-        This function selects these columns and converts them to back to integers
+def to_hashable(value):
+    """ Convert list values, e.g., library strategies, to tuples that can be hashed
     """
+    return tuple(value) if isinstance(value, list) else value
 
-    # Select data with floats
-    numerical_data = df.select_dtypes(include=[np.float64])
 
-    # Round values to 4 decimals
-    # clinical_data.loc[:, numerical_data.columns] = np.round(numerical_data, 4)
+def is_missing(value) -> bool:
+    return not isinstance(value, tuple) and pd.isna(value)
 
-    # Select columns which contain integers with NA values (numpy has converted them to floats)
-    integer_na_columns = numerical_data.columns[numerical_data.apply(check_integer_na_columns, axis=0)]
 
-    # Convert integer columns with NA to string(integer) columns
-    if len(integer_na_columns) > 0:
-        df.loc[:, integer_na_columns] = df.loc[:, integer_na_columns].applymap(
-            lambda x: str(x).split('.')[0].replace('nan', 'NA'))
-    return df
+def drop_duplicate_rows(df):
+    """ Drop rows that are equal to a previous row, missing values are considered equal.
+        Rows are compared by their hash values; rows with the same hash value
+        are compared value by value to rule out hash collisions.
+    """
+    values = df
+    object_columns = [position for position, dtype in enumerate(df.dtypes) if dtype == object]
+    if object_columns:
+        values = df.copy()
+        for position in object_columns:
+            values.isetitem(position, df.iloc[:, position].map(to_hashable))
+    hashes = pd.util.hash_pandas_object(values, index=False)
+    duplicate_hash = hashes.duplicated(keep='first')
+    if not duplicate_hash.any():
+        return df
+    keep = ~duplicate_hash.to_numpy()
+    candidates = hashes.isin(hashes[duplicate_hash]).to_numpy()
+    distinct_rows = {}
+    for position, hash_value, row in zip(np.flatnonzero(candidates), hashes[candidates],
+                                         values[candidates].itertuples(index=False, name=None)):
+        row = tuple(None if is_missing(value) else value for value in row)
+        rows = distinct_rows.setdefault(hash_value, [])
+        if row in rows:
+            keep[position] = False
+        else:
+            rows.append(row)
+            keep[position] = True
+    return df[keep]
 
 
 def modify_clinical_data_column_names(clinical_data_df):
@@ -156,23 +200,22 @@ def modify_clinical_data_column_names(clinical_data_df):
 
 def modify_clinical_data_column_values(clinical_data_df):
     # Fix integers that are converted to floats due to NA in column
-    if len(clinical_data_df.select_dtypes(include=[np.float64]).columns) > 0:
-        clinical_data_df = fix_integer_na_columns(clinical_data_df)
+    clinical_data_df = fix_integer_na_columns(clinical_data_df)
     # Check if column names are unique.
     # In case of duplicates, rename them manually before or after header creation
     # TODO: Nice to have - Extract mapping dictionaries to external config, now they are hardcoded
     if not len(set(clinical_data_df.columns.tolist())) == len(clinical_data_df.columns.tolist()):
-        logger.error('Attribute names not unique, not writing data_clinical. Rename them using the remap dictionary.')
-        sys.exit(1)
+        raise DataException('Attribute names not unique, not writing data_clinical. '
+                            'Rename them using the remap dictionary.')
     # Drop duplicate rows, this does not check for duplicate sample ID's
     cd_row_count = clinical_data_df.shape[0]
-    clinical_data_df = clinical_data_df.loc[clinical_data_df.astype(str).drop_duplicates(keep='first').index]
+    clinical_data_df = drop_duplicate_rows(clinical_data_df)
     logger.debug('Found and dropped {} duplicates in the clinical data'
                  .format(cd_row_count - clinical_data_df.shape[0]))
     return clinical_data_df
 
 
-def transform_patient_clinical_data(subject_registry: CentralSubjectRegistry) -> [pd.DataFrame, pd.DataFrame]:
+def transform_patient_clinical_data(subject_registry: CentralSubjectRegistry) -> [pd.DataFrame, List[List[str]]]:
     patient_data_df = subject_registry_to_patient_data_df(subject_registry)
 
     # Remove empty columns
@@ -185,7 +228,7 @@ def transform_patient_clinical_data(subject_registry: CentralSubjectRegistry) ->
     return patient_data_df, patient_data_header
 
 
-def transform_sample_clinical_data(subject_registry: CentralSubjectRegistry) -> [pd.DataFrame, pd.DataFrame]:
+def transform_sample_clinical_data(subject_registry: CentralSubjectRegistry) -> [pd.DataFrame, List[List[str]]]:
     sample_data_df = subject_registry_to_sample_data_df(subject_registry)
 
     # Remove empty columns
@@ -198,19 +241,46 @@ def transform_sample_clinical_data(subject_registry: CentralSubjectRegistry) ->
     return sample_data_df, sample_data_header
 
 
+def format_clinical_rows(clinical_data: pd.DataFrame) -> str:
+    return clinical_data.to_csv(sep='\t', index=False, header=False)
+
+
+def write_clinical_data(clinical_data: pd.DataFrame,
+                        clinical_header: List[List[str]],
+                        clinical_filename: str,
+                        chunk_size: int = CLINICAL_CHUNK_SIZE,
+                        workers: Optional[int] = None):
+    """ Write the header lines and the clinical data to a file.
+        The rows are formatted in chunks on worker threads and written in order.
+        The number of formatted chunks waiting to be written is limited.
+    """
+    with open(clinical_filename, 'w', buffering=WRITE_BUFFER_SIZE) as clinical_file:
+        writer = csv.writer(clinical_file, delimiter='\t', lineterminator='\n')
+        writer.writerows(clinical_header)
+        writer.writerow(clinical_data.columns)
+        workers = workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            max_pending = 2 * workers
+            pending: Deque[Future] = deque()
+            for start in range(0, len(clinical_data), chunk_size):
+                if len(pending) >= max_pending:
+                    clinical_file.write(pending.popleft().result())
+                pending.append(executor.submit(format_clinical_rows, clinical_data.iloc[start:start + chunk_size]))
+            while pending:
+                clinical_file.write(pending.popleft().result())
+
+
 def write_clinical(clinical_data, clinical_header, clinical_type, output_dir, study_id):
     # Writing clinical patient file
     clinical_filename = os.path.join(output_dir, 'data_clinical_{}.txt'.format(clinical_type))
-    clinical_header.to_csv(clinical_filename, sep='\t', index=False, header=False, mode='w')
-    clinical_data.to_csv(clinical_filename, sep='\t', index=False, header=True, mode='a')
+    write_clinical_data(clinical_data, clinical_header, clinical_filename)
     # Set clinical type for meta file
     if clinical_type == 'sample':
         meta_datatype = 'SAMPLE_ATTRIBUTES'
     elif clinical_type == 'patient':
         meta_datatype = 'PATIENT_ATTRIBUTES'
     else:
-        logger.error("Unknown clinical data type")
-        sys.exit(1)
+        raise DataException('Unknown clinical data type: {}'.format(clinical_type))
     # Create meta file
     meta_filename = os.path.join(output_dir, 'meta_clinical_{}.txt'.format(clinical_type))
     create_meta_content(file_name=meta_filename,
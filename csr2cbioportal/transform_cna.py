@@ -0,0 +1,197 @@
+import gzip
+import logging
+import os
+import shutil
+from contextlib import ExitStack
+from typing import BinaryIO, Collection, Dict, List, Mapping, Optional, Sequence, TextIO
+
+from csr.instrumentation import instrumented, stage
+
+logger = logging.getLogger(__name__)
+
+# Number of genes (rows) read and written at a time
+CNA_CHUNK_SIZE = 10000
+
+RENAME_CNA_HEADER = {'Gene Symbol': 'Hugo_Symbol', 'Gene ID': 'Entrez_Gene_Id', 'Locus ID': 'Entrez_Gene_Id'}
+DROP_CNA_COLUMNS = ['Cytoband']
+
+SEGMENT_HEADER = 'ID\tchrom\tloc.start\tloc.end\tnum.mark\tseg.mean\n'
+# Block size for copying segment data
+COPY_BLOCK_SIZE = 1 << 20
+
+
+def get_sample_partitions(samples: Sequence[str], partitions: Collection[str],
+                          sample_partitions: Optional[Mapping[str, Sequence[str]]]) -> Dict[Optional[str], List[str]]:
+    """Assign samples to partitions
+    :param samples: the samples, in the order of the input file
+    :param partitions: the names of the partitions
+    :param sample_partitions: the partitions of each sample, if None all samples are assigned to all partitions
+    :return: the samples of each partition, samples without partition under None
+    """
+    partition_samples: Dict[Optional[str], List[str]] = {partition: [] for partition in partitions}
+    partition_samples[None] = []
+    for sample in samples:
+        if sample_partitions is None:
+            selected = list(partitions)
+        else:
+            selected = [partition for partition in sample_partitions.get(sample, []) if partition in partitions]
+        for partition in selected or [None]:
+            partition_samples[partition].append(sample)
+    return partition_samples
+
+
+def transform_cna_file(input_path: str, output_path: str, value_dtype: str, chunk_size: int = CNA_CHUNK_SIZE) \
+        -> List[str]:
+    """
+    Transforms a gene by sample CNA matrix (e.g., GISTIC data_by_genes or thresholded.by_genes) to cBioPortal format.
+    The Cytoband column is dropped, gene columns are renamed and negative Entrez IDs are removed,
+    as these can lead to incorrect mapping in cBioPortal.
+    The matrix is processed in chunks of genes, so memory use does not depend on the number of genes.
+
+    :param input_path: path to the tab separated input file
+    :param output_path: path of the output file
+    :param value_dtype: data type of the sample columns, e.g., 'float32' or 'Int8'
+    :param chunk_size: number of genes to process at a time
+    :return: list of sample identifiers
+    """
+    return split_cna_file(input_path, {'': output_path}, None, value_dtype, chunk_size)['']
+
+
+def split_cna_file(input_path: str,
+                   output_paths: Dict[str, str],
+                   sample_partitions: Optional[Mapping[str, Sequence[str]]],
+                   value_dtype: str,
+                   chunk_size: int = CNA_CHUNK_SIZE) -> Dict[Optional[str], List[str]]:
+    """
+    Transforms a gene by sample CNA matrix to cBioPortal format (see transform_cna_file)
+    and splits the sample columns over multiple output files in the same pass.
+    Every output file has the gene columns and the sample columns of its partition.
+    Only partitions with samples are written, unless sample_partitions is None.
+
+    :param input_path: path to the tab separated input file
+    :param output_paths: paths of the output files by partition
+    :param sample_partitions: the partitions of each sample, if None all samples are written to all files
+    :param value_dtype: data type of the sample columns, e.g., 'float32' or 'Int8'
+    :param chunk_size: number of genes to process at a time
+    :return: the samples of each partition, samples without partition under None
+    """
+    # Imported here, as pandas is slow to import and only needed for CNA matrices
+    import pandas as pd
+
+    with stage('split_cna_file') as current:
+        input_columns = pd.read_csv(input_path, sep='\t', nrows=0).columns.tolist()
+        columns = [column for column in input_columns if column not in DROP_CNA_COLUMNS]
+        output_columns = [RENAME_CNA_HEADER.get(column, column) for column in columns]
+        gene_columns = [column for column in columns if column in RENAME_CNA_HEADER]
+        samples = [column for column in columns if column not in RENAME_CNA_HEADER]
+        dtype = {column: str for column in gene_columns}
+        dtype.update({column: value_dtype for column in samples})
+
+        partition_samples = get_sample_partitions(samples, output_paths.keys(), sample_partitions)
+        gene_output_columns = [RENAME_CNA_HEADER[column] for column in gene_columns]
+        if sample_partitions is None:
+            partition_columns = {partition: output_columns for partition in output_paths}
+        else:
+            partition_columns = {partition: gene_output_columns + partition_samples[partition]
+                                 for partition in output_paths if partition_samples[partition]}
+
+        chunks = pd.read_csv(input_path, sep='\t', na_values=[''], usecols=columns, dtype=dtype,
+                             chunksize=chunk_size)
+        with ExitStack() as stack:
+            output_files = {partition: stack.enter_context(open(output_paths[partition], 'w'))
+                            for partition in partition_columns}
+            for partition, output_file in output_files.items():
+                output_file.write('\t'.join(partition_columns[partition]) + '\n')
+            current.rows_in = 0
+            for chunk in chunks:
+                current.rows_in += len(chunk)
+                chunk = chunk[columns]
+                chunk.columns = output_columns
+                entrez_ids = pd.to_numeric(chunk['Entrez_Gene_Id'], errors='coerce')
+                chunk.loc[entrez_ids < -1, 'Entrez_Gene_Id'] = ''
+                for partition, output_file in output_files.items():
+                    partition_chunk = chunk if sample_partitions is None else chunk[partition_columns[partition]]
+                    partition_chunk.to_csv(output_file, sep='\t', index=False, header=False)
+        current.rows_out = current.rows_in
+    return partition_samples
+
+
+def copy_remainder(input_file: BinaryIO, output_file: BinaryIO):
+    """Copy the input file from its current position to the output file.
+    Uncompressed files are copied by the kernel with sendfile where possible.
+    """
+    output_file.flush()
+    if not isinstance(input_file, gzip.GzipFile) and hasattr(os, 'sendfile'):
+        offset = input_file.tell()
+        try:
+            while True:
+                sent = os.sendfile(output_file.fileno(), input_file.fileno(), offset, COPY_BLOCK_SIZE)
+                if sent == 0:
+                    return
+                offset += sent
+        except OSError:
+            # Fall back to copying in user space, continue where sendfile stopped
+            input_file.seek(offset)
+    shutil.copyfileobj(input_file, output_file, COPY_BLOCK_SIZE)
+
+
+@instrumented()
+def transform_segment_file(input_path: str, output_path: str):
+    """
+    Copies a segment data file with the header required by cBioPortal.
+    Only the header line is read, the rest of the file is copied in blocks.
+    Gzip compressed input files (.gz) are decompressed.
+
+    :param input_path: path to the segment file
+    :param output_path: path of the output file
+    """
+    open_input = gzip.open if input_path.endswith('.gz') else open
+    with open_input(input_path, 'rb') as input_file, open(output_path, 'wb') as output_file:
+        input_file.readline()
+        output_file.write(SEGMENT_HEADER.encode())
+        copy_remainder(input_file, output_file)
+
+
+def split_segment_file(input_path: str,
+                       output_paths: Dict[str, str],
+                       sample_partitions: Mapping[str, Sequence[str]]) -> Dict[Optional[str], List[str]]:
+    """
+    Splits a segment data file (optionally gzip compressed) by sample over multiple output files
+    with the header required by cBioPortal. Only partitions with samples are written.
+
+    :param input_path: path to the segment file
+    :param output_paths: paths of the output files by partition
+    :param sample_partitions: the partitions of each sample
+    :return: the samples of each partition, samples without partition under None
+    """
+    partition_samples: Dict[Optional[str], List[str]] = {partition: [] for partition in output_paths}
+    partition_samples[None] = []
+    line_partitions: Dict[str, List[str]] = {}
+    open_input = gzip.open if input_path.endswith('.gz') else open
+    with stage('split_segment_file') as current, open_input(input_path, 'rt') as input_file, ExitStack() as stack:
+        output_files: Dict[str, TextIO] = {}
+        input_file.readline()
+        rows_in = 0
+        rows_out = 0
+        for line in input_file:
+            if not line.strip():
+                continue
+            rows_in += 1
+            sample = line.split('\t', 1)[0]
+            partitions = line_partitions.get(sample)
+            if partitions is None:
+                partitions = [partition for partition in sample_partitions.get(sample, []) if partition in output_paths]
+                line_partitions[sample] = partitions
+                for partition in partitions or [None]:
+                    partition_samples[partition].append(sample)
+            for partition in partitions:
+                output_file = output_files.get(partition)
+                if output_file is None:
+                    output_file = stack.enter_context(open(output_paths[partition], 'w'))
+                    output_file.write(SEGMENT_HEADER)
+                    output_files[partition] = output_file
+                output_file.write(line)
+                rows_out += 1
+        current.rows_in = rows_in
+        current.rows_out = rows_out
+    return partition_samples
@@ -2,22 +2,30 @@ import json
 import logging
 import sys
 from os import path
+from typing import Optional, TYPE_CHECKING
 
 import click
+from pydantic import ValidationError
 
 from csr.exceptions import DataException
+from csr.instrumentation import run_report, stage
 from csr.logging import setup_logging
-from transmart_loader.copy_writer import TransmartCopyWriter
-from transmart_loader.transmart import DataCollection
+from csr.profiling import PROFILERS, profile_run
 
 from csr.csr import CentralSubjectRegistry, StudyRegistry
 from csr.subject_registry_reader import SubjectRegistryReader
 from csr.study_registry_reader import StudyRegistryReader
-from csr2transmart.mappers.csr_mapper import CsrMapper
 from csr2transmart.ontology_config import OntologyConfig
 
+if TYPE_CHECKING:
+    from transmart_loader.transmart import DataCollection
+
 logger = logging.getLogger(__name__)
 
+# Study identifier and top ontology node of the study with all data
+STUDY_ID = 'CSR'
+TOP_TREE_NODE = '\\Central Subject Registry\\'
+
 
 def read_configuration(config_dir) -> OntologyConfig:
     """ Parse configuration files and return set of dictionaries
@@ -26,62 +34,129 @@ def read_configuration(config_dir) -> OntologyConfig:
     """
     ontology_config_path = path.join(config_dir, 'ontology_config.json')
     if not path.exists(ontology_config_path) or not path.isfile(ontology_config_path):
-        raise FileNotFoundError(f'Cannot find {ontology_config_path}')
+        raise DataException(f'Cannot find {ontology_config_path}')
     with open(ontology_config_path, 'r') as ontology_config_file:
         try:
             config_data = json.load(ontology_config_file)
         except Exception as e:
             logger.error(e)
             raise DataException(f'Error parsing ontology config file: {ontology_config_path}')
-        return OntologyConfig(**config_data)
+        try:
+            return OntologyConfig(**config_data)
+        except ValidationError as e:
+            raise DataException(f'Invalid ontology config file {ontology_config_path}:\n{e}') from e
+
+
+def write_transmart_data(subject_registry: CentralSubjectRegistry,
+                         study_registry: StudyRegistry,
+                         ontology_config: OntologyConfig,
+                         output_dir: str,
+                         study_id: str,
+                         top_tree_node: str,
+                         per_study: bool = False) -> 'DataCollection':
+    """ Map the registries to the TranSMART data model and write the data in transmart-copy format
+
+    :param subject_registry: the subject registry
+    :param study_registry: the study registry
+    :param ontology_config: the ontology configuration
+    :param output_dir: the output directory, empty or not existing
+    :param study_id: identifier of the study, unless a study is mapped per study in the study registry
+    :param top_tree_node: path of the top node of the ontology
+    :param per_study: map a study for every study in the study registry
+    :return: the mapped data collection
+    """
+    # The mapping and writing modules are imported when they are used, to keep the startup of the command fast
+    from csr2transmart.mappers.csr_mapper import CsrMapper
+    from transmart_loader.copy_writer import TransmartCopyWriter
+
+    logger.info('Mapping CSR to Data Collection...')
+    mapper = CsrMapper(study_id, top_tree_node)
+    if per_study:
+        collection = mapper.map_studies(subject_registry, study_registry, ontology_config.nodes)
+    else:
+        collection = mapper.map(subject_registry, study_registry, ontology_config.nodes)
+
+    logger.info('Writing files to {}'.format(output_dir))
+    with stage('write_collection', len(collection.observations)):
+        copy_writer = TransmartCopyWriter(str(output_dir))
+        copy_writer.write_collection(collection)
+    return collection
 
 
-def csr2transmart(input_dir: str,
+def csr2transmart(input_dir: Optional[str],
                   output_dir: str,
-                  config_dir: str,
+                  config_dir: Optional[str],
                   study_id: str,
-                  top_tree_node: str):
+                  top_tree_node: str,
+                  per_study: bool = False,
+                  ontology_config: Optional[OntologyConfig] = None,
+                  subject_registry: Optional[CentralSubjectRegistry] = None,
+                  study_registry: Optional[StudyRegistry] = None) -> 'DataCollection':
+    """ Read the CSR files and the ontology configuration, and write the data in transmart-copy format.
+    Configuration and registries that are passed are used instead of reading them.
+
+    :param input_dir: directory with the CSR files, if the registries are not passed
+    :param output_dir: the output directory, empty or not existing
+    :param config_dir: directory with the ontology configuration, if no configuration is passed
+    :param study_id: identifier of the study, unless a study is mapped per study in the study registry
+    :param top_tree_node: path of the top node of the ontology
+    :param per_study: map a study for every study in the study registry
+    :param ontology_config: the ontology configuration
+    :param subject_registry: the subject registry
+    :param study_registry: the study registry
+    :return: the mapped data collection
+    :raises CsrException: if the data or configuration is missing or invalid
+    """
     logger.info('csr2transmart')
-    try:
+    if ontology_config is None:
         logger.info('Reading configuration data...')
         ontology_config = read_configuration(config_dir)
 
+    if subject_registry is None or study_registry is None:
         logger.info('Reading CSR data...')
-        subject_registry_reader = SubjectRegistryReader(input_dir)
-        subject_registry: CentralSubjectRegistry = subject_registry_reader.read_subject_registry()
-        study_registry_reader = StudyRegistryReader(input_dir)
-        study_registry: StudyRegistry = study_registry_reader.read_study_registry()
+    if subject_registry is None:
+        subject_registry = SubjectRegistryReader(input_dir).read_subject_registry()
+    if study_registry is None:
+        study_registry = StudyRegistryReader(input_dir).read_study_registry()
 
-        logger.info('Mapping CSR to Data Collection...')
-        mapper = CsrMapper(study_id, top_tree_node)
-        collection: DataCollection = mapper.map(subject_registry, study_registry, ontology_config.nodes)
+    collection = write_transmart_data(subject_registry, study_registry, ontology_config, output_dir, study_id,
+                                      top_tree_node, per_study)
 
-        logger.info('Writing files to {}'.format(output_dir))
-        copy_writer = TransmartCopyWriter(str(output_dir))
-        copy_writer.write_collection(collection)
-
-        logger.info('Done.')
-
-    except Exception as e:
-        logger.error(e)
-        sys.exit(1)
+    logger.info('Done.')
+    return collection
 
 
 @click.command()
 @click.argument('input_dir', type=click.Path(file_okay=False, exists=True, readable=True))
 @click.argument('output_dir', type=click.Path(file_okay=False, writable=True))
 @click.argument('config_dir', type=click.Path(file_okay=False, exists=True, readable=True))
+@click.option('--per-study', is_flag=True,
+              help='Map a tranSMART study for every study in the study registry, '
+                   'instead of a single study with all data')
+@click.option('--report', type=click.Path(dir_okay=False, writable=True),
+              help='Write a JSON report with the time, rows and memory use of the stages of the run to this file')
+@click.option('--profile', type=click.Choice(PROFILERS),
+              help='Profile the run with cProfile or take tracemalloc snapshots at the stage boundaries')
+@click.option('--profile-dir', type=click.Path(file_okay=False, writable=True), default='.', show_default=True,
+              help='Directory to write the profile files to')
 @click.option('--debug', is_flag=True, help='Print more verbose messages')
 @click.version_option()
-def run(input_dir, output_dir, config_dir, debug: bool):
+def run(input_dir, output_dir, config_dir, per_study: bool, report: Optional[str],
+        profile: Optional[str], profile_dir: str, debug: bool):
     setup_logging(debug)
-    csr2transmart(
-        input_dir,
-        output_dir,
-        config_dir,
-        'CSR',
-        '\\Central Subject Registry\\',
-    )
+    with run_report(report, 'csr2transmart'), profile_run(profile, profile_dir, 'csr2transmart'):
+        try:
+            csr2transmart(
+                input_dir,
+                output_dir,
+                config_dir,
+                STUDY_ID,
+                TOP_TREE_NODE,
+                per_study,
+            )
+        except Exception as e:
+            logger.error(e)
+            sys.exit(1)
 
 
 def main():
@@ -1,9 +1,11 @@
 from typing import Dict, Sequence, List
 
 from transmart_loader.transmart import DataCollection, Study, TrialVisit, Patient, DimensionType, ValueType, Modifier, \
-    Dimension
+    Dimension, Observation
 
 from csr.csr import CentralSubjectRegistry, StudyRegistry, Individual, SubjectEntity, Study as CsrStudy
+from csr.instrumentation import count_entities, instrumented
+from csr.study_partition import select_by_study
 from csr2transmart.mappers.observation_mapper import ObservationMapper
 from csr2transmart.mappers.ontology_mapper import OntologyMapper
 from csr2transmart.ontology_config import TreeNode
@@ -18,6 +20,12 @@ class CsrMapper:
         self.patient_col = 'INDIVIDUAL_ID'
         self.study_id = study_id
         self.top_tree_node = top_tree_node
+        self.reset()
+
+    def reset(self):
+        """Start with new patients, dimensions and modifiers, so the mapper can be used multiple times.
+        Data collections that were mapped before keep their own objects.
+        """
         self.individual_id_to_patient: Dict[str, Patient] = {}
         self.dimensions: List[Dimension] = []
         self.modifier_key_to_modifier: Dict[str, Modifier] = {}
@@ -52,10 +60,13 @@ class CsrMapper:
                                            index+2)
             self.dimensions.append(modifier_dimension)
 
+    @instrumented('CsrMapper.map', rows_in=lambda self, subject_registry, *args: count_entities(subject_registry),
+                  rows_out=lambda collection: len(collection.observations))
     def map(self,
             subject_registry: CentralSubjectRegistry,
             study_registry: StudyRegistry,
             src_ontology: Sequence[TreeNode]) -> DataCollection:
+        self.reset()
         self.map_patients(subject_registry.entity_data['Individual'])
         study = self.map_study()
         default_trial_visit = self.map_default_trial_visit(study)
@@ -83,3 +94,53 @@ class CsrMapper:
                               observation_mapper.observations,
                               [],
                               [])
+
+    @instrumented('CsrMapper.map_studies',
+                  rows_in=lambda self, subject_registry, *args: count_entities(subject_registry),
+                  rows_out=lambda collection: len(collection.observations))
+    def map_studies(self,
+                    subject_registry: CentralSubjectRegistry,
+                    study_registry: StudyRegistry,
+                    src_ontology: Sequence[TreeNode]) -> DataCollection:
+        """
+        Map a tranSMART study for every study in the study registry.
+        The patients, concepts, modifiers and ontology are shared by the studies.
+        Every study has its own trial visit, with the observations of the individuals linked to the study.
+        Individuals that are linked to multiple studies have observations in all these studies.
+        """
+        self.reset()
+        self.map_patients(subject_registry.entity_data['Individual'])
+        self.map_dimensions_and_modifiers()
+
+        ontology_mapper = OntologyMapper(self.top_tree_node)
+        ontology = ontology_mapper.map(src_ontology)
+
+        studies: List[Study] = []
+        trial_visits: List[TrialVisit] = []
+        observations: List[Observation] = []
+        selections = select_by_study(subject_registry, study_registry)
+        for csr_study in study_registry.entity_data['Study']:
+            study = Study(csr_study.study_id, csr_study.title or csr_study.study_id)
+            trial_visit = self.map_default_trial_visit(study)
+            observation_mapper = ObservationMapper(subject_registry,
+                                                   study_registry,
+                                                   trial_visit,
+                                                   self.individual_id_to_patient,
+                                                   ontology_mapper.concept_code_to_concept,
+                                                   self.modifier_key_to_modifier)
+            observation_mapper.map_observations(selections[csr_study.study_id], csr_study.study_id)
+            studies.append(study)
+            trial_visits.append(trial_visit)
+            observations.extend(observation_mapper.observations)
+
+        return DataCollection(ontology_mapper.concept_code_to_concept.values(),
+                              self.modifier_key_to_modifier.values(),
+                              self.dimensions,
+                              studies,
+                              trial_visits,
+                              [],
+                              ontology,
+                              self.individual_id_to_patient.values(),
+                              observations,
+                              [],
+                              [])
@@ -1,9 +1,12 @@
 from typing import List, Dict, Optional, Type, Any
+
+import numpy as np
 from pydantic import BaseModel
 from transmart_loader.transmart import TrialVisit, Patient, Concept, Modifier, Observation, ObservationMetadata, \
     Value, CategoricalValue, ValueType, NumericalValue, DateValue, TextValue
 
-from csr.csr import CentralSubjectRegistry, StudyRegistry, Individual, SubjectEntity
+from csr.csr import CentralSubjectRegistry, StudyRegistry, SubjectEntity
+from csr.entity_index import NO_REFERENCE, MISSING_REFERENCE
 
 from csr.exceptions import MappingException
 
@@ -26,6 +29,7 @@ class ObservationMapper:
         self.concept_code_to_concept = concept_code_to_concept
         self.modifier_key_to_modifier = modifier_key_to_modifier
         self.observations: List[Observation] = []
+        self.categorical_values: Dict[Any, CategoricalValue] = {}
 
     @staticmethod
     def row_value_to_value(row_value, value_type: ValueType) -> Optional[Value]:
@@ -46,6 +50,19 @@ class ObservationMapper:
         else:
             return TextValue(row_value)
 
+    def get_categorical_value(self, value) -> CategoricalValue:
+        """
+        Get the shared transmart-loader CategoricalValue for a value, such that
+        observations with the same categorical value share the same object
+        :param value: categorical value
+        :return: transmart-loader CategoricalValue
+        """
+        categorical_value = self.categorical_values.get(value)
+        if categorical_value is None:
+            categorical_value = CategoricalValue(value)
+            self.categorical_values[value] = categorical_value
+        return categorical_value
+
     @staticmethod
     def skip_reference(entity_type: Type[BaseModel], ref_type: str) -> bool:
         """
@@ -56,17 +73,6 @@ class ObservationMapper:
         """
         return ref_type == entity_type.schema()['title']
 
-    @staticmethod
-    def get_field_properties_by_keyword(entity_type: Type[BaseModel], key: str) -> Dict[str, Any]:
-        """
-        For a specific type of entity get a list of field names (with schema keyword value)
-        that have a key property defined in their schema metadata
-        :param entity_type: type of the entity
-        :param key: schema keyword
-        :return: dictionary from field name to value of the schema property that matches the keyword
-        """
-        return {name: prop[key] for (name, prop) in entity_type.schema()['properties'].items() if key in prop}
-
     @staticmethod
     def get_field_names_by_key_and_value(entity_type: Type[BaseModel], key: str, value) -> List[str]:
         """
@@ -87,46 +93,38 @@ class ObservationMapper:
         """
         return self.get_field_names_by_key_and_value(entity_type, 'identity', True)[0]
 
-    def get_ref_entity_name_to_ref_field_value(self,
-                                               entity: BaseModel,
-                                               entity_type: Type[BaseModel]) -> Dict[str, str]:
+    def get_ref_entity_name_to_ref_field_value(self, entity_type_name: str, key: int) -> Dict[str, str]:
         """
         Get a dictionary with name of reference entities to value of the referencing field,
-        being id of the referencing entity
-        :param entity: CSR entity
-        :param entity_type: type of the entity
+        being id of the referencing entity. References are followed through the integer keys
+        of the subject registry entity index.
+        :param entity_type_name: name of the entity type
+        :param key: key of the entity in the entity index
         :return: dictionary from reference entity name to value of reference field
         """
-        entity_ref_to_ref_id = dict()
-        id_attribute = self.get_id_field_name(entity_type)
-        entity_type_name = entity_type.schema()['title']
-        entity_id = entity.__getattribute__(id_attribute)
-        entity_ref_to_ref_id[entity_type_name] = entity_id
+        index = self.subject_registry.entity_index
+        entity = index.get_entity(entity_type_name, key)
+        entity_type = type(entity)
+        entity_id = entity.__getattribute__(self.get_id_field_name(entity_type))
+        entity_ref_to_ref_id = {entity_type_name: entity_id}
 
         if entity_type_name == 'Individual':
             return entity_ref_to_ref_id
 
         # Follow reference fields to obtain identifiers of linked entities
-        ref_fields = self.get_field_properties_by_keyword(entity_type, 'references')
-        for field_name, ref_entity_name in ref_fields.items():
-            if not self.skip_reference(type(entity), ref_entity_name):
-                # Lookup referenced entity
-                referenced_entity_type = list([entity for entity in SubjectEntity.__args__
-                                               if entity.schema()['title'] == ref_entity_name])[0]
-                referenced_id = entity.__getattribute__(field_name)
-                if not referenced_id:
-                    continue
-                referenced_id_attribute = self.get_id_field_name(referenced_entity_type)
-                referenced_entities = [e for e in self.subject_registry.entity_data[ref_entity_name]
-                                       if e.__getattribute__(referenced_id_attribute) == referenced_id]
-                if not referenced_entities:
-                    raise MappingException(
-                        f'{entity_type_name} with id {entity_id} has reference to non-existing'
-                        f' {ref_entity_name} with id {referenced_id}.')
-                # Recursively add identifiers from referenced entity
-                referenced_ids = self.get_ref_entity_name_to_ref_field_value(referenced_entities[0],
-                                                                             referenced_entity_type)
-                entity_ref_to_ref_id.update(referenced_ids)
+        for field_name, ref_entity_name in index.get_reference_fields(entity_type_name):
+            if self.skip_reference(entity_type, ref_entity_name):
+                continue
+            referenced_key = index.get_references(entity_type_name, field_name)[key]
+            if referenced_key == NO_REFERENCE:
+                continue
+            if referenced_key == MISSING_REFERENCE:
+                raise MappingException(
+                    f'{entity_type_name} with id {entity_id} has reference to non-existing'
+                    f' {ref_entity_name} with id {entity.__getattribute__(field_name)}.')
+            # Recursively add identifiers from referenced entity
+            entity_ref_to_ref_id.update(self.get_ref_entity_name_to_ref_field_value(ref_entity_name,
+                                                                                    int(referenced_key)))
 
         return entity_ref_to_ref_id
 
@@ -141,7 +139,7 @@ class ObservationMapper:
             modifier = self.modifier_key_to_modifier.get(modifier_key)
             if modifier is None:
                 return None
-            mod_metadata[modifier] = CategoricalValue(value)
+            mod_metadata[modifier] = self.get_categorical_value(value)
         return ObservationMetadata(mod_metadata)
 
     def get_observation_for_value(self, row_value, concept: Concept, metadata: ObservationMetadata,
@@ -154,7 +152,10 @@ class ObservationMapper:
         :param patient: transmart-loader Patient object
         :return: transmart-loader Observation object
         """
-        value = self.row_value_to_value(row_value, concept.value_type)
+        if concept.value_type is ValueType.Categorical and row_value is not None:
+            value = self.get_categorical_value(row_value)
+        else:
+            value = self.row_value_to_value(row_value, concept.value_type)
         return Observation(patient, concept, None, self.default_trial_visit, None, None, value, metadata)
 
     def map_observation(self,
@@ -175,13 +176,13 @@ class ObservationMapper:
         if not patient:
             raise MappingException('No patient with identifier: {}. '
                                    'Failed to create observation for {} with id: {}. Entity {}, Ind {}'
-                                   .format(individual_id, type(entity).__name__, entity_id,
+                                   .format(individual_id, entity_name, entity_id,
                                            entity, self.individual_id_to_patient.keys()))
         for entity_field in entity_fields:
             concept_code = '{}.{}'.format(entity_name, entity_field)
             concept = self.concept_code_to_concept.get(concept_code)
             if concept is not None:
-                if isinstance(entity, Individual) or not entity_type_to_id:
+                if entity_name == 'Individual' or not entity_type_to_id:
                     metadata = None
                 else:
                     metadata = self.map_observation_metadata(entity_type_to_id)
@@ -195,34 +196,42 @@ class ObservationMapper:
                         self.observations.append(
                             self.get_observation_for_value(entity_value, concept, metadata, patient))
 
-    def map_subject_registry_observations(self, entity_type: Type[BaseModel]):
+    def map_subject_registry_observations(self, entity_type: Type[BaseModel], selected: Optional[np.ndarray] = None):
         """
         Map observations for for subject registry entities
         :param entity_type: type of the subject registry entity
+        :param selected: boolean mask of the entities to map, all entities are mapped if None
         :return:
         """
         entities = self.subject_registry.entity_data[entity_type.schema()['title']]
         if not entities:
             return
 
+        entity_type_name = entity_type.schema()['title']
         entity_id_field_name = self.get_id_field_name(entity_type)
-        for entity in entities:
+        keys = range(len(entities)) if selected is None else np.flatnonzero(selected).tolist()
+        for key in keys:
+            entity = entities[key]
             entity_id = entity.__getattribute__(entity_id_field_name)
-            entity_type_to_id = self.get_ref_entity_name_to_ref_field_value(entity, entity_type)
+            entity_type_to_id = self.get_ref_entity_name_to_ref_field_value(entity_type_name, key)
             self.map_observation(entity, entity_id, entity_type_to_id)
 
-    def map_study_registry_observations(self):
+    def map_study_registry_observations(self, study_id: Optional[str] = None):
         """
         Map observations for study registry entities
+        :param study_id: only map the links of individuals to this study, all links are mapped if None
         :return:
         """
+        index = self.study_registry.entity_index
         for ind_study in self.study_registry.entity_data['IndividualStudy']:
-            study = next((s for s in self.study_registry.entity_data['Study']
-                          if s.study_id == ind_study.study_id), None)
-            if study is None:
+            if study_id is not None and ind_study.study_id != study_id:
+                continue
+            study_key = index.get_key('Study', ind_study.study_id)
+            if study_key is None:
                 raise MappingException('No study with identifier: {}. '
                                        'Failed to create observation for individual study with id: {}.'
                                        .format(ind_study.study_id, ind_study.individual_id))
+            study = index.get_entity('Study', study_key)
             entity_type_to_id = {
                 'Individual': ind_study.individual_id,
                 'Study': ind_study.study_id
@@ -230,12 +239,16 @@ class ObservationMapper:
             self.map_observation(study, study.study_id, entity_type_to_id.copy())
             self.map_observation(ind_study, ind_study.study_id_individual_study_id, entity_type_to_id.copy())
 
-    def map_observations(self):
+    def map_observations(self, selection: Optional[Dict[str, np.ndarray]] = None, study_id: Optional[str] = None):
         """
         Map observations for study and subject registry entities
+        :param selection: boolean masks of the subject registry entities to map per entity type name,
+            e.g., the entities of a study (see select_by_study). All entities are mapped if None
+        :param study_id: only map the study registry entities of this study, all are mapped if None
         :return:
         """
         subject_entities = list(SubjectEntity.__args__)
         for subject_entity_type in subject_entities:
-            self.map_subject_registry_observations(subject_entity_type)
-        self.map_study_registry_observations()
+            selected = None if selection is None else selection.get(subject_entity_type.schema()['title'])
+            self.map_subject_registry_observations(subject_entity_type, selected)
+        self.map_study_registry_observations(study_id)
@@ -1,12 +1,16 @@
 import datetime
-from typing import Dict, Sequence, Optional
+from functools import lru_cache
+from typing import Dict, List, Sequence, Optional
 
 from transmart_loader.transmart import Concept, TreeNode, ValueType, ConceptNode, TreeNodeMetadata
 
 from csr.csr import SubjectEntity, StudyEntity
 from csr2transmart.ontology_config import TreeNode as OntologyConfigTreeNode, OntologyConfigValidationException
 
-subject_entity_names = list(map(lambda se: se.schema()['title'], SubjectEntity.__args__))
+
+@lru_cache(maxsize=None)
+def get_subject_entity_names() -> List[str]:
+    return list(map(lambda se: se.schema()['title'], SubjectEntity.__args__))
 
 
 class OntologyMapper:
@@ -30,7 +34,7 @@ class OntologyMapper:
     def get_metadata_for_entity(entity_name: str) -> Optional[TreeNodeMetadata]:
         if entity_name == 'Individual':
             return TreeNodeMetadata({'subject_dimension': 'patient'})
-        elif entity_name in subject_entity_names:
+        elif entity_name in get_subject_entity_names():
             return TreeNodeMetadata({'subject_dimension': entity_name})
         return None
 
@@ -2,10 +2,11 @@ from collections import Counter
 from typing import Sequence, Optional
 
 from csr.csr import SubjectEntity, StudyEntity
+from csr.exceptions import CsrException
 from pydantic import BaseModel, validator, constr
 
 
-class OntologyConfigValidationException(ValueError):
+class OntologyConfigValidationException(CsrException, ValueError):
     pass
 
 
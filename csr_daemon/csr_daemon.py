@@ -0,0 +1,420 @@
+import importlib
+import inspect
+import io
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from os import path
+from typing import Any, Callable, Dict, IO, Optional, Sequence, Tuple
+
+import click
+
+from csr.csr import StudyEntity, SubjectEntity
+from csr.instrumentation import get_peak_rss, reset_peak_rss
+from csr.logging import setup_logging
+from csr2cbioportal.csr2cbioportal import csr2cbioportal
+from csr2cbioportal.maf_filter import MafFilter
+from csr2transmart.csr2transmart import csr2transmart, read_configuration as read_ontology_configuration, \
+    STUDY_ID, TOP_TREE_NODE
+from sources2csr.codebook_mapper import CodeBookMapper
+from sources2csr.sources2csr import read_sources, write_registries
+from sources2csr.sources_reader import read_configuration as read_sources_configuration
+
+logger = logging.getLogger(__name__)
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+JOB_FAILED = -32000
+SERVER_BUSY = -32001
+
+# Default maximum number of jobs waiting for a worker
+MAX_QUEUED = 100
+# Modules that the commands import when they transform data, imported by the workers when they start
+WORKER_MODULES = [
+    'numpy',
+    'pandas',
+    'csr.entity_index',
+    'csr.entity_validation',
+    'csr.columnar_validation',
+    'csr.study_partition',
+    'csr2transmart.mappers.csr_mapper',
+    'transmart_loader.copy_writer',
+    'csr2cbioportal.transform_clinical',
+]
+
+
+class FileCache:
+    """
+    Cache of objects loaded from files, e.g., configurations and codebooks.
+    An object is loaded again when the modification time or size of its file has changed.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+    def get(self, file_path: str, load: Callable[[], Any]) -> Any:
+        """Get the object loaded from a file
+        :param file_path: path of the file
+        :param load: function that loads the object from the file
+        :return: the cached object, or the object returned by load if the file has changed
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            # Let the load function report the missing file
+            return load()
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = path.abspath(file_path)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != version:
+            logger.debug(f'Loading {file_path}')
+            entry = (version, load())
+            self.entries[key] = entry
+        return entry[1]
+
+
+# Cache of the worker process
+file_cache = FileCache()
+
+
+def get_sources_config(config_dir: str):
+    return file_cache.get(path.join(config_dir, 'sources_config.json'),
+                          lambda: read_sources_configuration(config_dir))
+
+
+def get_ontology_config(config_dir: str):
+    return file_cache.get(path.join(config_dir, 'ontology_config.json'),
+                          lambda: read_ontology_configuration(config_dir))
+
+
+def get_codebook_mapper(codebook_path: str) -> CodeBookMapper:
+    return file_cache.get(codebook_path, lambda: CodeBookMapper(codebook_path))
+
+
+def sources2csr_job(input_dir: str, output_dir: str, config_dir: str):
+    subject_registry, study_registry = read_sources(input_dir, sources_config=get_sources_config(config_dir),
+                                                    codebook_loader=get_codebook_mapper)
+    write_registries(subject_registry, study_registry, output_dir)
+
+
+def csr2transmart_job(input_dir: str, output_dir: str, config_dir: str, study_id: str = STUDY_ID,
+                      top_tree_node: str = TOP_TREE_NODE, per_study: bool = False):
+    csr2transmart(input_dir, output_dir, None, study_id, top_tree_node, per_study,
+                  ontology_config=get_ontology_config(config_dir))
+
+
+def csr2cbioportal_job(input_dir: str, output_dir: str, ngs_dir: Optional[str] = None,
+                       maf_columns: Optional[Sequence[str]] = None, skip_empty_hugo_symbol: bool = False,
+                       exclude_variant_classification: Sequence[str] = (), incremental: bool = False,
+                       workers: int = 1, per_study: bool = False):
+    maf_filter = MafFilter(columns=list(maf_columns) if maf_columns else None,
+                           skip_empty_hugo_symbol=skip_empty_hugo_symbol,
+                           excluded_variant_classifications=set(exclude_variant_classification))
+    csr2cbioportal(input_dir, ngs_dir, output_dir, maf_filter, incremental, workers, per_study)
+
+
+JOBS: Dict[str, Callable[..., None]] = {
+    'sources2csr': sources2csr_job,
+    'csr2transmart': csr2transmart_job,
+    'csr2cbioportal': csr2cbioportal_job,
+}
+
+
+def init_worker(debug: bool):
+    """Prepare a worker process: configure logging, import the modules that the jobs use
+    and generate the schemas of the entity types, which pydantic caches for the following jobs.
+    """
+    setup_logging(debug)
+    for module in WORKER_MODULES:
+        importlib.import_module(module)
+    for entity_type in list(SubjectEntity.__args__) + list(StudyEntity.__args__):
+        entity_type.schema()
+
+
+def run_job(method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a job in a worker process and account for its duration and memory use
+    :return: the job statistics. peak_rss is the peak resident set size of the worker in KiB,
+        which is the peak of the job if peak_rss_per_job is True, or of the lifetime of the worker otherwise.
+    """
+    per_job = reset_peak_rss()
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    JOBS[method](**params)
+    return {
+        'wall_time': round(time.perf_counter() - start_time, 3),
+        'cpu_time': round(time.process_time() - start_cpu, 3),
+        'peak_rss': get_peak_rss(),
+        'peak_rss_per_job': per_job,
+    }
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+def error_response(request_id: Any, error: RpcError) -> Dict[str, Any]:
+    response_error: Dict[str, Any] = {'code': error.code, 'message': error.message}
+    if error.data is not None:
+        response_error['data'] = error.data
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': response_error}
+
+
+def result_response(request_id: Any, result: Any) -> Dict[str, Any]:
+    return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+
+class Daemon:
+    """
+    Runs conversion jobs that are requested with JSON-RPC 2.0 messages on a pool of worker processes.
+
+    The workers keep the imported modules, the entity schemas, and the configurations and codebooks
+    that were read by earlier jobs (see FileCache). At most workers jobs run at the same time,
+    and at most max_queued jobs wait for a worker; requests for more jobs are rejected.
+    Job methods are sources2csr, csr2transmart and csr2cbioportal, with the parameters of the job
+    functions as named parameters. The other methods are ping, status and shutdown.
+    If a worker process dies, e.g., because it runs out of memory, the jobs of the pool fail
+    and the pool is replaced by a new pool of workers.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queued: int = MAX_QUEUED, debug: bool = False):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.debug = debug
+        self.executor = self.create_executor()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.stopped = threading.Event()
+
+    def create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self.debug,))
+
+    def replace_executor(self, broken: ProcessPoolExecutor):
+        """Replace a pool of which a worker process died, unless it has been replaced already
+        or the daemon is stopping"""
+        with self.lock:
+            if self.executor is not broken or self.stopped.is_set():
+                return
+            logger.warning('A worker process died, starting new workers')
+            self.executor = self.create_executor()
+        broken.shutdown(wait=False)
+
+    def close(self):
+        """Wait for the running and queued jobs and stop the workers"""
+        self.stopped.set()
+        with self.lock:
+            executor = self.executor
+        executor.shutdown(wait=True)
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'running': min(self.active, self.workers),
+                'queued': max(self.active - self.workers, 0),
+                'completed': self.completed,
+                'failed': self.failed,
+            }
+
+    def handle(self, line: str, respond: Callable[[Dict[str, Any]], None]) -> Optional[Future]:
+        """Handle a request message. The response is passed to respond, unless the request is a notification.
+        :param line: the JSON-RPC request
+        :param respond: function that sends a response, called from another thread when a job completes
+        :return: the future of the job response, None if the request is not a job
+        """
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise RpcError(PARSE_ERROR, f'Parse error: {e}')
+            if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+                raise RpcError(INVALID_REQUEST, 'Invalid request')
+            request_id = request.get('id')
+            notification = 'id' not in request
+            method = request['method']
+            params = request.get('params', {})
+            if not isinstance(params, dict):
+                raise RpcError(INVALID_PARAMS, 'Parameters should be passed by name')
+            if method in JOBS:
+                return self.submit(request_id, notification, method, params, respond)
+            if method == 'ping':
+                result: Any = 'pong'
+            elif method == 'status':
+                result = self.status()
+            elif method == 'shutdown':
+                logger.info('Shutting down')
+                self.stopped.set()
+                result = None
+            else:
+                raise RpcError(METHOD_NOT_FOUND, f'Method not found: {method}')
+            if not notification:
+                respond(result_response(request_id, result))
+        except RpcError as e:
+            respond(error_response(request_id, e))
+        return None
+
+    def submit(self, request_id: Any, notification: bool, method: str, params: Dict[str, Any],
+               respond: Callable[[Dict[str, Any]], None]) -> Future:
+        try:
+            inspect.signature(JOBS[method]).bind(**params)
+        except TypeError as e:
+            raise RpcError(INVALID_PARAMS, f'Invalid parameters: {e}')
+        with self.lock:
+            if self.stopped.is_set():
+                raise RpcError(SERVER_BUSY, 'Server is shutting down')
+            if self.active >= self.workers + self.max_queued:
+                raise RpcError(SERVER_BUSY, 'Too many jobs, try again later',
+                               {'running': self.workers, 'queued': self.max_queued})
+            self.active += 1
+            executor = self.executor
+        logger.info(f'Starting {method} job {request_id}')
+        try:
+            future = executor.submit(run_job, method, params)
+        except BrokenProcessPool as e:
+            with self.lock:
+                self.active -= 1
+                self.failed += 1
+            self.replace_executor(executor)
+            raise RpcError(JOB_FAILED, f'Worker process died: {e}', {'type': type(e).__name__})
+
+        def job_done(done: Future):
+            error = done.exception()
+            if isinstance(error, BrokenProcessPool):
+                self.replace_executor(executor)
+            with self.lock:
+                self.active -= 1
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            if error is None:
+                logger.info(f'Finished {method} job {request_id}: {done.result()}')
+                response = result_response(request_id, done.result())
+            else:
+                logger.error(f'Failed {method} job {request_id}: {error}')
+                response = error_response(request_id, RpcError(JOB_FAILED, str(error),
+                                                               {'type': type(error).__name__}))
+            if not notification:
+                respond(response)
+
+        future.add_done_callback(job_done)
+        return future
+
+
+class ResponseWriter:
+    """Writes responses as lines to a stream, from multiple threads"""
+
+    def __init__(self, output: IO[str]):
+        self.output = output
+        self.lock = threading.Lock()
+
+    def __call__(self, response: Dict[str, Any]):
+        with self.lock:
+            self.output.write(json.dumps(response) + '\n')
+            self.output.flush()
+
+
+def serve_lines(daemon: Daemon, lines: IO[str], output: IO[str]):
+    """Handle requests, one per line, until the end of the input or a shutdown request.
+    Waits for the jobs of the requests before returning, so all responses are written.
+    """
+    respond = ResponseWriter(output)
+    futures = []
+    for line in lines:
+        if line.strip():
+            future = daemon.handle(line, respond)
+            if future is not None:
+                futures.append(future)
+            futures = [f for f in futures if not f.done()]
+        if daemon.stopped.is_set():
+            break
+    for future in futures:
+        future.exception()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        serve_lines(self.server.daemon,
+                    io.TextIOWrapper(self.rfile, encoding='utf-8'),
+                    io.TextIOWrapper(self.wfile, encoding='utf-8'))
+        if self.server.daemon.stopped.is_set():
+            threading.Thread(target=self.server.shutdown).start()
+
+
+class UnixSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: Daemon):
+        super().__init__(socket_path, RequestHandler)
+        self.daemon = daemon
+
+
+def serve_socket(daemon: Daemon, socket_path: str):
+    """Handle requests of clients that connect to a Unix socket, until a shutdown request"""
+    if path.exists(socket_path):
+        os.unlink(socket_path)
+    with UnixSocketServer(socket_path, daemon) as server:
+        logger.info(f'Listening on {socket_path}')
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+
+def csr_daemon(socket_path: Optional[str] = None, workers: Optional[int] = None, max_queued: int = MAX_QUEUED,
+               debug: bool = False):
+    """
+    Runs the daemon until a shutdown request, or the end of the standard input.
+
+    :param socket_path: path of the Unix socket to listen on, requests are read from stdin if None
+    :param workers: maximum number of concurrent jobs, defaults to the number of processors
+    :param max_queued: maximum number of jobs waiting for a worker
+    :param debug: print more verbose messages in the workers
+    """
+    logger.info('csr_daemon')
+    daemon = Daemon(workers, max_queued, debug)
+    try:
+        if socket_path is None:
+            serve_lines(daemon, sys.stdin, sys.stdout)
+        else:
+            serve_socket(daemon, socket_path)
+    finally:
+        daemon.close()
+
+
+@click.command()
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False, writable=True),
+              help='Listen on this Unix socket instead of reading requests from standard input')
+@click.option('--workers', type=click.IntRange(min=1),
+              help='Maximum number of concurrent jobs (default: the number of processors)')
+@click.option('--max-queued', type=click.IntRange(min=0), default=MAX_QUEUED, show_default=True,
+              help='Maximum number of jobs waiting for a worker, further requests are rejected')
+@click.option('--debug', is_flag=True, help='Print more verbose messages')
+@click.version_option()
+def run(socket_path: Optional[str], workers: Optional[int], max_queued: int, debug: bool):
+    setup_logging(debug)
+    csr_daemon(socket_path, workers, max_queued, debug)
+
+
+def main():
+    run()
+
+
+if __name__ == '__main__':
+    main()
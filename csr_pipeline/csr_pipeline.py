@@ -0,0 +1,134 @@
+import logging
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, List, Tuple
+
+import click
+
+from csr.csr import CentralSubjectRegistry, StudyRegistry
+from csr.instrumentation import collect, in_worker, run_report
+from csr.logging import setup_logging
+from csr.profiling import PROFILERS, profile_run
+from csr2cbioportal.csr2cbioportal import create_cbioportal_study, create_cbioportal_studies
+from csr2transmart.csr2transmart import read_configuration, write_transmart_data, STUDY_ID, TOP_TREE_NODE
+from csr2transmart.ontology_config import OntologyConfig
+from sources2csr.sources2csr import read_sources, write_registries
+from sources2csr.sources_config import SourcesConfig
+
+logger = logging.getLogger(__name__)
+
+
+def export_transmart_data(*args):
+    """Write the tranSMART data (see write_transmart_data) without returning the mapped data collection,
+    which would otherwise be sent back from the worker process.
+    """
+    write_transmart_data(*args)
+
+
+def csr_pipeline(input_dir: str,
+                 config_dir: Optional[str],
+                 csr_dir: Optional[str] = None,
+                 transmart_dir: Optional[str] = None,
+                 cbioportal_dir: Optional[str] = None,
+                 ngs_dir: Optional[str] = None,
+                 per_study: bool = False,
+                 workers: Optional[int] = None,
+                 sources_config: Optional[SourcesConfig] = None,
+                 ontology_config: Optional[OntologyConfig] = None) -> Tuple[CentralSubjectRegistry, StudyRegistry]:
+    """
+    Reads the source data once and exports the registries to CSR files, tranSMART and cBioPortal,
+    without writing and reading the CSR files in between.
+    The tranSMART data is written in a worker process, concurrently with the cBioPortal study.
+
+    :param input_dir: directory with the source data files
+    :param config_dir: directory with the sources and ontology configuration, if these are not passed
+    :param csr_dir: output directory of the CSR files, these are not written if None
+    :param transmart_dir: output directory of the tranSMART data, not written if None
+    :param cbioportal_dir: output directory of the cBioPortal study, not written if None
+    :param ngs_dir: directory with NGS files for cBioPortal
+    :param per_study: export a tranSMART and cBioPortal study per study in the study registry
+    :param workers: maximum number of worker processes, defaults to the number of processors
+    :param sources_config: the sources configuration, read from config_dir if None
+    :param ontology_config: the ontology configuration, read from config_dir if None
+    :return: the subject registry and the study registry
+    :raises CsrException: if the source data is invalid
+    """
+    logger.info('csr_pipeline')
+    if transmart_dir and ontology_config is None:
+        ontology_config = read_configuration(config_dir)
+    subject_registry, study_registry = read_sources(input_dir, config_dir, sources_config)
+
+    executor: Optional[ProcessPoolExecutor] = None
+    futures: List[Future] = []
+    try:
+        if transmart_dir:
+            if cbioportal_dir and workers != 1:
+                executor = ProcessPoolExecutor(max_workers=1)
+                futures.append(executor.submit(in_worker(export_transmart_data), subject_registry, study_registry,
+                                               ontology_config, transmart_dir, STUDY_ID, TOP_TREE_NODE,
+                                               per_study))
+            else:
+                write_transmart_data(subject_registry, study_registry, ontology_config, transmart_dir,
+                                     STUDY_ID, TOP_TREE_NODE, per_study)
+        if csr_dir:
+            write_registries(subject_registry, study_registry, csr_dir)
+        if cbioportal_dir:
+            if per_study:
+                create_cbioportal_studies(None, ngs_dir, cbioportal_dir, workers=workers,
+                                          subject_registry=subject_registry, study_registry=study_registry)
+            else:
+                create_cbioportal_study(None, ngs_dir, cbioportal_dir, workers=workers,
+                                        subject_registry=subject_registry)
+        for future in futures:
+            collect(future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    logger.info('Done.')
+    return subject_registry, study_registry
+
+
+@click.command()
+@click.argument('input_dir', type=click.Path(file_okay=False, exists=True, readable=True))
+@click.argument('config_dir', type=click.Path(file_okay=False, exists=True, readable=True))
+@click.option('--csr-dir', type=click.Path(file_okay=False, writable=True),
+              help='Output directory of the CSR files')
+@click.option('--transmart-dir', type=click.Path(file_okay=False, writable=True),
+              help='Output directory of the tranSMART data')
+@click.option('--cbioportal-dir', type=click.Path(file_okay=False, writable=True),
+              help='Output directory of the cBioPortal study')
+@click.option('--ngs-dir', type=click.Path(file_okay=False, exists=True, readable=True),
+              help='Directory with NGS files for cBioPortal')
+@click.option('--per-study', is_flag=True,
+              help='Export a tranSMART and cBioPortal study for every study in the study registry')
+@click.option('--workers', type=click.IntRange(min=1),
+              help='Maximum number of worker processes (default: the number of processors)')
+@click.option('--report', type=click.Path(dir_okay=False, writable=True),
+              help='Write a JSON report with the time, rows and memory use of the stages of the run to this file')
+@click.option('--profile', type=click.Choice(PROFILERS),
+              help='Profile the run with cProfile or take tracemalloc snapshots at the stage boundaries')
+@click.option('--profile-dir', type=click.Path(file_okay=False, writable=True), default='.', show_default=True,
+              help='Directory to write the profile files to')
+@click.option('--debug', is_flag=True, help='Print more verbose messages')
+@click.version_option()
+def run(input_dir, config_dir, csr_dir: Optional[str], transmart_dir: Optional[str], cbioportal_dir: Optional[str],
+        ngs_dir: Optional[str], per_study: bool, workers: Optional[int], report: Optional[str],
+        profile: Optional[str], profile_dir: str, debug: bool):
+    if not (csr_dir or transmart_dir or cbioportal_dir):
+        raise click.UsageError('Specify at least one of --csr-dir, --transmart-dir and --cbioportal-dir')
+    setup_logging(debug)
+    with run_report(report, 'csr_pipeline'), profile_run(profile, profile_dir, 'csr_pipeline'):
+        try:
+            csr_pipeline(input_dir, config_dir, csr_dir, transmart_dir, cbioportal_dir, ngs_dir, per_study, workers)
+        except Exception as e:
+            logger.error(e)
+            sys.exit(1)
+
+
+def main():
+    run()
+
+
+if __name__ == '__main__':
+    main()
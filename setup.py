@@ -36,12 +36,16 @@ setup(
         'csr2transmart.mappers',
         'sources2csr',
         'csr2cbioportal',
-        'csr'
+        'csr',
+        'csr_pipeline',
+        'csr_daemon'
     ],
     entry_points={
         'console_scripts': ['csr2transmart=csr2transmart.csr2transmart:main',
                             'sources2csr=sources2csr.sources2csr:main',
-                            'csr2cbioportal=csr2cbioportal.csr2cbioportal:main'],
+                            'csr2cbioportal=csr2cbioportal.csr2cbioportal:main',
+                            'csr_pipeline=csr_pipeline.csr_pipeline:main',
+                            'csr_daemon=csr_daemon.csr_daemon:main'],
     },
     include_package_data=True,
     license="MIT",
@@ -3,8 +3,10 @@ from typing import List, Dict, Sequence
 from dateutil.relativedelta import relativedelta
 
 from csr.csr import CentralSubjectRegistry, Diagnosis
+from csr.instrumentation import count_entities, instrumented
 
 
+@instrumented('add_derived_values', rows_in=count_entities, rows_out=count_entities)
 def add_derived_values(subject_registry: CentralSubjectRegistry) -> CentralSubjectRegistry:
     """Compute derived diagnosis aggregate values
     :param subject_registry: Central Subject Registry
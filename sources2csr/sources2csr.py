@@ -1,45 +1,93 @@
 import logging
 import sys
+from typing import Callable, Optional, Tuple
 
 import click
 
+from csr.csr import CentralSubjectRegistry, StudyRegistry
+from csr.instrumentation import count_entities, run_report, stage
 from csr.logging import setup_logging
+from csr.profiling import PROFILERS, profile_run
 from csr.subject_registry_writer import SubjectRegistryWriter
 
 from csr.study_registry_writer import StudyRegistryWriter
+from sources2csr.codebook_mapper import CodeBookMapper
 from sources2csr.derived_values import add_derived_values
+from sources2csr.sources_config import SourcesConfig
 from sources2csr.sources_reader import SourcesReader
 
 
 logger = logging.getLogger(__name__)
 
 
-def sources2csr(input_dir, output_dir, config_dir):
-    logger.info('sources2csr')
-    try:
-        reader = SourcesReader(input_dir=input_dir, config_dir=config_dir)
-        subject_registry = reader.read_subject_data()
-        add_derived_values(subject_registry)
+def read_sources(input_dir, config_dir=None,
+                 sources_config: Optional[SourcesConfig] = None,
+                 codebook_loader: Callable[[str], CodeBookMapper] = CodeBookMapper) \
+        -> Tuple[CentralSubjectRegistry, StudyRegistry]:
+    """ Read the source data and build the subject registry, with derived values, and the study registry
+
+    :param input_dir: directory with the source data files
+    :param config_dir: directory with the sources configuration, if no configuration is passed
+    :param sources_config: the sources configuration, read from config_dir if None
+    :param codebook_loader: function that returns the codebook mapper for a codebook file path
+    :return: the subject registry and the study registry
+    """
+    reader = SourcesReader(input_dir=input_dir, config_dir=config_dir, sources_config=sources_config,
+                           codebook_loader=codebook_loader)
+    subject_registry = reader.read_subject_data()
+    add_derived_values(subject_registry)
+    study_registry = reader.read_study_data(subject_registry)
+    return subject_registry, study_registry
+
+
+def write_registries(subject_registry: CentralSubjectRegistry, study_registry: StudyRegistry, output_dir):
+    """ Write the subject registry and the study registry to tab delimited files in output_dir
+    """
+    with stage('write_registries', count_entities(subject_registry) + count_entities(study_registry)):
         subject_registry_writer = SubjectRegistryWriter(output_dir)
         subject_registry_writer.write(subject_registry)
-
-        study_registry = reader.read_study_data()
         study_registry_writer = StudyRegistryWriter(output_dir)
         study_registry_writer.write(study_registry)
-    except Exception as e:
-        logger.error(e)
-        sys.exit(1)
+
+
+def sources2csr(input_dir, output_dir, config_dir=None,
+                sources_config: Optional[SourcesConfig] = None) -> Tuple[CentralSubjectRegistry, StudyRegistry]:
+    """ Read the source data and write the subject registry and the study registry to output_dir
+
+    :param input_dir: directory with the source data files
+    :param output_dir: output directory of the CSR files
+    :param config_dir: directory with the sources configuration, if no configuration is passed
+    :param sources_config: the sources configuration, read from config_dir if None
+    :return: the subject registry and the study registry
+    :raises CsrException: if the source data or configuration is missing or invalid
+    """
+    logger.info('sources2csr')
+    subject_registry, study_registry = read_sources(input_dir, config_dir, sources_config)
+    write_registries(subject_registry, study_registry, output_dir)
+    return subject_registry, study_registry
 
 
 @click.command()
 @click.argument('input_dir', type=click.Path(file_okay=False, exists=True, readable=True))
 @click.argument('output_dir', type=click.Path(file_okay=False, writable=True))
 @click.argument('config_dir', type=click.Path(file_okay=False, exists=True, readable=True))
+@click.option('--report', type=click.Path(dir_okay=False, writable=True),
+              help='Write a JSON report with the time, rows and memory use of the stages of the run to this file')
+@click.option('--profile', type=click.Choice(PROFILERS),
+              help='Profile the run with cProfile or take tracemalloc snapshots at the stage boundaries')
+@click.option('--profile-dir', type=click.Path(file_okay=False, writable=True), default='.', show_default=True,
+              help='Directory to write the profile files to')
 @click.option('--debug', is_flag=True, help='Print more verbose messages')
 @click.version_option()
-def run(input_dir, output_dir, config_dir, debug: bool):
+def run(input_dir, output_dir, config_dir, report: Optional[str],
+        profile: Optional[str], profile_dir: str, debug: bool):
     setup_logging(debug)
-    sources2csr(input_dir, output_dir, config_dir)
+    with run_report(report, 'sources2csr'), profile_run(profile, profile_dir, 'sources2csr'):
+        try:
+            sources2csr(input_dir, output_dir, config_dir)
+        except Exception as e:
+            logger.error(e)
+            sys.exit(1)
 
 
 def main():
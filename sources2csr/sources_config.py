@@ -3,8 +3,10 @@ from typing import Dict, Sequence, Optional
 
 from pydantic import BaseModel, validator, Field
 
+from csr.exceptions import CsrException
 
-class SourcesConfigValidationException(ValueError):
+
+class SourcesConfigValidationException(CsrException, ValueError):
     pass
 
 
@@ -1,16 +1,17 @@
 import json
 import logging
-from datetime import datetime
 from math import isnan
 from os import path
-from typing import Any, Tuple, Dict, Union, Sequence
+from typing import Any, Callable, Tuple, Dict, Union, Sequence, Type, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 from csr.csr import CentralSubjectRegistry, StudyRegistry, SubjectEntity, StudyEntity
+from csr.date_parser import get_date_parser
 from csr.tabular_file_reader import TabularFileReader
 from sources2csr.codebook_mapper import CodeBookMapper
 from csr.exceptions import DataException
+from csr.instrumentation import stage
 from sources2csr.sources_config import SourcesConfig, Entity
 
 logger = logging.getLogger(__name__)
@@ -45,19 +46,12 @@ def transform_entity(values: Dict[Any, Any], schema: Dict) -> Dict:
             for k, v in values.items()}
 
 
-def transform_entities(entities: Any, schema: Dict, constructor: Any):
-    id_property = get_id_property(schema)
+def transform_entities(entities: Any, entity_type: Type[BaseModel]) -> List[BaseModel]:
+    schema = entity_type.schema()
     entities = [transform_entity(entity_data, schema) for entity_data in entities]
-    result = []
-    for entity in entities:
-        try:
-            result.append(constructor(entity))
-        except Exception as e:
-            logger.error(e)
-            entity_name = schema['title']
-            id = entity[id_property]
-            raise DataException(f'Invalid data for {entity_name} with id {id}')
-    return result
+    # Imported here, as validation depends on pandas
+    from csr.columnar_validation import validate_entities
+    return validate_entities(entities, entity_type)
 
 
 def read_configuration(config_dir) -> SourcesConfig:
@@ -74,7 +68,10 @@ def read_configuration(config_dir) -> SourcesConfig:
         except Exception as e:
             logger.error(e)
             raise DataException(f'Error parsing source config file: {sources_config_path}')
-        return SourcesConfig(**config_data)
+        try:
+            return SourcesConfig(**config_data)
+        except ValidationError as e:
+            raise DataException(f'Invalid source config file {sources_config_path}:\n{e}') from e
 
 
 def get_source_files(entity_sources_config: Entity, id_property: str):
@@ -106,9 +103,17 @@ def validate_derived_values_not_in_source_config(entity_type: BaseModel, entity_
 
 class SourcesReader:
 
-    def __init__(self, input_dir, config_dir):
+    def __init__(self, input_dir, config_dir=None, sources_config: Optional[SourcesConfig] = None,
+                 codebook_loader: Callable[[str], CodeBookMapper] = CodeBookMapper):
+        """
+        :param input_dir: directory with the source data files
+        :param config_dir: directory with the sources configuration, if no configuration is passed
+        :param sources_config: the sources configuration, read from config_dir if None
+        :param codebook_loader: function that returns the codebook mapper for a codebook file path
+        """
         self.input_dir = input_dir
-        self.sources_config = read_configuration(config_dir)
+        self.sources_config = sources_config if sources_config is not None else read_configuration(config_dir)
+        self.codebook_loader = codebook_loader
 
     def read_source_file_data(self, source_file) -> Sequence[Dict[str, Any]]:
         file_format = self.sources_config.file_format.get(source_file, None)\
@@ -121,7 +126,7 @@ class SourcesReader:
         if self.sources_config.codebooks is not None:
             codebook_filename = self.sources_config.codebooks.get(source_file, None)
             if codebook_filename is not None:
-                codebook_mapper = CodeBookMapper(path.join(self.input_dir, codebook_filename))
+                codebook_mapper = self.codebook_loader(path.join(self.input_dir, codebook_filename))
                 source_file_data = codebook_mapper.apply(source_file_data)
         return source_file_data
 
@@ -202,6 +207,7 @@ class SourcesReader:
                 logger.debug(
                     f'Adding data for attribute {attribute.name} from source {source.file}:{source_column}')
                 source_id_column = source_file_id_mapping[source.file]
+                parse_date = get_date_parser(source.date_format) if source.date_format is not None else None
                 for entity_id, entity in entity_data.items():
                     if entity.get(attribute.name) is not None:
                         continue
@@ -215,9 +221,9 @@ class SourcesReader:
                     value = source_records[0][source_column]
                     if value == '':
                         value = None
-                    if value is not None and source.date_format is not None:
+                    if value is not None and parse_date is not None:
                         try:
-                            value = datetime.strptime(value, source.date_format)
+                            value = parse_date(value)
                         except Exception as e:
                             logger.error(e)
                             raise DataException(f'Error parsing {attribute.name} from'
@@ -227,11 +233,7 @@ class SourcesReader:
         logger.debug(f'{entity_type.__name__} entity data: {entity_data}')
 
         try:
-            return transform_entities(
-                entity_data.values(),
-                entity_type.schema(),
-                lambda e: entity_type(**e)
-            )
+            return transform_entities(entity_data.values(), entity_type)
         except DataException as e:
             logger.error(f'Please check source files: {", ".join(source_files)}')
             raise e
@@ -242,16 +244,27 @@ class SourcesReader:
         subject_registry_data: Dict[str, Sequence[SubjectEntity]] = {}
 
         for entity_type in list(SubjectEntity.__args__):
-            subject_registry_data[entity_type.__name__] = self.read_entity_data(entity_type)
+            with stage(f'read_entity_data.{entity_type.__name__}') as current:
+                subject_registry_data[entity_type.__name__] = self.read_entity_data(entity_type)
+                current.rows_out = len(subject_registry_data[entity_type.__name__])
 
         return CentralSubjectRegistry.create(subject_registry_data)
 
-    def read_study_data(self) -> StudyRegistry:
+    def read_study_data(self, subject_registry: Optional[CentralSubjectRegistry] = None) -> StudyRegistry:
+        """
+        Reads the study registry data from the source files.
+
+        :param subject_registry: optional subject registry that is used to check
+        references from study registry entities to individuals.
+        :return: the study registry.
+        """
         logger.info('Reading study registry data ...')
 
         study_registry_data = {}
 
         for entity_type in list(StudyEntity.__args__):
-            study_registry_data[entity_type.__name__] = self.read_entity_data(entity_type)
+            with stage(f'read_entity_data.{entity_type.__name__}') as current:
+                study_registry_data[entity_type.__name__] = self.read_entity_data(entity_type)
+                current.rows_out = len(study_registry_data[entity_type.__name__])
 
-        return StudyRegistry.create(study_registry_data)
+        return StudyRegistry.create(study_registry_data, subject_registry)
@@ -40,3 +40,15 @@ def mapped_data_collection() -> DataCollection:
 
     mapper = CsrMapper(study_id, top_tree_node)
     return mapper.map(subject_registry, study_registry, ontology_config.nodes)
+
+
+@pytest.fixture
+def mapped_studies_data_collection() -> DataCollection:
+    input_dir = './test_data/input_data/CSR2TRANSMART_TEST_DATA'
+    config_dir = './test_data/input_data/config'
+    ontology_config: OntologyConfig = read_configuration(config_dir)
+    subject_registry: CentralSubjectRegistry = SubjectRegistryReader(input_dir).read_subject_registry()
+    study_registry: StudyRegistry = StudyRegistryReader(input_dir).read_study_registry()
+
+    mapper = CsrMapper('CSR', '\\Central Subject Registry\\')
+    return mapper.map_studies(subject_registry, study_registry, ontology_config.nodes)
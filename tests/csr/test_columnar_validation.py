@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the columnar entity validation.
+"""
+from datetime import date
+
+import pytest
+from pydantic import ValidationError
+
+from csr.columnar_validation import validate_entities
+from csr.csr import Biosource, Biomaterial, Individual, Radiology
+from csr.exceptions import DataException
+
+
+def test_values_are_converted():
+    rows = [
+        {'biosource_id': 'BS1', 'individual_id': 'P1', 'tumor_percentage': '5', 'biosource_date': '2017-03-12'},
+        {'biosource_id': 'BS2', 'individual_id': 'P1', 'tumor_percentage': '5', 'biosource_date': None},
+        {'biosource_id': 'BS3', 'individual_id': 'P2', 'src_biosource_id': 'BS1'},
+    ]
+    biosources = validate_entities(rows, Biosource)
+    assert biosources == [Biosource(**row) for row in rows]
+    assert biosources[0].tumor_percentage == 5
+    assert biosources[0].biosource_date == date(2017, 3, 12)
+    assert biosources[2].tumor_percentage is None
+
+
+def test_create_pydantic_entities():
+    rows = [{'biosource_id': 'BS1', 'individual_id': 'P1', 'tumor_percentage': '5'}]
+    biosource = validate_entities(rows, Biosource, compact=False)[0]
+    assert type(biosource) is Biosource
+    assert biosource.tumor_percentage == 5
+    assert biosource.__fields_set__ == {'biosource_id', 'individual_id', 'tumor_percentage'}
+
+
+def test_all_invalid_rows_are_reported():
+    rows = [
+        {'biosource_id': 'BS1', 'individual_id': 'P1', 'tumor_percentage': 'five'},
+        {'biosource_id': 'BS2', 'individual_id': ''},
+        {'biosource_id': 'BS3', 'individual_id': 'P2', 'src_biosource_id': 'BS3'},
+        {'biosource_id': 'BS4', 'individual_id': 'P2', 'src_biosource_id': 'BS3'},
+        {'biosource_id': 'BS5'},
+    ]
+    with pytest.raises(DataException) as excinfo:
+        validate_entities(rows, Biosource)
+    messages = str(excinfo.value).split('\n')
+    assert messages == [
+        'Invalid data for Biosource with id BS1: tumor_percentage: value is not a valid integer',
+        'Invalid data for Biosource with id BS2: individual_id: ensure this value has at least 1 characters',
+        'Invalid data for Biosource with id BS3: src_biosource_id: Biosource cannot be derived from itself',
+        'Invalid data for Biosource with id BS5: individual_id: field required',
+    ]
+
+
+def test_custom_validators_use_row_values():
+    rows = [
+        {'biomaterial_id': 'BM1', 'src_biosource_id': 'BS1', 'type': 'RNA', 'library_strategy': ['RNA-Seq']},
+        {'biomaterial_id': 'BM2', 'src_biosource_id': 'BS1', 'type': 'DNA', 'library_strategy': ['RNA-Seq']},
+    ]
+    with pytest.raises(DataException) as excinfo:
+        validate_entities(rows, Biomaterial)
+    assert str(excinfo.value) == 'Invalid data for Biomaterial with id BM2: library_strategy: ' \
+                                 'Not allowed RNA-Seq library strategy for molecule type: DNA'
+
+
+def test_required_field_may_be_none():
+    rows = [{'radiology_id': 'R1', 'examination_date': '2016-05-01', 'image_type': 'MRI',
+             'individual_id': 'P1', 'diagnosis_id': None, 'body_part': 'torso'}]
+    radiology = validate_entities(rows, Radiology)[0]
+    assert radiology.diagnosis_id is None
+    del rows[0]['diagnosis_id']
+    with pytest.raises(DataException) as excinfo:
+        validate_entities(rows, Radiology)
+    assert 'diagnosis_id: field required' in str(excinfo.value)
+
+
+def test_categorical_values_are_shared():
+    first = validate_entities([{'biomaterial_id': 'BM1', 'src_biosource_id': 'BS1', 'type': ''.join(['R', 'NA'])}],
+                              Biomaterial)
+    second = validate_entities([{'biomaterial_id': 'BM2', 'src_biosource_id': 'BS1', 'type': ''.join(['RN', 'A'])}],
+                               Biomaterial)
+    assert first[0].type is second[0].type
+
+
+def test_values_of_different_types_are_distinct():
+    rows = [
+        {'individual_id': 'P1', 'ic_type': True, 'ic_version': True},
+        {'individual_id': 'P2', 'ic_type': 1, 'ic_version': 1},
+        {'individual_id': 'P3', 'ic_type': 1.0, 'ic_version': 1.0},
+    ]
+    individuals = validate_entities(rows, Individual)
+    assert [individual.ic_type for individual in individuals] == [Individual(**row).ic_type for row in rows] \
+        == ['True', '1', '1.0']
+    assert individuals == [Individual(**row) for row in rows]
+
+
+def test_nan_is_not_missing():
+    row = {'individual_id': 'P1', 'diagnosis_count': float('nan')}
+    with pytest.raises(ValidationError):
+        Individual(**row)
+    with pytest.raises(DataException) as excinfo:
+        validate_entities([row], Individual)
+    assert str(excinfo.value) == 'Invalid data for Individual with id P1: diagnosis_count: value is not a valid integer'
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the creation of data frames from CSR entities.
+"""
+from datetime import date
+
+from csr.csr import Individual, Biomaterial
+from csr.data_frames import entities_to_data_frame
+from csr.entity_records import to_record
+
+
+def test_entities_to_data_frame():
+    individuals = [Individual(individual_id='P1', gender='female', birth_date=date(2001, 2, 3), diagnosis_count=2),
+                   to_record(Individual(individual_id='P2', ic_version=1.5))]
+    df = entities_to_data_frame(individuals, Individual)
+    assert list(df.columns) == list(Individual.__fields__.keys())
+    assert df['individual_id'].dtype == 'string'
+    assert df['gender'].dtype == 'category'
+    assert df['birth_date'].dtype == 'datetime64[ns]'
+    assert df['diagnosis_count'].dtype == 'Int64'
+    assert df['ic_version'].dtype == 'float64'
+    assert df['birth_date'].isna().tolist() == [False, True]
+    assert df['diagnosis_count'].tolist()[0] == 2
+
+
+def test_list_fields():
+    biomaterials = [Biomaterial(biomaterial_id='BM1', src_biosource_id='BS1', library_strategy=['WXS'])]
+    df = entities_to_data_frame(biomaterials, Biomaterial)
+    assert df['library_strategy'].dtype == 'object'
+    assert df['library_strategy'].tolist() == [['WXS']]
+
+
+def test_no_entities():
+    df = entities_to_data_frame([], Individual)
+    assert len(df) == 0
+    assert list(df.columns) == list(Individual.__fields__.keys())
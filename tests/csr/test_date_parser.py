@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the date parser.
+"""
+from datetime import datetime
+
+import pytest
+
+from csr.date_parser import compile_date_parser, get_date_parser
+
+
+@pytest.mark.parametrize('date_format,value', [
+    ('%Y-%m-%d', '2017-03-12'),
+    ('%Y-%m-%d', '2017-3-2'),
+    ('%d-%m-%Y', '12-03-2017'),
+    ('%d/%m/%Y', '12/03/2017'),
+    ('%d.%m.%Y', '12.03.2017'),
+    ('%d-%m-%Y', ' 2-03-2017'),
+])
+def test_parse_date_as_strptime(date_format, value):
+    parse = compile_date_parser(date_format)
+    assert parse(value) == datetime.strptime(value, date_format)
+
+
+@pytest.mark.parametrize('date_format,value', [
+    ('%Y-%m-%d', '2017-13-01'),
+    ('%Y-%m-%d', '2017-02-30'),
+    ('%d-%m-%Y', '2017-03-12'),
+    ('%d/%m/%Y', '12/03/17'),
+    ('%Y-%m-%d', ''),
+])
+def test_invalid_date(date_format, value):
+    parse = compile_date_parser(date_format)
+    with pytest.raises(ValueError) as excinfo:
+        parse(value)
+    with pytest.raises(ValueError) as strptime_excinfo:
+        datetime.strptime(value, date_format)
+    assert str(excinfo.value) == str(strptime_excinfo.value)
+
+
+def test_memoization():
+    parse = compile_date_parser('%d-%m-%Y')
+    first = parse('01-02-1993')
+    assert parse('01-02-1993') is first
+    assert parse.cache_info().hits == 1
+    assert get_date_parser('%d-%m-%Y') is get_date_parser('%d-%m-%Y')
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the integer entity index of the registries.
+"""
+from csr.csr import CentralSubjectRegistry, Individual, Biosource, Biomaterial
+from csr.entity_index import EntityIndex, NO_REFERENCE, MISSING_REFERENCE
+
+
+def test_entity_index():
+    registry = CentralSubjectRegistry.create({
+        'Individual': [Individual(individual_id='P1'), Individual(individual_id='P2')],
+        'Biosource': [Biosource(biosource_id='BS1', individual_id='P2'),
+                      Biosource(biosource_id='BS2', individual_id='P1', src_biosource_id='BS1')],
+    })
+    index = registry.entity_index
+    assert index.get_key('Individual', 'P2') == 1
+    assert index.get_key('Individual', 'P3') is None
+    assert index.get_entity('Biosource', 1).biosource_id == 'BS2'
+    assert index.get_references('Biosource', 'individual_id').tolist() == [1, 0]
+    assert index.get_references('Biosource', 'src_biosource_id').tolist() == [NO_REFERENCE, 0]
+    assert ('diagnosis_id', 'Diagnosis') not in index.get_reference_fields('Biosource')
+    assert index.get_references('Biosource', 'diagnosis_id').tolist() == [NO_REFERENCE, NO_REFERENCE]
+
+
+def test_missing_references():
+    index = EntityIndex({
+        'Biosource': [Biosource(biosource_id='BS1', individual_id='P1')],
+        'Biomaterial': [Biomaterial(biomaterial_id='BM1', src_biosource_id='BS2')],
+    })
+    assert index.get_references('Biomaterial', 'src_biosource_id').tolist() == [MISSING_REFERENCE]
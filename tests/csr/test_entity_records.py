@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the compact entity records.
+"""
+import pickle
+from datetime import date
+
+from csr.csr import Individual, Biomaterial
+from csr.entity_records import get_record_type, to_record, get_entity_type, EntityRecord
+
+
+def test_record_type():
+    record_type = get_record_type(Individual)
+    assert record_type is get_record_type(Individual)
+    assert issubclass(record_type, EntityRecord)
+    assert record_type.schema()['title'] == 'Individual'
+    assert list(record_type.__fields__) == list(Individual.__fields__)
+    assert not hasattr(record_type(individual_id='P1'), '__dict__')
+
+
+def test_record_values():
+    individual = Individual(individual_id='P1', gender='f', birth_date='1993-02-01')
+    record = to_record(individual)
+    assert record.individual_id == 'P1'
+    assert record.birth_date == date(1993, 2, 1)
+    assert record.diagnosis_count is None
+    assert record.dict() == individual.dict()
+    assert record == individual
+    assert repr(record) == repr(individual)
+    assert get_entity_type(record) is Individual
+    assert record.to_model() == individual
+
+    record.diagnosis_count = 2
+    assert record.diagnosis_count == 2
+
+
+def test_pickle_record():
+    record = get_record_type(Biomaterial)(biomaterial_id='BM1', src_biosource_id='BS1', library_strategy=['WGS'])
+    copy = pickle.loads(pickle.dumps(record))
+    assert type(copy) is type(record)
+    assert copy == record
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the referential integrity checks of the registries.
+"""
+import pytest
+
+from csr.csr import CentralSubjectRegistry, StudyRegistry, Individual, Diagnosis, Biosource, Biomaterial, \
+    Study, IndividualStudy
+from csr.entity_validation import find_derivation_cycles
+from csr.exceptions import DataException
+
+
+def test_valid_references():
+    registry = CentralSubjectRegistry.create({
+        'Individual': [Individual(individual_id='P1')],
+        'Diagnosis': [Diagnosis(diagnosis_id='D1', individual_id='P1')],
+        'Biosource': [Biosource(biosource_id='BS1', individual_id='P1', diagnosis_id='D1'),
+                      Biosource(biosource_id='BS2', individual_id='P1', src_biosource_id='BS1')],
+        'Biomaterial': [Biomaterial(biomaterial_id='BM1', src_biosource_id='BS2')]
+    })
+    StudyRegistry.create({
+        'Study': [Study(study_id='S1')],
+        'IndividualStudy': [IndividualStudy(study_id_individual_study_id='S1_1', individual_study_id='1',
+                                            individual_id='P1', study_id='S1')]
+    }, registry)
+
+
+def test_invalid_entity_types():
+    with pytest.raises(DataException) as excinfo:
+        CentralSubjectRegistry.create({'Study': [Study(study_id='S1')]})
+    assert 'Invalid entity type in subject registry: Study.' in str(excinfo.value)
+    with pytest.raises(DataException) as excinfo:
+        CentralSubjectRegistry.create({'Individual': [Diagnosis(diagnosis_id='D1', individual_id='P1')]})
+    assert 'but expected Individual' in str(excinfo.value)
+
+
+def test_all_invalid_references_are_reported():
+    with pytest.raises(DataException) as excinfo:
+        CentralSubjectRegistry.create({
+            'Individual': [Individual(individual_id='P1')],
+            'Diagnosis': [Diagnosis(diagnosis_id='D1', individual_id='P2')],
+            'Biosource': [Biosource(biosource_id='BS1', individual_id='P1', diagnosis_id='D2'),
+                          Biosource(biosource_id='BS2', individual_id='P1', src_biosource_id='BS3')],
+        })
+    assert str(excinfo.value).split('\n')[1:] == [
+        'Diagnosis with id D1 has reference to non-existing Individual with id P2.',
+        'Biosource with id BS1 has reference to non-existing Diagnosis with id D2.',
+        'Biosource with id BS2 has reference to non-existing Biosource with id BS3.',
+    ]
+
+
+def test_references_to_other_registry():
+    registry = CentralSubjectRegistry.create({'Individual': [Individual(individual_id='P1')]})
+    with pytest.raises(DataException) as excinfo:
+        StudyRegistry.create({
+            'Study': [Study(study_id='S1')],
+            'IndividualStudy': [IndividualStudy(study_id_individual_study_id='S1_2', individual_study_id='2',
+                                                individual_id='P2', study_id='S1')]
+        }, registry)
+    assert 'IndividualStudy with id S1_2 has reference to non-existing Individual with id P2.' \
+           in str(excinfo.value)
+
+
+def test_derivation_cycles():
+    with pytest.raises(DataException) as excinfo:
+        CentralSubjectRegistry.create({
+            'Biosource': [Biosource(biosource_id='BS1', individual_id='P1', src_biosource_id='BS3'),
+                          Biosource(biosource_id='BS2', individual_id='P1', src_biosource_id='BS1'),
+                          Biosource(biosource_id='BS3', individual_id='P1', src_biosource_id='BS2'),
+                          Biosource(biosource_id='BS4', individual_id='P1', src_biosource_id='BS3')],
+        })
+    assert 'Biosource derivation cycle: BS1 -> BS3 -> BS2 -> BS1.' in str(excinfo.value)
+
+
+def test_find_derivation_cycles():
+    assert find_derivation_cycles([-1, 0, 1]) == []
+    assert find_derivation_cycles([1, 0, 0, 3, -2]) == [[0, 1], [3]]
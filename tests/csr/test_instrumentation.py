@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the instrumentation of the stages of a run.
+"""
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from csr import instrumentation
+from csr.instrumentation import collect, in_worker, instrumented, run_report, stage
+
+
+@instrumented('count_rows', rows_in=len, rows_out=len)
+def count_rows(rows):
+    return [row for row in rows if row]
+
+
+def test_run_report(tmp_path):
+    report_path = tmp_path / 'run.json'
+    with run_report(str(report_path), 'test'):
+        with stage('read', 10) as current:
+            current.rows_out = 8
+        count_rows([1, 0, 2])
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            assert collect(executor.submit(in_worker(count_rows), [3, 4]).result()) == [3, 4]
+    assert not instrumentation.is_recording()
+
+    report = json.loads(report_path.read_text())
+    assert report['command'] == 'test'
+    assert report['status'] == 'completed'
+    assert report['wall_time'] >= 0
+    stages = report['stages']
+    assert [s['name'] for s in stages] == ['read', 'count_rows', 'count_rows']
+    assert [(s['rows_in'], s['rows_out']) for s in stages] == [(10, 8), (3, 2), (2, 2)]
+    assert stages[0]['pid'] == stages[1]['pid'] != stages[2]['pid']
+    assert all(s['completed'] and s['cpu_time'] >= 0 for s in stages)
+
+
+def test_failed_run_report(tmp_path):
+    report_path = tmp_path / 'run.json'
+    with pytest.raises(ValueError):
+        with run_report(str(report_path), 'test'):
+            with stage('fail'):
+                raise ValueError('failure')
+    report = json.loads(report_path.read_text())
+    assert report['status'] == 'failed'
+    assert [(s['name'], s['completed']) for s in report['stages']] == [('fail', False)]
+
+
+def test_not_recording():
+    assert in_worker(count_rows) is count_rows
+    with stage('ignored') as current:
+        current.rows_out = 1
+    assert count_rows([1]) == [1]
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the profiling of a run.
+"""
+import multiprocessing
+import pstats
+import sys
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from csr import instrumentation
+from csr.instrumentation import stage
+from csr.profiling import profile_run
+
+
+def allocate():
+    return [str(i) for i in range(1000)]
+
+
+def run_worker_stage():
+    with stage('worker'):
+        allocate()
+    return tracemalloc.is_tracing(), instrumentation.stage_hook is None, sys.getprofile() is None
+
+
+def test_no_profile(tmp_path):
+    with profile_run(None, str(tmp_path), 'test'):
+        with stage('allocate'):
+            allocate()
+    assert list(tmp_path.iterdir()) == []
+    assert instrumentation.stage_hook is None
+
+
+def test_cprofile(tmp_path):
+    profile_dir = tmp_path / 'profile'
+    with profile_run('cprofile', str(profile_dir), 'test'):
+        allocate()
+    stats = pstats.Stats(str(profile_dir / 'test.pstats'))
+    assert any(function_name == 'allocate' for _, _, function_name in stats.stats)
+    assert 'allocate' in (profile_dir / 'test_top.txt').read_text()
+
+
+def test_tracemalloc(tmp_path):
+    with profile_run('tracemalloc', str(tmp_path), 'test'):
+        with stage('read entities'):
+            allocate()
+    assert instrumentation.stage_hook is None
+    assert not tracemalloc.is_tracing()
+    snapshots = sorted(path.name for path in tmp_path.glob('*.tracemalloc'))
+    assert [name.split('_', 2)[2] for name in snapshots] == [
+        'run_start.tracemalloc', 'read_entities_start.tracemalloc',
+        'read_entities_end.tracemalloc', 'run_end.tracemalloc']
+    first = tracemalloc.Snapshot.load(str(tmp_path / snapshots[1]))
+    second = tracemalloc.Snapshot.load(str(tmp_path / snapshots[2]))
+    assert second.compare_to(first, 'lineno')
+    assert (tmp_path / 'test_tracemalloc_top.txt').read_text().startswith('Peak traced memory')
+
+
+@pytest.mark.parametrize('profiler', ['cprofile', 'tracemalloc'])
+def test_no_profile_in_forked_workers(tmp_path, profiler):
+    with profile_run(profiler, str(tmp_path), 'test'):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as executor:
+            assert executor.submit(run_worker_stage).result() == (False, True, True)
+    assert not any('worker' in path.name for path in tmp_path.iterdir())
+
+
+def test_tracemalloc_failed_run(tmp_path):
+    with pytest.raises(ValueError):
+        with profile_run('tracemalloc', str(tmp_path), 'test'):
+            raise ValueError('failed')
+    assert instrumentation.stage_hook is None
+    assert not tracemalloc.is_tracing()
+    assert (tmp_path / 'test_tracemalloc_top.txt').exists()
+
+
+def test_unknown_profiler(tmp_path):
+    with pytest.raises(ValueError):
+        with profile_run('perf', str(tmp_path), 'test'):
+            pass
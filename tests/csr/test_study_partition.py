@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for partitioning the subject registry by study.
+"""
+from csr.csr import CentralSubjectRegistry, StudyRegistry, Individual, Diagnosis, Biosource, Biomaterial, \
+    Study, IndividualStudy
+from csr.study_partition import partition_by_study
+
+
+def get_ids(registry: CentralSubjectRegistry, entity_type_name: str, id_field: str):
+    return [getattr(entity, id_field) for entity in registry.entity_data[entity_type_name]]
+
+
+def test_partition_by_study():
+    subject_registry = CentralSubjectRegistry.create({
+        'Individual': [Individual(individual_id='P1'), Individual(individual_id='P2'),
+                       Individual(individual_id='P3')],
+        'Diagnosis': [Diagnosis(diagnosis_id='D1', individual_id='P1'),
+                      Diagnosis(diagnosis_id='D2', individual_id='P2')],
+        'Biosource': [Biosource(biosource_id='BS1', individual_id='P1', diagnosis_id='D1'),
+                      Biosource(biosource_id='BS2', individual_id='P2'),
+                      Biosource(biosource_id='BS3', individual_id='P3')],
+        'Biomaterial': [Biomaterial(biomaterial_id='BM1', src_biosource_id='BS1'),
+                        Biomaterial(biomaterial_id='BM2', src_biosource_id='BS2'),
+                        Biomaterial(biomaterial_id='BM3', src_biosource_id='BS3')],
+    })
+    study_registry = StudyRegistry.create({
+        'Study': [Study(study_id='S1'), Study(study_id='S2'), Study(study_id='S3')],
+        'IndividualStudy': [
+            IndividualStudy(study_id_individual_study_id='1', individual_study_id='1',
+                            individual_id='P1', study_id='S1'),
+            IndividualStudy(study_id_individual_study_id='2', individual_study_id='2',
+                            individual_id='P2', study_id='S1'),
+            IndividualStudy(study_id_individual_study_id='3', individual_study_id='3',
+                            individual_id='P2', study_id='S2'),
+        ]
+    })
+
+    partitions = partition_by_study(subject_registry, study_registry)
+
+    assert list(partitions) == ['S1', 'S2', 'S3']
+    assert get_ids(partitions['S1'], 'Individual', 'individual_id') == ['P1', 'P2']
+    assert get_ids(partitions['S1'], 'Diagnosis', 'diagnosis_id') == ['D1', 'D2']
+    assert get_ids(partitions['S1'], 'Biomaterial', 'biomaterial_id') == ['BM1', 'BM2']
+    assert get_ids(partitions['S2'], 'Individual', 'individual_id') == ['P2']
+    assert get_ids(partitions['S2'], 'Biosource', 'biosource_id') == ['BS2']
+    assert get_ids(partitions['S2'], 'Biomaterial', 'biomaterial_id') == ['BM2']
+    assert partitions['S3'].entity_data['Individual'] == []
+    assert partitions['S3'].entity_data['Biomaterial'] == []
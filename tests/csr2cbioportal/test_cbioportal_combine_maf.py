@@ -5,7 +5,12 @@ import unittest
 import tempfile
 import os
 
+import pytest
+from pydantic import ValidationError
+
+from csr.exceptions import DataException
 from csr2cbioportal import csr2cbioportal
+from csr2cbioportal.maf_filter import MafFilter
 
 
 def create_tsv_file(file, table):
@@ -110,3 +115,76 @@ def test_skip_comment_lines(tmp_path):
     assert os.path.exists(result_maf_file)
     assert len(samples) == 1
     assert 'A' in samples
+
+
+def test_parallel_combination_preserves_file_order(tmp_path):
+    ngs_dir = tmp_path.as_posix()
+    for index in range(4):
+        maf_file = os.path.join(ngs_dir, 'test{}.maf'.format(index))
+        create_tsv_file(maf_file, [
+            ['Hugo_Symbol', 'Tumor_Sample_Barcode', 'C{}'.format(index)],
+            ['H1', 'S{}'.format(index), 'V{}'.format(index)],
+            [],
+            ['H2', 'S{}'.format(index)]
+        ])
+        gz_file(maf_file)
+    out_dir = tempfile.mkdtemp()
+    result_sequential = os.path.join(out_dir, 'sequential.maf')
+    result_parallel = os.path.join(out_dir, 'parallel.maf')
+
+    samples_sequential = csr2cbioportal.combine_maf(ngs_dir, result_sequential, workers=1)
+    samples_parallel = csr2cbioportal.combine_maf(ngs_dir, result_parallel, workers=2)
+
+    assert samples_sequential == samples_parallel == {'S0', 'S1', 'S2', 'S3'}
+    with open(result_sequential, 'rb') as sequential, open(result_parallel, 'rb') as parallel:
+        assert sequential.read() == parallel.read()
+    table = read_tsv_file(result_parallel)
+    assert len(table) == 9
+    assert sorted(os.listdir(out_dir)) == ['parallel.maf', 'sequential.maf']
+
+
+def test_column_projection_and_variant_filters(tmp_path):
+    ngs_dir = tmp_path.as_posix()
+    maf_file = os.path.join(ngs_dir, 'test1.maf')
+    create_tsv_file(maf_file, [
+        ['Hugo_Symbol', 'Tumor_Sample_Barcode', 'Variant_Classification', 'Extra'],
+        ['H1', 'A', 'Missense_Mutation', '1'],
+        ['', 'B', 'Missense_Mutation', '2'],
+        ['H3', 'C', 'Silent', '3'],
+        ['H4', 'D', 'Nonsense_Mutation', '4']
+    ])
+    gz_file(maf_file)
+    out_dir = tempfile.mkdtemp()
+    result_maf_file = os.path.join(out_dir, 'result.maf')
+
+    samples = csr2cbioportal.combine_maf(
+        ngs_dir=ngs_dir,
+        output_file_location=result_maf_file,
+        maf_filter=MafFilter(columns=['Tumor_Sample_Barcode', 'Hugo_Symbol'],
+                             skip_empty_hugo_symbol=True,
+                             excluded_variant_classifications={'Silent'}))
+
+    assert read_tsv_file(result_maf_file) == [
+        ['Tumor_Sample_Barcode', 'Hugo_Symbol'],
+        ['A', 'H1'],
+        ['D', 'H4']
+    ]
+    assert samples == {'A', 'D'}
+
+
+def test_unknown_maf_columns(tmp_path):
+    ngs_dir = tmp_path.as_posix()
+    maf_file = os.path.join(ngs_dir, 'test1.maf')
+    create_tsv_file(maf_file, [
+        ['Hugo_Symbol', 'Tumor_Sample_Barcode'],
+        ['H1', 'A']
+    ])
+    gz_file(maf_file)
+    maf_filter = MafFilter(columns=['Tumor_Sample_Barcode', 'Hugo_Symbol', 'Unknown'])
+    with pytest.raises(DataException, match='Unknown'):
+        csr2cbioportal.combine_maf(ngs_dir, os.path.join(ngs_dir, 'result.maf'), maf_filter=maf_filter)
+
+
+def test_required_maf_columns():
+    with pytest.raises(ValidationError, match='Tumor_Sample_Barcode'):
+        MafFilter(columns=['Hugo_Symbol', 'Variant_Classification'])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the incremental mode of the csr2cbioportal application.
+"""
+import os
+import shutil
+
+from click.testing import CliRunner
+
+from csr2cbioportal import csr2cbioportal
+from csr2cbioportal.incremental import CHECKSUM_SUFFIX, MANIFEST_FILE, compute_checksum
+
+
+def run_incremental(input_dir, output_dir):
+    runner = CliRunner()
+    result = runner.invoke(csr2cbioportal.run, [input_dir, '--ngs-dir', os.path.join(input_dir, 'NGS'),
+                                                output_dir, '--incremental'])
+    assert result.exit_code == 0
+
+
+def test_incremental_transformation(tmp_path):
+    input_dir = (tmp_path / 'input').as_posix()
+    output_dir = (tmp_path / 'output').as_posix()
+    shutil.copytree('./test_data/input_data/CSR2CBIOPORTAL_TEST_DATA', input_dir)
+    run_incremental(input_dir, output_dir)
+    assert os.path.exists(os.path.join(output_dir, MANIFEST_FILE))
+
+    outputs = ['data_clinical_sample.txt', 'data_mutations.maf', 'data_cna_continuous.txt', 'data_cna_discrete.txt']
+    for output in outputs:
+        os.utime(os.path.join(output_dir, output), (0, 0))
+    cna_path = os.path.join(input_dir, 'NGS', 'pmc_test_WXS_all_thresholded.by_genes.txt')
+    with open(cna_path, 'a') as cna_file:
+        cna_file.write('GENE1\t-7\t1p36\t1\t2\n')
+    with open(cna_path + CHECKSUM_SUFFIX, 'w') as checksum_file:
+        checksum_file.write('{}  {}\n'.format(compute_checksum(cna_path), os.path.basename(cna_path)))
+    run_incremental(input_dir, output_dir)
+
+    # Only the outputs of the changed input are written again
+    modified = [output for output in outputs if os.path.getmtime(os.path.join(output_dir, output)) > 0]
+    assert modified == ['data_cna_discrete.txt']
+    with open(os.path.join(output_dir, 'data_cna_discrete.txt')) as cna_file:
+        assert cna_file.readlines()[-1] == 'GENE1\t\t1\t2\n'
+
+    # Outputs of removed inputs are removed
+    os.remove(os.path.join(input_dir, 'NGS', 'pmc_test_WXS_all_thresholded.by_genes.txt'))
+    run_incremental(input_dir, output_dir)
+    assert not os.path.exists(os.path.join(output_dir, 'data_cna_discrete.txt'))
+    assert not os.path.exists(os.path.join(output_dir, 'meta_cna_discrete.txt'))
+    assert os.path.exists(os.path.join(output_dir, 'data_cna_continuous.txt'))
+
+
+def test_checksum_mismatch(tmp_path):
+    input_dir = (tmp_path / 'input').as_posix()
+    output_dir = (tmp_path / 'output').as_posix()
+    shutil.copytree('./test_data/input_data/CSR2CBIOPORTAL_TEST_DATA', input_dir)
+    cna_path = os.path.join(input_dir, 'NGS', 'pmc_test_WXS_all_thresholded.by_genes.txt')
+    with open(cna_path + CHECKSUM_SUFFIX, 'w') as checksum_file:
+        checksum_file.write('0' * 40 + '  pmc_test_WXS_all_thresholded.by_genes.txt\n')
+    runner = CliRunner()
+    result = runner.invoke(csr2cbioportal.run, [input_dir, '--ngs-dir', os.path.join(input_dir, 'NGS'),
+                                                output_dir, '--incremental'])
+    assert result.exit_code == 1
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    assert not os.path.exists(manifest_path) or 'thresholded' not in open(manifest_path).read()
@@ -2,9 +2,10 @@ from collections import Counter
 
 import pandas as pd
 import pytest
-from csr.csr import CentralSubjectRegistry
+from csr.csr import CentralSubjectRegistry, Individual, Diagnosis, Biosource, Biomaterial
 from csr.subject_registry_reader import SubjectRegistryReader
-from csr2cbioportal.transform_clinical import transform_patient_clinical_data, transform_sample_clinical_data
+from csr2cbioportal.transform_clinical import transform_patient_clinical_data, transform_sample_clinical_data, \
+    fix_integer_na_columns, drop_duplicate_rows, subject_registry_to_sample_data_df, write_clinical_data
 
 
 @pytest.fixture
@@ -43,3 +44,72 @@ def test_sample_clinical_data(sample_clinical_data):
                                                            'SAMPLE_ID', 'SRC_BIOMATERIAL_ID', 'TISSUE', 'TOPOGRAPHY',
                                                            'TREATMENT_PROTOCOL', 'TUMOR_PERCENTAGE', 'TUMOR_STAGE',
                                                            'TUMOR_TYPE', 'TYPE', 'SRC_BIOSOURCE_ID'])
+
+
+def test_categorical_columns(patient_clinical_data, sample_clinical_data):
+    assert patient_clinical_data['GENDER'].dtype == 'category'
+    assert sample_clinical_data['TISSUE'].dtype == 'category'
+    assert sample_clinical_data['BIOSOURCE_ID'].dtype == 'string'
+
+
+def test_integer_na_columns(sample_clinical_data):
+    assert list(sample_clinical_data['TUMOR_PERCENTAGE']) == [5, 3, 3, 1]
+    df = fix_integer_na_columns(pd.DataFrame({'INTEGER': [1.0, None, 3.0],
+                                              'FLOAT': [1.5, None, 1e-05],
+                                              'COUNT': pd.array([2, 3, 4], dtype='Int64')}))
+    assert list(df['INTEGER']) == [1, 'NA', 3]
+    assert df['FLOAT'].dtype == 'float64'
+    assert df['COUNT'].dtype == 'Int64'
+
+
+def test_drop_duplicate_rows():
+    df = pd.DataFrame({'ID': ['A', 'B', 'A', 'A', 'C'],
+                       'VALUE': [1.0, None, 1.0, 2.0, None],
+                       'TYPE': pd.Categorical(['x', 'y', 'x', 'x', None])})
+    df = pd.concat([df, df.iloc[[1, 4]]])
+    assert drop_duplicate_rows(df).equals(df.iloc[[0, 1, 3, 4]])
+
+
+def test_drop_duplicate_rows_with_lists():
+    df = pd.DataFrame({'ID': ['A', 'A', 'A', 'B'],
+                       'LIBRARY_STRATEGY': pd.Series([['WGS', 'WXS'], ['WGS', 'WXS'], ['WGS'], None], dtype=object)})
+    assert drop_duplicate_rows(df).equals(df.iloc[[0, 2, 3]])
+
+
+def test_sample_data_assembly():
+    subject_registry = CentralSubjectRegistry.create({
+        'Individual': [Individual(individual_id='P1')],
+        'Diagnosis': [Diagnosis(diagnosis_id='D1', individual_id='P1', tumor_type='T1')],
+        'Biosource': [Biosource(biosource_id='BS1', individual_id='P1', tissue='liver'),
+                      Biosource(biosource_id='BS2', individual_id='P1', diagnosis_id='D1',
+                                src_biosource_id='BS1')],
+        'Biomaterial': [Biomaterial(biomaterial_id='BM1', src_biosource_id='BS2'),
+                        Biomaterial(biomaterial_id='BM2', src_biosource_id='BS1')]
+    })
+    sample_data = subject_registry_to_sample_data_df(subject_registry)
+    assert list(sample_data.columns[-3:]) == ['SRC_BIOSOURCE_ID', 'PATIENT_ID', 'SAMPLE_ID']
+    assert not any(column.endswith(('_x', '_y', '_KEY')) for column in sample_data.columns)
+    assert list(sample_data['SAMPLE_ID']) == ['BS2_BM1', 'BS1_BM2']
+    assert list(sample_data['SRC_BIOSOURCE_ID']) == ['BS2', 'BS1']
+    assert list(sample_data['PATIENT_ID']) == ['P1', 'P1']
+    assert list(sample_data['TUMOR_TYPE'].astype(object).fillna('')) == ['T1', '']
+    assert sample_data['TUMOR_TYPE'].dtype == 'category'
+
+
+def test_write_clinical_data(tmp_path):
+    subject_registry = SubjectRegistryReader('./test_data/input_data/CSR2CBIOPORTAL_TEST_DATA').read_subject_registry()
+    sample_data, sample_header = transform_sample_clinical_data(subject_registry)
+    assert sample_header[0][:2] == ['#BIOMATERIAL_ID', 'SRC_BIOMATERIAL_ID']
+    assert sample_header[2][sample_data.columns.get_loc('TUMOR_PERCENTAGE')] == 'NUMBER'
+    assert sample_header[2][sample_data.columns.get_loc('TUMOR_TYPE')] == 'STRING'
+    assert sample_header[3] == ['#1'] + ['1'] * (len(sample_data.columns) - 1)
+
+    chunked_file = (tmp_path / 'chunked.txt').as_posix()
+    single_file = (tmp_path / 'single.txt').as_posix()
+    write_clinical_data(sample_data, sample_header, chunked_file, chunk_size=1, workers=2)
+    write_clinical_data(sample_data, sample_header, single_file)
+    with open(chunked_file) as chunked, open(single_file) as single:
+        lines = chunked.readlines()
+        assert lines == single.readlines()
+    assert len(lines) == 4 + 1 + len(sample_data)
+    assert lines[4].startswith('BIOMATERIAL_ID\tSRC_BIOMATERIAL_ID\t')
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the transformation of CNA data files.
+"""
+import gzip
+
+import pytest
+
+from csr2cbioportal.transform_cna import transform_cna_file, transform_segment_file, split_cna_file, \
+    split_segment_file, SEGMENT_HEADER
+
+
+def test_transform_cna_file(tmp_path):
+    input_path = tmp_path / 'all_thresholded.by_genes.txt'
+    input_path.write_text('Gene Symbol\tLocus ID\tCytoband\tS1\tS2\n'
+                          'BRAF\t673\t7q34\t0\t1\n'
+                          'TP53\t7157\t17p13.1\t-2\t\n'
+                          'GENE1\t-5\t1p36\t2\t-1\n')
+    output_path = tmp_path / 'data_cna_discrete.txt'
+    samples = transform_cna_file(input_path.as_posix(), output_path.as_posix(), value_dtype='Int8', chunk_size=2)
+    assert samples == ['S1', 'S2']
+    assert output_path.read_text() == ('Hugo_Symbol\tEntrez_Gene_Id\tS1\tS2\n'
+                                       'BRAF\t673\t0\t1\n'
+                                       'TP53\t7157\t-2\t\n'
+                                       'GENE1\t\t2\t-1\n')
+
+
+@pytest.mark.parametrize('compressed', [False, True])
+def test_transform_segment_file(tmp_path, compressed):
+    segments = ''.join('S1\t{}\t{}\t{}\t10\t0.5\n'.format(chromosome, start, start + 100)
+                       for chromosome in range(1, 23) for start in range(0, 10000, 100))
+    input_path = tmp_path / ('test.seg.gz' if compressed else 'test.seg')
+    content = ('Sample\tChromosome\tStart\tEnd\tNum_Probes\tSegment_Mean\n' + segments).encode()
+    if compressed:
+        with gzip.open(input_path, 'wb') as input_file:
+            input_file.write(content)
+    else:
+        input_path.write_bytes(content)
+    output_path = tmp_path / 'data_cna_segments.seg'
+    transform_segment_file(input_path.as_posix(), output_path.as_posix())
+    assert output_path.read_text() == SEGMENT_HEADER + segments
+
+
+def test_split_cna_file(tmp_path):
+    input_path = tmp_path / 'all_data_by_genes.txt'
+    input_path.write_text('Gene Symbol\tGene ID\tCytoband\tS1\tS2\tS3\n'
+                          'BRAF\t673\t7q34\t0.5\t1\t-1\n'
+                          'GENE1\t-5\t1p36\t2\t-1\t0\n')
+    output_paths = {study: (tmp_path / '{}.txt'.format(study)).as_posix() for study in ['A', 'B', 'C']}
+    samples = split_cna_file(input_path.as_posix(), output_paths, {'S1': ['A'], 'S2': ['A', 'B']},
+                             value_dtype='float32', chunk_size=1)
+    assert samples == {'A': ['S1', 'S2'], 'B': ['S2'], 'C': [], None: ['S3']}
+    assert (tmp_path / 'A.txt').read_text() == ('Hugo_Symbol\tEntrez_Gene_Id\tS1\tS2\n'
+                                                'BRAF\t673\t0.5\t1.0\n'
+                                                'GENE1\t\t2.0\t-1.0\n')
+    assert (tmp_path / 'B.txt').read_text() == ('Hugo_Symbol\tEntrez_Gene_Id\tS2\n'
+                                                'BRAF\t673\t1.0\n'
+                                                'GENE1\t\t-1.0\n')
+    assert not (tmp_path / 'C.txt').exists()
+
+
+def test_split_segment_file(tmp_path):
+    input_path = tmp_path / 'segments.seg'
+    input_path.write_text('ID\tchrom\tstart\tend\tmarkers\tmean\n'
+                          'S1\t1\t100\t200\t10\t0.5\n'
+                          'S2\t1\t100\t200\t10\t0.1\n'
+                          'S1\t2\t100\t200\t10\t0.2\n')
+    output_paths = {study: (tmp_path / '{}.seg'.format(study)).as_posix() for study in ['A', 'B']}
+    samples = split_segment_file(input_path.as_posix(), output_paths, {'S1': ['A']})
+    assert samples == {'A': ['S1'], 'B': [], None: ['S2']}
+    assert (tmp_path / 'A.seg').read_text() == (SEGMENT_HEADER +
+                                                'S1\t1\t100\t200\t10\t0.5\n'
+                                                'S1\t2\t100\t200\t10\t0.2\n')
+    assert not (tmp_path / 'B.seg').exists()
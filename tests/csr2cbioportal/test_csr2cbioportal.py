@@ -3,10 +3,17 @@
 
 """Tests for the csr2cbioportal application.
 """
+import json
+import os
+import shutil
 from os import path
 
+import pytest
+
 from click.testing import CliRunner
 
+from csr.exceptions import CsrException
+from csr.instrumentation import run_report
 from csr2cbioportal import csr2cbioportal
 
 
@@ -64,3 +71,114 @@ def test_transformation_without_ngs(tmp_path):
     assert not path.exists(output_path + '/meta_cna_segments.txt')
     assert not path.exists(output_path + '/data_mutations.maf')
     assert not path.exists(output_path + '/meta_mutations.txt')
+
+
+def test_transformation_in_main_process(tmp_path):
+    outputs = {}
+    for workers in ['1', '4']:
+        output_path = (tmp_path / workers).as_posix()
+        runner = CliRunner()
+        result = runner.invoke(csr2cbioportal.run, [
+            './test_data/input_data/CSR2CBIOPORTAL_TEST_DATA',
+            '--ngs-dir',
+            './test_data/input_data/CSR2CBIOPORTAL_TEST_DATA/NGS',
+            '--workers', workers,
+            output_path
+        ])
+        assert result.exit_code == 0
+        outputs[workers] = {}
+        for data_file in ['data_clinical_sample.txt', 'data_cna_continuous.txt', 'data_mutations.maf']:
+            with open(path.join(output_path, data_file)) as f:
+                outputs[workers][data_file] = f.read()
+    assert outputs['1'] == outputs['4']
+
+
+def test_transformation_per_study(tmp_path):
+    output_path = tmp_path.as_posix() + '/data'
+    runner = CliRunner()
+    result = runner.invoke(csr2cbioportal.run, [
+        './test_data/input_data/CSR2CBIOPORTAL_TEST_DATA',
+        '--ngs-dir',
+        './test_data/input_data/CSR2CBIOPORTAL_TEST_DATA/NGS',
+        '--per-study',
+        output_path
+    ])
+    assert result.exit_code == 0
+
+    samples = {'study1': ['PMCBS000AAA_PMCBM000AAA'],
+               'study2': ['PMCBS000AAB_PMCBM000AAB', 'PMCBS000AAB_PMCBM000AAC', 'PMCBS000AAD_PMCBM000AAD']}
+    for study_id, study_samples in samples.items():
+        study_path = path.join(output_path, study_id)
+        with open(path.join(study_path, 'meta_study.txt')) as f:
+            assert 'cancer_study_identifier: {}\n'.format(study_id) in f.read()
+        with open(path.join(study_path, 'data_clinical_sample.txt')) as f:
+            assert [line.split('\t')[-1].strip() for line in f if not line.startswith('#')][1:] == study_samples
+        with open(path.join(study_path, 'data_cna_continuous.txt')) as f:
+            assert f.readline().strip().split('\t')[2:] == study_samples[:1]
+        with open(path.join(study_path, 'data_mutations.maf')) as f:
+            header = f.readline().split('\t')
+            mutation_samples = {line.split('\t')[header.index('Tumor_Sample_Barcode')] for line in f}
+        assert mutation_samples == set(study_samples[:1])
+    with open(path.join(output_path, 'study1', 'meta_study.txt')) as f:
+        assert 'name: Study 1\n' in f.read()
+
+
+def test_per_study_not_incremental(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(csr2cbioportal.run, [
+        './test_data/input_data/CSR2CBIOPORTAL_TEST_DATA',
+        '--per-study',
+        '--incremental',
+        tmp_path.as_posix()
+    ])
+    assert result.exit_code != 0
+
+
+def test_maf_columns_without_required_columns(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(csr2cbioportal.run, [
+        './test_data/input_data/CSR2CBIOPORTAL_TEST_DATA',
+        '--maf-columns', 'Hugo_Symbol,Variant_Classification',
+        tmp_path.as_posix()
+    ])
+    assert result.exit_code == 2
+    assert 'Tumor_Sample_Barcode' in result.output
+
+
+def test_library_raises_exception_for_missing_input(tmp_path):
+    with pytest.raises(CsrException) as excinfo:
+        csr2cbioportal.csr2cbioportal((tmp_path / 'missing').as_posix(), None, (tmp_path / 'output').as_posix())
+    assert 'Input directory not found' in str(excinfo.value)
+
+
+def test_library_raises_exception_for_unknown_samples(tmp_path):
+    with pytest.raises(CsrException) as excinfo:
+        csr2cbioportal.csr2cbioportal('./test_data/input_data/CSR2TRANSMART_TEST_DATA',
+                                      './test_data/input_data/CSR2CBIOPORTAL_TEST_DATA/NGS', tmp_path.as_posix(),
+                                      workers=1)
+    assert 'Found samples in MAF files that are not in clinical data' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('per_study', [False, True])
+def test_mutation_jobs_share_workers(tmp_path, monkeypatch, per_study):
+    ngs_dir = (tmp_path / 'NGS').as_posix()
+    shutil.copytree('./test_data/input_data/CSR2CBIOPORTAL_TEST_DATA/NGS', ngs_dir)
+    shutil.copy(path.join(ngs_dir, 'pmc_test_WGS.maf.gz'), path.join(ngs_dir, 'pmc_test_WGS_copy.maf.gz'))
+    # The MAF files are read by jobs on the workers of the stage scheduler, not by a pool of their own
+    monkeypatch.setattr(csr2cbioportal, 'ProcessPoolExecutor', None)
+    output_path = (tmp_path / 'data').as_posix()
+    report_path = (tmp_path / 'run.json').as_posix()
+    with run_report(report_path, 'test'):
+        csr2cbioportal.csr2cbioportal('./test_data/input_data/CSR2CBIOPORTAL_TEST_DATA', ngs_dir, output_path,
+                                      workers=2, per_study=per_study)
+    with open(report_path) as report_file:
+        stages = json.load(report_file)['stages']
+    # The files are split in the workers, the parts are combined in the main process
+    assert [stage['pid'] for stage in stages if stage['name'] == 'split_maf'] == [os.getpid()]
+    split_pids = [stage['pid'] for stage in stages if stage['name'] == 'split_maf_file']
+    assert len(split_pids) == 2 and os.getpid() not in split_pids
+
+    maf_path = path.join(output_path, 'study2' if per_study else '', 'data_mutations.maf')
+    with open(maf_path) as f:
+        rows = f.readlines()[1:]
+    assert len(rows) == 2 * len(set(rows))
@@ -3,9 +3,15 @@
 
 """Tests for the csr2transmart application.
 """
+import shutil
+
+import pytest
 from click.testing import CliRunner
 from os import path
 
+from csr.exceptions import CsrException
+from csr.study_registry_reader import StudyRegistryReader
+from csr.subject_registry_reader import SubjectRegistryReader
 from csr2transmart import csr2transmart
 
 
@@ -28,3 +34,74 @@ def test_transformation(tmp_path):
     assert path.exists(output_path + '/i2b2demodata/visit_dimension.tsv')
     assert path.exists(output_path + '/i2b2demodata/study.tsv')
     assert path.exists(output_path + '/i2b2metadata/dimension_description.tsv')
+
+
+def test_transformation_per_study(tmp_path):
+    output_path = tmp_path.as_posix() + '/data'
+    runner = CliRunner()
+    result = runner.invoke(csr2transmart.run, [
+        './test_data/input_data/CSR2TRANSMART_TEST_DATA',
+        output_path,
+        './test_data/input_data/config',
+        '--per-study'
+    ])
+    assert result.exit_code == 0
+
+    with open(output_path + '/i2b2demodata/study.tsv') as study_file:
+        study_ids = [line.split('\t')[1] for line in study_file][1:]
+    assert study_ids == ['STUDY1', 'STUDY2']
+
+
+def test_library_with_loaded_data(tmp_path):
+    input_dir = './test_data/input_data/CSR2TRANSMART_TEST_DATA'
+    ontology_config = csr2transmart.read_configuration('./test_data/input_data/config')
+    subject_registry = SubjectRegistryReader(input_dir).read_subject_registry()
+    study_registry = StudyRegistryReader(input_dir).read_study_registry()
+    collections = [csr2transmart.csr2transmart(None, (tmp_path / name).as_posix(), None, 'CSR',
+                                               csr2transmart.TOP_TREE_NODE, ontology_config=ontology_config,
+                                               subject_registry=subject_registry, study_registry=study_registry)
+                   for name in ['first', 'second']]
+    assert [len(c.dimensions) for c in collections] == [5, 5]
+    assert [len(list(c.patients)) for c in collections] == [2, 2]
+    assert len(collections[0].observations) == len(collections[1].observations)
+    with open(tmp_path / 'first' / 'i2b2demodata' / 'observation_fact.tsv') as first, \
+            open(tmp_path / 'second' / 'i2b2demodata' / 'observation_fact.tsv') as second:
+        assert first.read() == second.read()
+
+
+def test_library_raises_exception(tmp_path):
+    with pytest.raises(CsrException):
+        csr2transmart.csr2transmart('./test_data/input_data/CSR2TRANSMART_TEST_DATA', tmp_path.as_posix(),
+                                    './test_data/input_data', 'CSR', csr2transmart.TOP_TREE_NODE)
+
+
+@pytest.mark.parametrize('config_dir', [
+    './test_data/input_data/config/invalid_ontology_config/duplicate_nodes',
+    './test_data/input_data/config/invalid_ontology_config/ontology_config_invalid_entity_name',
+])
+def test_library_raises_exception_for_invalid_config(tmp_path, config_dir):
+    with pytest.raises(CsrException) as excinfo:
+        csr2transmart.csr2transmart('./test_data/input_data/CSR2TRANSMART_TEST_DATA', tmp_path.as_posix(),
+                                    config_dir, 'CSR', csr2transmart.TOP_TREE_NODE)
+    assert 'Invalid ontology config file' in str(excinfo.value)
+
+
+def test_library_raises_exception_for_missing_input(tmp_path):
+    with pytest.raises(CsrException) as excinfo:
+        csr2transmart.csr2transmart((tmp_path / 'missing').as_posix(), (tmp_path / 'output').as_posix(),
+                                    './test_data/input_data/config', 'CSR', csr2transmart.TOP_TREE_NODE)
+    assert 'File not found' in str(excinfo.value)
+
+
+def test_library_raises_exception_for_invalid_reference(tmp_path):
+    input_dir = tmp_path / 'csr'
+    shutil.copytree('./test_data/input_data/CSR2TRANSMART_TEST_DATA', input_dir)
+    biomaterial_path = input_dir / 'biomaterial.tsv'
+    header, first, *rows = biomaterial_path.read_text().split('\n')
+    fields = first.split('\t')
+    fields[1] = 'MISSING'
+    biomaterial_path.write_text('\n'.join([header, '\t'.join(fields)] + rows))
+    with pytest.raises(CsrException) as excinfo:
+        csr2transmart.csr2transmart(input_dir.as_posix(), (tmp_path / 'output').as_posix(),
+                                    './test_data/input_data/config', 'CSR', csr2transmart.TOP_TREE_NODE)
+    assert 'non-existing Biosource with id MISSING' in str(excinfo.value)
@@ -204,3 +204,21 @@ def test_observations_mapping(mapped_data_collection):
 
     assert len(observations) == len(patient_observations) + len(diagnosis_observations) + len(
         biosource_observations) + len(biomaterial_observations) + len(study_observations) + len(radiology_observations)
+
+
+def test_multiple_studies_mapping(mapped_data_collection, mapped_studies_data_collection):
+    studies = mapped_studies_data_collection.studies
+    assert [s.study_id for s in studies] == ['STUDY1', 'STUDY2']
+    assert [s.name for s in studies] == ['Study 1', 'Study 2']
+    trial_visits = mapped_studies_data_collection.trial_visits
+    assert [t.study for t in trial_visits] == studies
+    assert [t.rel_time_label for t in trial_visits] == ['GENERAL', 'GENERAL']
+    # Patients and concepts are shared by the studies
+    assert [p.identifier for p in mapped_studies_data_collection.patients] == ['P1', 'P2']
+    assert len(mapped_studies_data_collection.concepts) == len(mapped_data_collection.concepts)
+
+    # Every individual is linked to a single study, so all observations are mapped once
+    observations = mapped_studies_data_collection.observations
+    assert len(observations) == len(mapped_data_collection.observations)
+    patient_study = {'P1': 'STUDY1', 'P2': 'STUDY2'}
+    assert all(o.trial_visit.study.study_id == patient_study[o.patient.identifier] for o in observations)
@@ -1,5 +1,4 @@
 import pytest
-from pydantic import ValidationError
 from transmart_loader.transmart import ConceptNode, ValueType
 
 from csr.exceptions import DataException
@@ -36,7 +35,7 @@ def test_non_root_top_node():
 
 
 def test_ontology_config_invalid_entity_field():
-    with pytest.raises(ValidationError) as excinfo:
+    with pytest.raises(DataException) as excinfo:
         ontology_config = read_configuration(
             './test_data/input_data/config/invalid_ontology_config/ontology_config_invalid_entity_field')
         OntologyMapper('test').map(ontology_config.nodes)
@@ -45,7 +44,7 @@ def test_ontology_config_invalid_entity_field():
 
 
 def test_ontology_config_invalid_entity_name():
-    with pytest.raises(ValidationError) as excinfo:
+    with pytest.raises(DataException) as excinfo:
         ontology_config = read_configuration(
             './test_data/input_data/config/invalid_ontology_config/ontology_config_invalid_entity_name')
         OntologyMapper('test').map(ontology_config.nodes)
@@ -54,7 +53,7 @@ def test_ontology_config_invalid_entity_name():
 
 
 def test_ontology_config_invalid_concept_code():
-    with pytest.raises(ValidationError) as excinfo:
+    with pytest.raises(DataException) as excinfo:
         ontology_config = read_configuration(
             './test_data/input_data/config/invalid_ontology_config/ontology_config_invalid_concept_code')
         OntologyMapper('test').map(ontology_config.nodes)
@@ -63,7 +62,7 @@ def test_ontology_config_invalid_concept_code():
 
 
 def test_ontology_config_mutually_exclusive_properties():
-    with pytest.raises(ValidationError) as excinfo:
+    with pytest.raises(DataException) as excinfo:
         ontology_config = read_configuration(
             './test_data/input_data/config/invalid_ontology_config/mutually_exclusive_properties')
         OntologyMapper('test').map(ontology_config.nodes)
@@ -71,7 +70,7 @@ def test_ontology_config_mutually_exclusive_properties():
 
 
 def test_ontology_config_neither_children_nor_concept_code():
-    with pytest.raises(ValidationError) as excinfo:
+    with pytest.raises(DataException) as excinfo:
         ontology_config = read_configuration(
             './test_data/input_data/config/invalid_ontology_config/neither_children_nor_concept_code')
         OntologyMapper('test').map(ontology_config.nodes)
@@ -79,7 +78,7 @@ def test_ontology_config_neither_children_nor_concept_code():
 
 
 def test_duplicate_child_names_rejected():
-    with pytest.raises(ValidationError) as excinfo:
+    with pytest.raises(DataException) as excinfo:
         ontology_config = read_configuration(
             './test_data/input_data/config/invalid_ontology_config/duplicate_children')
         OntologyMapper('test').map(ontology_config.nodes)
@@ -87,7 +86,7 @@ def test_duplicate_child_names_rejected():
 
 
 def test_duplicate_top_node_names_rejected():
-    with pytest.raises(ValidationError) as excinfo:
+    with pytest.raises(DataException) as excinfo:
         ontology_config = read_configuration(
             './test_data/input_data/config/invalid_ontology_config/duplicate_nodes')
         OntologyMapper('test').map(ontology_config.nodes)
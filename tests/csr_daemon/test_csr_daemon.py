@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the csr_daemon application.
+"""
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from os import path
+
+from csr_daemon import csr_daemon
+
+
+def request(request_id, method, **params):
+    return json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}) + '\n'
+
+
+def exit_job(**params):
+    os._exit(1)
+
+
+def test_file_cache(tmp_path):
+    file_path = tmp_path / 'data.txt'
+    file_path.write_text('first')
+    cache = csr_daemon.FileCache()
+    assert cache.get(str(file_path), file_path.read_text) == 'first'
+    assert cache.get(str(file_path), lambda: 'not loaded') == 'first'
+    file_path.write_text('second version')
+    assert cache.get(str(file_path), file_path.read_text) == 'second version'
+
+
+def test_serve_jobs(tmp_path):
+    output_path = tmp_path.as_posix()
+    requests = io.StringIO(
+        request(1, 'sources2csr', input_dir='./test_data/input_data/CLINICAL', output_dir=output_path + '/csr',
+                config_dir='./test_data/input_data/config') +
+        request(2, 'csr2transmart', input_dir='./test_data/input_data/CSR2TRANSMART_TEST_DATA',
+                output_dir=output_path + '/transmart', config_dir='./test_data/input_data/config') +
+        request(3, 'sources2csr', input_dir='./test_data/input_data/CLINICAL', output_dir=output_path + '/invalid',
+                config_dir='./test_data/input_data/config/invalid_sources_config/empty_identifier') +
+        request(4, 'csr2cbioportal', output_dir=output_path + '/cbioportal') +
+        request(5, 'unknown') +
+        'not json\n' +
+        request(6, 'ping'))
+    output = io.StringIO()
+    daemon = csr_daemon.Daemon(workers=2)
+    try:
+        csr_daemon.serve_lines(daemon, requests, output)
+    finally:
+        daemon.close()
+    responses = {response['id']: response for response in map(json.loads, output.getvalue().splitlines())}
+
+    assert responses[1]['result']['wall_time'] >= 0
+    assert responses[1]['result']['peak_rss'] > 0
+    assert path.exists(output_path + '/csr/individual.tsv')
+    assert 'result' in responses[2]
+    assert path.exists(output_path + '/transmart/i2b2demodata/observation_fact.tsv')
+    assert responses[3]['error']['code'] == csr_daemon.JOB_FAILED
+    assert responses[3]['error']['data']['type'] == 'DataException'
+    assert responses[4]['error']['code'] == csr_daemon.INVALID_PARAMS
+    assert responses[5]['error']['code'] == csr_daemon.METHOD_NOT_FOUND
+    assert responses[None]['error']['code'] == csr_daemon.PARSE_ERROR
+    assert responses[6]['result'] == 'pong'
+
+
+def test_concurrency_limit(tmp_path):
+    responses = []
+    daemon = csr_daemon.Daemon(workers=1, max_queued=0)
+    try:
+        for request_id in [1, 2]:
+            daemon.handle(request(request_id, 'csr2transmart',
+                                  input_dir='./test_data/input_data/CSR2TRANSMART_TEST_DATA',
+                                  output_dir=(tmp_path / str(request_id)).as_posix(),
+                                  config_dir='./test_data/input_data/config'),
+                          responses.append)
+    finally:
+        daemon.close()
+    assert responses[0]['id'] == 2
+    assert responses[0]['error']['code'] == csr_daemon.SERVER_BUSY
+    assert responses[1]['id'] == 1
+    assert 'result' in responses[1]
+    assert daemon.status()['completed'] == 1
+
+
+def test_worker_died(tmp_path, monkeypatch):
+    responses = []
+    daemon = csr_daemon.Daemon(workers=1)
+    try:
+        # Worker processes are forked when jobs are submitted, and see the replaced job
+        monkeypatch.setitem(csr_daemon.JOBS, 'sources2csr', exit_job)
+        daemon.handle(request(1, 'sources2csr'), responses.append)
+        monkeypatch.undo()
+        deadline = time.time() + 60
+        while not responses and time.time() < deadline:
+            time.sleep(0.05)
+        assert responses[0]['error']['code'] == csr_daemon.JOB_FAILED
+        assert responses[0]['error']['data']['type'] == 'BrokenProcessPool'
+
+        daemon.handle(request(2, 'csr2transmart', input_dir='./test_data/input_data/CSR2TRANSMART_TEST_DATA',
+                              output_dir=tmp_path.as_posix(), config_dir='./test_data/input_data/config'),
+                      responses.append).result()
+    finally:
+        daemon.close()
+    assert responses[1]['id'] == 2
+    assert 'result' in responses[1]
+    assert daemon.status() == {'workers': 1, 'running': 0, 'queued': 0, 'completed': 1, 'failed': 1}
+
+
+def test_warm_workers():
+    # Workers forked from the test process have the modules already, run init_worker in a new interpreter
+    result = subprocess.run([sys.executable, '-c', 'import sys\n'
+                             'from csr_daemon.csr_daemon import init_worker, WORKER_MODULES\n'
+                             'init_worker(False)\n'
+                             'print(" ".join(module for module in WORKER_MODULES if module not in sys.modules))'],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
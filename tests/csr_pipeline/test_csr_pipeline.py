@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the combined csr_pipeline application.
+"""
+import filecmp
+from os import path
+
+from click.testing import CliRunner
+
+from csr_pipeline import csr_pipeline
+from sources2csr import sources2csr
+
+
+def test_pipeline(tmp_path):
+    output_path = tmp_path.as_posix()
+    runner = CliRunner()
+    result = runner.invoke(csr_pipeline.run, [
+        './test_data/input_data/CLINICAL',
+        './test_data/input_data/config',
+        '--csr-dir', output_path + '/csr',
+        '--transmart-dir', output_path + '/transmart',
+        '--cbioportal-dir', output_path + '/cbioportal'
+    ])
+    assert result.exit_code == 0
+
+    assert path.exists(output_path + '/transmart/i2b2demodata/observation_fact.tsv')
+    assert path.exists(output_path + '/transmart/i2b2demodata/study.tsv')
+    assert path.exists(output_path + '/cbioportal/data_clinical_patient.txt')
+    assert path.exists(output_path + '/cbioportal/data_clinical_sample.txt')
+    assert path.exists(output_path + '/cbioportal/meta_study.txt')
+
+    # The CSR files are the same as the files written by sources2csr
+    result = runner.invoke(sources2csr.run, [
+        './test_data/input_data/CLINICAL',
+        output_path + '/sources2csr',
+        './test_data/input_data/config'
+    ])
+    assert result.exit_code == 0
+    for csr_file in ['individual.tsv', 'biomaterial.tsv', 'study.tsv', 'individual_study.tsv']:
+        assert filecmp.cmp(path.join(output_path, 'csr', csr_file), path.join(output_path, 'sources2csr', csr_file),
+                           shallow=False)
+
+
+def test_pipeline_without_outputs(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(csr_pipeline.run, [
+        './test_data/input_data/CLINICAL',
+        './test_data/input_data/config'
+    ])
+    assert result.exit_code != 0
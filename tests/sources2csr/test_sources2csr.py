@@ -3,12 +3,13 @@
 
 """Tests for the sources2csr application.
 """
+import json
+
 import pytest
 from click.testing import CliRunner
 from os import path
-from pydantic import ValidationError
 
-from csr.exceptions import DataException, ReaderException
+from csr.exceptions import CsrException, DataException, ReaderException
 from csr.tabular_file_reader import TabularFileReader
 from sources2csr import sources2csr
 from sources2csr.sources_reader import SourcesReader
@@ -137,7 +138,7 @@ def test_invalid_date():
 
 
 def test_duplicate_attributes():
-    with pytest.raises(ValidationError) as excinfo:
+    with pytest.raises(DataException) as excinfo:
         SourcesReader(
             input_dir='./test_data/input_data/CLINICAL',
             config_dir='./test_data/input_data/config/invalid_sources_config/duplicate_attributes')
@@ -219,3 +220,66 @@ def test_biomaterial_biosource_mismatch():
     with pytest.raises(DataException) as excinfo:
         reader.read_subject_data()
     assert '' in str(excinfo.value)
+
+
+def test_library_raises_exception(tmp_path):
+    with pytest.raises(DataException) as excinfo:
+        sources2csr.sources2csr(
+            './test_data/input_data/CLINICAL',
+            tmp_path.as_posix(),
+            './test_data/input_data/config/invalid_sources_config/empty_identifier')
+    assert 'Empty identifier' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('config_dir, message', [
+    ('./test_data/input_data/config/invalid_sources_config/duplicate_attributes', 'Invalid source config file'),
+    ('./test_data/input_data/config/invalid_sources_config/biosource_derived_from_self',
+     'Biosource cannot be derived from itself'),
+])
+def test_library_raises_exception_for_invalid_config(tmp_path, config_dir, message):
+    with pytest.raises(CsrException) as excinfo:
+        sources2csr.sources2csr('./test_data/input_data/CLINICAL', tmp_path.as_posix(), config_dir)
+    assert message in str(excinfo.value)
+
+
+def test_library_raises_exception_for_missing_input(tmp_path):
+    with pytest.raises(CsrException) as excinfo:
+        sources2csr.sources2csr((tmp_path / 'missing').as_posix(), (tmp_path / 'output').as_posix(),
+                                './test_data/input_data/config')
+    assert 'File not found' in str(excinfo.value)
+
+
+def test_run_report(tmp_path):
+    target_path = tmp_path.as_posix()
+    runner = CliRunner()
+    result = runner.invoke(sources2csr.run, [
+        './test_data/input_data/CLINICAL',
+        target_path + '/csr',
+        './test_data/input_data/config',
+        '--report', target_path + '/run.json'
+    ])
+    assert result.exit_code == 0
+    with open(target_path + '/run.json') as report_file:
+        report = json.load(report_file)
+    assert report['command'] == 'sources2csr'
+    assert report['status'] == 'completed'
+    stages = {stage['name']: stage for stage in report['stages']}
+    assert stages['read_entity_data.Individual']['rows_out'] == 9
+    assert stages['add_derived_values']['rows_in'] == stages['add_derived_values']['rows_out']
+    assert 'write_registries' in stages
+
+
+def test_profile(tmp_path):
+    target_path = tmp_path.as_posix()
+    runner = CliRunner()
+    result = runner.invoke(sources2csr.run, [
+        './test_data/input_data/CLINICAL',
+        target_path + '/csr',
+        './test_data/input_data/config',
+        '--profile', 'tracemalloc',
+        '--profile-dir', target_path + '/profile'
+    ])
+    assert result.exit_code == 0
+    snapshots = [path.name for path in (tmp_path / 'profile').glob('sources2csr_*.tracemalloc')]
+    assert any(name.endswith('_add_derived_values_end.tracemalloc') for name in snapshots)
+    assert (tmp_path / 'profile' / 'sources2csr_tracemalloc_top.txt').exists()
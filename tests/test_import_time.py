@@ -0,0 +1,31 @@
+""" Startup import tests: check which modules the commands import, not how long the imports take """
+import subprocess
+import sys
+from typing import Set
+
+import pytest
+
+# Modules that are only needed when data is transformed, not for starting a command
+HEAVY_MODULES = ['pandas', 'numpy', 'transmart_loader.transmart', 'yaml']
+
+
+def get_imported_modules(module: str) -> Set[str]:
+    """Import a module in a new interpreter
+    :return: the names of all modules loaded by the import
+    """
+    result = subprocess.run([sys.executable, '-c', f'import sys, {module}; print("\\n".join(sys.modules))'],
+                            capture_output=True, text=True, check=True)
+    return set(result.stdout.splitlines())
+
+
+@pytest.mark.parametrize('module', [
+    'sources2csr.sources2csr',
+    'csr2transmart.csr2transmart',
+    'csr2cbioportal.csr2cbioportal',
+    'csr_pipeline.csr_pipeline',
+    'csr_daemon.csr_daemon',
+])
+def test_startup_imports(module):
+    imported_modules = get_imported_modules(module)
+    assert module in imported_modules
+    assert [heavy for heavy in HEAVY_MODULES if heavy in imported_modules] == []
@@ -12,6 +12,8 @@ def test_pep8_conformance():
         'csr2transmart',
         'sources2csr',
         'csr2cbioportal',
+        'csr_pipeline',
+        'csr_daemon',
         'tests',
     ]
     exclude_paths = []